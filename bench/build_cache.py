@@ -0,0 +1,201 @@
+"""Content-addressed cache of compiled models.
+
+An entry is keyed by the hash of everything the build depends on: the model symbol, a digest of the
+params, the input shapes, target, opt_level, the sources of the schedule package registered for the
+build and the TVM version. It holds the graph json, the exported library and the params the build
+returned (already transformed / pre-packed), so a hit skips nnvm.compiler.build entirely. Updated
+raw weights change the params digest: the lookup misses and the rebuild repacks them. Benchmark
+models are also looked up by name, batch size, model files and build options (cached_model_build), a
+hit then skips loading the model and mxnet as well.
+
+Entries are directories published with an atomic rename, processes sharing a cache (e.g. a fleet
+restarting on one host) never see half-written entries. Least recently used entries are evicted
+once the cache grows over its size limit.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import nnvm
+import nnvm.compiler
+import tvm
+
+from .memory_report import memory_report
+from .models import ROOT, get_model, import_schedule, model_files
+
+CACHE_DIR = os.environ.get('TOPI_BUILD_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'topi-intel', 'builds'))
+MAX_BYTES = int(os.environ.get('TOPI_BUILD_CACHE_BYTES', 8 << 30))
+
+_FILES = ('graph.json', 'deploy.so', 'deploy.params')
+
+
+def schedule_version(path):
+    """Digest of the sources of a schedule package directory, 'default' for TVM's own schedules"""
+    if path == 'default':
+        return path
+    path = os.path.abspath(os.path.join(ROOT, path))
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        if name.endswith('.py'):
+            with open(os.path.join(path, name), 'rb') as fn:
+                digest.update(name.encode() + fn.read())
+    return digest.hexdigest()
+
+
+def params_digest(params):
+    digest = hashlib.sha256()
+    for name in sorted(params):
+        value = params[name].asnumpy()
+        digest.update(('%s%s%s' % (name, value.shape, value.dtype)).encode())
+        digest.update(value.tobytes())
+    return digest.hexdigest()
+
+
+def build_key(net, params, shape, target, opt_level, schedule):
+    key = {
+        'symbol': hashlib.sha256(nnvm.graph.create(net).json().encode()).hexdigest(),
+        'params': params_digest(params),
+        'shape': sorted((k, list(v)) for k, v in shape.items()),
+        'target': str(target),
+        'opt_level': opt_level,
+        'schedule': schedule_version(schedule),
+        'tvm': getattr(tvm, '__version__', ''),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def _entry_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if os.path.isdir(path) and not name.startswith('.'):
+            entries.append((os.path.getmtime(path), _entry_bytes(path), path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def load(key, cache_dir=CACHE_DIR):
+    """(graph, lib, params) of a cached build, None on a miss"""
+    path = os.path.join(cache_dir, key)
+    if not all(os.path.exists(os.path.join(path, name)) for name in _FILES):
+        return None
+    # the directory mtime is the LRU clock
+    os.utime(path, None)
+    with open(os.path.join(path, 'graph.json')) as fn:
+        graph = nnvm.graph.load_json(fn.read())
+    lib = tvm.module.load(os.path.join(path, 'deploy.so'))
+    with open(os.path.join(path, 'deploy.params'), 'rb') as fn:
+        params = nnvm.compiler.load_param_dict(bytearray(fn.read()))
+    return graph, lib, params
+
+
+def save_artifact(path, graph, lib, params):
+    """graph.json, deploy.so and deploy.params of a build in directory path, the layout deploy.Predictor loads,
+    plus its memory.json report"""
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    with open(os.path.join(path, 'graph.json'), 'w') as fn:
+        fn.write(graph.json())
+    with open(os.path.join(path, 'memory.json'), 'w') as fn:
+        json.dump(memory_report(json.loads(graph.json())), fn, indent=2)
+    lib.export_library(os.path.join(path, 'deploy.so'))
+    with open(os.path.join(path, 'deploy.params'), 'wb') as fn:
+        fn.write(nnvm.compiler.save_param_dict(params))
+
+
+def store(key, graph, lib, params, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    tmp = tempfile.mkdtemp(prefix='.%s.' % key, dir=cache_dir)
+    save_artifact(tmp, graph, lib, params)
+    try:
+        os.rename(tmp, os.path.join(cache_dir, key))
+    except OSError:
+        # another process published the same build first
+        shutil.rmtree(tmp, ignore_errors=True)
+    evict(cache_dir, max_bytes)
+
+
+def _build(key, net, target, shape, params, opt_level, cache_dir):
+    hit = load(key, cache_dir)
+    if hit is not None:
+        return hit
+    with nnvm.compiler.build_config(opt_level=opt_level):
+        graph, lib, params = nnvm.compiler.build(net, target, shape=shape, params=params)
+    store(key, graph, lib, params, cache_dir)
+    return graph, lib, params
+
+
+def cached_build(net, target, shape, params, opt_level, schedule, cache_dir=CACHE_DIR):
+    """nnvm.compiler.build through the cache, schedule is the schedule package directory registered
+    for the build (see models.import_schedule)"""
+    return _build(build_key(net, params, shape, target, opt_level, schedule), net, target, shape, params,
+                  opt_level, cache_dir)
+
+
+def model_key(name, batch_size, target, opt_level, schedule):
+    """Key of a benchmark model's build that needs no model loaded: the model name, the files it is
+    loaded from and the build options"""
+    key = {
+        'model': name,
+        'batch_size': batch_size,
+        'files': model_files(name),
+        'target': str(target),
+        'opt_level': opt_level,
+        'schedule': schedule_version(schedule),
+        'tvm': getattr(tvm, '__version__', ''),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def cached_model_build(name, batch_size, target, opt_level, schedule, cache_dir=CACHE_DIR):
+    """cached_build of a benchmark model (see models.get_model). The model key of a previous build points to
+    its entry, so a hit loads neither mxnet nor the model."""
+    # under a dot directory, which evict leaves alone
+    alias = os.path.join(cache_dir, '.models', model_key(name, batch_size, target, opt_level, schedule))
+    if os.path.exists(alias):
+        with open(alias) as fn:
+            hit = load(fn.read().strip(), cache_dir)
+        if hit is not None:
+            return hit
+    model = get_model(name, batch_size)
+    shape = {'data': model.data_shape}
+    key = build_key(model.net, model.params, shape, target, opt_level, schedule)
+    built = _build(key, model.net, target, shape, model.params, opt_level, cache_dir)
+    if not os.path.isdir(os.path.dirname(alias)):
+        os.makedirs(os.path.dirname(alias))
+    with open(alias + '.tmp', 'w') as fn:
+        fn.write(key)
+    os.rename(alias + '.tmp', alias)
+    return built
+
+
+if __name__ == "__main__":
+    # python -m bench.build_cache --model resnet50_v1 --out deploy/resnet50_v1
+    parser = argparse.ArgumentParser(description='build a model through the cache and export it for bench.deploy')
+    parser.add_argument('--model', default='resnet50_v1')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--schedule', default='ssd/schedule_pack')
+    parser.add_argument('--target', default='llvm -mcpu=skylake-avx512')
+    parser.add_argument('--opt-level', type=int, default=3)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    import_schedule(args.schedule)
+    model = get_model(args.model, args.batch_size)
+    graph, lib, params = cached_build(model.net, args.target, {'data': model.data_shape}, model.params,
+                                      args.opt_level, args.schedule)
+    save_artifact(args.out, graph, lib, params)
+    print('%s exported to %s' % (args.model, args.out))
@@ -0,0 +1,80 @@
+"""Benchmark matrix: models x thread counts x batch sizes, one schedule package and target.
+
+    python -m bench.cli --models resnet50_v1,ssd_resnet50 --threads 18,16,8,1 --batch-sizes 1 \
+        --schedule ssd/schedule_pack --out results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from .latency import format_stats, write_hgrm
+from .models import ROOT
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(',')]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', default='resnet50_v1', help='comma separated model names')
+    parser.add_argument('--threads', type=_int_list, default=[18], help='comma separated thread counts')
+    parser.add_argument('--batch-sizes', type=_int_list, default=[1])
+    parser.add_argument('--schedule', default='ssd/schedule_pack',
+                        help="schedule package directory relative to the repo, or 'default'")
+    parser.add_argument('--target', default='llvm -mcpu=skylake-avx512')
+    parser.add_argument('--opt-level', type=int, default=3)
+    parser.add_argument('--num-pass', type=int, default=500)
+    parser.add_argument('--mxnet', action='store_true', help='also measure the MXNet (MKL-DNN) model')
+    parser.add_argument('--no-build-cache', dest='build_cache', action='store_false',
+                        help='always compile, bypassing the build cache')
+    parser.add_argument('--cooldown', type=float, default=5, help='seconds between configurations')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--hgrm', help='directory for an HdrHistogram percentile file per configuration')
+    return parser.parse_args(argv)
+
+
+def run_matrix(args):
+    results = []
+    for model in args.models.split(','):
+        for batch_size in args.batch_sizes:
+            for num_threads in args.threads:
+                config = {'model': model, 'batch_size': batch_size, 'target': args.target,
+                          'schedule': args.schedule, 'opt_level': args.opt_level,
+                          'num_pass': args.num_pass, 'mxnet': args.mxnet, 'build_cache': args.build_cache}
+                env = dict(os.environ)
+                env['TVM_NUM_THREADS'] = env['OMP_NUM_THREADS'] = str(num_threads)
+                env['KMP_AFFINITY'] = 'granularity=fine,compact,1,0'
+                out = subprocess.check_output([sys.executable, '-m', 'bench.runner', json.dumps(config)],
+                                              env=env, cwd=ROOT, universal_newlines=True)
+                result = json.loads(out.strip().splitlines()[-1])
+                print('%s batch=%d threads=%d: %s' % (model, batch_size, num_threads, format_stats(result['tvm'])))
+                if args.hgrm:
+                    write_hgrm(result['tvm']['latency_ms'],
+                               os.path.join(args.hgrm, '%s_b%d_t%d.hgrm' % (model, batch_size, num_threads)))
+                results.append(result)
+                time.sleep(args.cooldown)
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.hgrm and not os.path.isdir(args.hgrm):
+        os.makedirs(args.hgrm)
+    results = run_matrix(args)
+    report = {
+        'host': {'node': platform.node(), 'processor': platform.processor(), 'python': platform.python_version()},
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'configs': results,
+    }
+    with open(args.out, 'w') as fn:
+        json.dump(report, fn, indent=2)
+    print('results written to %s' % args.out)
+
+
+if __name__ == "__main__":
+    main()
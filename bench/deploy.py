@@ -0,0 +1,105 @@
+"""Deploy-only loader of a prebuilt model (graph.json, deploy.so, deploy.params, see build_cache).
+
+Only the TVM runtime and the graph runtime are imported: no mxnet, no nnvm, no schedule package, the
+kernels are all in deploy.so already. Params are read by the graph runtime itself (load_params), the
+output shapes come from the graph json.
+
+    python -m bench.build_cache --model resnet50_v1 --out deploy/resnet50_v1
+    python -m bench.deploy deploy/resnet50_v1 --model resnet50_v1
+"""
+import time
+_IMPORT_START = time.time()
+
+import argparse
+import json
+import os
+import numpy as np
+import tvm
+from tvm.contrib import graph_runtime
+
+from .golden import check_outputs, golden_input, load_golden
+from .latency import format_stats, latency_stats, timer
+from .memory_report import peak_rss_bytes
+
+IMPORT_SECONDS = time.time() - _IMPORT_START
+
+
+class Predictor(object):
+    def __init__(self, path, ctx=None):
+        start = time.time()
+        self.path = path
+        self.ctx = ctx or tvm.cpu()
+        with open(os.path.join(path, 'graph.json')) as fn:
+            graph_json = fn.read()
+        lib = tvm.module.load(os.path.join(path, 'deploy.so'))
+        self.module = graph_runtime.create(graph_json, lib, self.ctx)
+        with open(os.path.join(path, 'deploy.params'), 'rb') as fn:
+            self.module.load_params(bytearray(fn.read()))
+
+        graph = json.loads(graph_json)
+        row_ptr = graph['node_row_ptr']
+        shapes = graph['attrs']['shape'][1]
+        dtypes = graph['attrs']['dltype'][1]
+        eids = [row_ptr[e[0]] + e[1] for e in graph['heads']]
+        self.outputs = [tvm.nd.empty(shapes[eid], dtypes[eid], self.ctx) for eid in eids]
+        self.load_seconds = time.time() - start
+        # seconds per run() call, input copy and output read back included
+        self.latencies = []
+
+    def run(self, data, input_name='data'):
+        """Outputs of the model for one input, as numpy arrays"""
+        start = timer()
+        self.module.set_input(input_name, tvm.nd.array(np.asarray(data), self.ctx))
+        self.module.run()
+        outputs = [self.module.get_output(i, out).asnumpy() for i, out in enumerate(self.outputs)]
+        self.latencies.append(timer() - start)
+        return outputs
+
+    def memory_report(self):
+        """Build-time memory report of the model (empty for builds exported without one), plus the
+        process peak RSS so far"""
+        report = {}
+        if os.path.exists(os.path.join(self.path, 'memory.json')):
+            with open(os.path.join(self.path, 'memory.json')) as fn:
+                report = json.load(fn)
+        report['peak_rss_bytes'] = peak_rss_bytes()
+        return report
+
+    def latency_stats(self, skip=0):
+        """Latency summary of the recorded runs, skipping the first skip (cold) ones"""
+        return latency_stats(self.latencies[skip:])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='load an exported build and report its startup, latency and memory')
+    parser.add_argument('path', help='exported build directory')
+    parser.add_argument('--model', help='check the outputs against the golden outputs of this model')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    predictor = Predictor(args.path)
+    with open(os.path.join(args.path, 'graph.json')) as fn:
+        graph = json.load(fn)
+    # the input is the arg node named data, the other arg nodes are params
+    data_nid = [nid for nid in graph['arg_nodes'] if graph['nodes'][nid]['name'] == 'data'][0]
+    data_eid = graph['node_row_ptr'][data_nid]
+    shape = graph['attrs']['shape'][1][data_eid]
+    golden = load_golden(args.model, shape, args.seed) if args.model else None
+    data = golden[0] if golden is not None else golden_input(shape, args.seed)
+    start = time.time()
+    outputs = predictor.run(data)
+    first_run = time.time() - start
+    if golden is not None:
+        check_outputs(outputs, golden[1])
+        print('outputs match the golden outputs of %s' % args.model)
+    elif args.model:
+        print('no golden outputs for %s %s seed %d, make them with python -m bench.golden' %
+              (args.model, shape, args.seed))
+    print('import %.3f s, load %.3f s, first run %.3f s, startup %.3f s' %
+          (IMPORT_SECONDS, predictor.load_seconds, first_run, IMPORT_SECONDS + predictor.load_seconds + first_run))
+    for _ in range(200):
+        predictor.run(data)
+    print('steady state: %s' % format_stats(predictor.latency_stats(skip=100)))
+    memory = predictor.memory_report()
+    print('peak RSS %.2f MB, %.2f MB estimated at build time' %
+          (memory['peak_rss_bytes'] / 1e6, memory.get('total_bytes', 0) / 1e6))
@@ -0,0 +1,61 @@
+"""Golden outputs for correctness checks.
+
+The MXNet outputs of a model for a seeded random input are computed once and stored as npz, keyed
+by (model, seed, input shape). Benchmarks then feed the stored input and compare against the stored
+outputs with numpy alone, no mxnet import, no model download, and the same input on every run.
+
+    python -m bench.golden --model resnet50_v1 --seed 0
+"""
+import argparse
+import os
+import numpy as np
+
+GOLDEN_DIR = os.environ.get('TOPI_GOLDEN_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'topi-intel', 'golden'))
+
+
+def golden_input(shape, seed=0):
+    return np.random.RandomState(seed).uniform(0, 255, size=shape).astype('float32')
+
+
+def golden_path(model, shape, seed=0, golden_dir=GOLDEN_DIR):
+    return os.path.join(golden_dir, '%s_seed%d_%s.npz' % (model, seed, 'x'.join(str(x) for x in shape)))
+
+
+def load_golden(model, shape, seed=0, golden_dir=GOLDEN_DIR):
+    """(input, [outputs]), None if no golden output was made for the key"""
+    path = golden_path(model, shape, seed, golden_dir)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as npz:
+        num = len([k for k in npz.files if k.startswith('output')])
+        return npz['data'], [npz['output%d' % i] for i in range(num)]
+
+
+def make_golden(model_name, batch_size, seed=0, golden_dir=GOLDEN_DIR):
+    # only making golden outputs needs mxnet, checking against them must not import it
+    from .models import get_model
+    model = get_model(model_name, batch_size)
+    data = golden_input(model.data_shape, seed)
+    outputs = model.mxnet_forward(data)
+    if not os.path.isdir(golden_dir):
+        os.makedirs(golden_dir)
+    path = golden_path(model_name, model.data_shape, seed, golden_dir)
+    arrays = dict(('output%d' % i, out) for i, out in enumerate(outputs))
+    np.savez(path, data=data, **arrays)
+    return path
+
+
+def check_outputs(outputs, golden, decimal=2):
+    assert len(outputs) >= len(golden), "%d outputs, %d golden outputs" % (len(outputs), len(golden))
+    for i, (out, ref) in enumerate(zip(outputs, golden)):
+        np.testing.assert_array_almost_equal(out, ref, decimal=decimal,
+                                             err_msg='output %d differs from the golden output' % i)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='compute and store the MXNet golden outputs of a model')
+    parser.add_argument('--model', default='resnet50_v1')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print('golden outputs written to %s' % make_golden(args.model, args.batch_size, args.seed))
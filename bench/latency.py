@@ -0,0 +1,115 @@
+"""Per-inference latency recording and reporting.
+
+Latencies are taken one run at a time with the highest resolution clock available (perf_counter on
+python 3) and summarized as percentiles, max, jitter and a log-scale histogram, the tail is where
+thread-pool wakeups, page faults and frequency changes show up. write_hgrm() exports the
+distribution in HdrHistogram's percentile format (.hgrm), which its plotter reads.
+"""
+import math
+import timeit
+import numpy as np
+
+timer = timeit.default_timer
+
+WARMUP_WINDOW = 10
+WARMUP_TOLERANCE = 0.02
+MAX_WARMUP = 500
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def time_run(run):
+    start = timer()
+    run()
+    return timer() - start
+
+
+def record(run, num_pass):
+    """Latencies in seconds of num_pass runs"""
+    return [time_run(run) for _ in range(num_pass)]
+
+
+def warmup(run, window=WARMUP_WINDOW, tolerance=WARMUP_TOLERANCE, max_runs=MAX_WARMUP):
+    """Run until the medians of two consecutive windows are within tolerance, returns the warmup latencies"""
+    latencies = []
+    previous = None
+    while len(latencies) < max_runs:
+        latencies.extend(record(run, window))
+        current = np.median(latencies[-window:])
+        if previous is not None and abs(current - previous) <= tolerance * previous:
+            break
+        previous = current
+    return latencies
+
+
+def steady(latencies, windows=4, tolerance=0.05):
+    """Whether the medians of the first and last of windows slices of a recording agree within tolerance,
+    a drift means the warmup was too short or the machine changed state (thermal, frequency) meanwhile"""
+    size = len(latencies) // windows
+    if size == 0:
+        return True
+    first, last = np.median(latencies[:size]), np.median(latencies[-size:])
+    return bool(abs(last - first) <= tolerance * first)
+
+
+def histogram(latencies_ms, buckets_per_octave=4):
+    """[(upper bound ms, count)], log-scale buckets from the minimum to the maximum latency"""
+    latencies_ms = np.asarray(latencies_ms)
+    lo = math.log(max(latencies_ms.min(), 1e-6), 2)
+    hi = math.log(max(latencies_ms.max(), 1e-6), 2)
+    num = max(1, int(math.ceil((hi - lo) * buckets_per_octave)))
+    edges = np.logspace(lo, lo + float(num) / buckets_per_octave, num + 1, base=2)
+    edges[-1] = max(edges[-1], latencies_ms.max())
+    counts, edges = np.histogram(latencies_ms, bins=edges)
+    return [(float(edge), int(count)) for edge, count in zip(edges[1:], counts)]
+
+
+def latency_stats(latencies):
+    """Summary of latencies in seconds, every value reported in ms"""
+    latencies = np.array(latencies) * 1000.0
+    stats = {
+        'latency_ms': [float(x) for x in latencies],
+        'mean': float(np.mean(latencies)),
+        'std': float(np.std(latencies)),
+        'min': float(np.min(latencies)),
+        'max': float(np.max(latencies)),
+        'steady': steady(latencies),
+        'histogram': histogram(latencies),
+    }
+    for p in PERCENTILES:
+        stats['p%g' % p] = float(np.percentile(latencies, p))
+    stats['median'] = stats['p50']
+    # spread of the tail over the typical run
+    stats['jitter'] = stats['p99'] - stats['p50']
+    return stats
+
+
+def format_stats(stats):
+    return 'mean %.3f ms, p50 %.3f, p90 %.3f, p99 %.3f, p99.9 %.3f, max %.3f, jitter %.3f ms%s' % (
+        stats['mean'], stats['p50'], stats['p90'], stats['p99'], stats['p99.9'], stats['max'], stats['jitter'],
+        '' if stats['steady'] else ' (not steady)')
+
+
+def write_hgrm(latencies_ms, path, ticks_per_half_distance=5):
+    """HdrHistogram percentile distribution of latencies in ms (value unit: ms)"""
+    values = np.sort(np.asarray(latencies_ms))
+    total = len(values)
+    lines = ['%12s %14s %10s %14s\n' % ('Value', 'Percentile', 'TotalCount', '1/(1-Percentile)')]
+    # percentiles get denser towards the tail, as in HdrHistogram's own output
+    percentile, half = 0.0, 50.0
+    while True:
+        count = min(total, max(1, int(math.ceil(percentile / 100.0 * total))))
+        value = values[count - 1]
+        if percentile >= 100.0 or count == total:
+            lines.append('%12.3f %14.12f %10d\n' % (values[-1], 1.0, total))
+            break
+        lines.append('%12.3f %14.12f %10d %14.2f\n' % (value, percentile / 100.0, count,
+                                                       1.0 / (1.0 - percentile / 100.0)))
+        percentile += half / ticks_per_half_distance
+        if percentile >= 100.0 - half:
+            half /= 2.0
+    lines.append('#[Mean    = %12.3f, StdDeviation   = %12.3f]\n' % (np.mean(values), np.std(values)))
+    lines.append('#[Max     = %12.3f, Total count    = %12d]\n' % (values[-1], total))
+    lines.append('#[Buckets = %12d, SubBuckets     = %12d]\n' % (1, total))
+    with open(path, 'w') as fn:
+        fn.writelines(lines)
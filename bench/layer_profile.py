@@ -0,0 +1,211 @@
+"""Per-layer profile of a compiled graph.
+
+Every fused node of the graph is timed on its own, calling its kernel from the compiled library with
+arrays of the shapes the graph runtime gives it. Conv nodes get their Workload back from the packed
+shapes and the schedule the schedule package picks for it, then FLOPs, bytes moved (inputs read and
+outputs written once) and the achieved GFLOPS / GBps. Convs that MKL-DNN timings are quoted for in
+mem_issue/conv.py (or in a benchdnn perf log given with --mkldnn) are lined up against them.
+
+    TVM_NUM_THREADS=16 python -m bench.layer_profile --model ssd_resnet50 --csv layers.csv
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import numpy as np
+
+import tvm
+from tvm.contrib import graph_runtime
+
+from .build_cache import cached_build
+from .models import ROOT, get_model, import_schedule
+from .roofline import load_roofline, roofline_fraction
+
+# 'MKLDNN - g1mb1_ic64ih56iw56_oc64oh56ow56_kh3kw3_sh1sw1_ph1pw1_n : 0.72514 ms'
+_MKLDNN_LINE = re.compile(r'(g\d+mb\d+_ic\d+ih\d+iw\d+_oc\d+oh\d+ow\d+_kh\d+kw\d+_sh\d+sw\d+(?:_dh\d+dw\d+)?_ph\d+pw\d+)'
+                          r'\S*\s*:\s*([\d.]+)\s*ms')
+
+
+def mkldnn_reference(path=os.path.join(ROOT, 'mem_issue', 'conv.py')):
+    """{benchdnn conv descriptor: ms}"""
+    with open(path) as fn:
+        return dict((desc, float(ms)) for desc, ms in _MKLDNN_LINE.findall(fn.read()))
+
+
+def mkldnn_desc(wkl, batch, out_h, out_w):
+    groups, dilation = getattr(wkl, 'groups', 1), getattr(wkl, 'hdilation', 1)
+    desc = 'g%dmb%d_ic%dih%diw%d_oc%doh%dow%d_kh%dkw%d_sh%dsw%d' % (
+        groups, batch, wkl.in_filter, wkl.height, wkl.width, wkl.out_filter, out_h, out_w,
+        wkl.hkernel, wkl.wkernel, wkl.hstride, wkl.wstride)
+    if dilation > 1:
+        # benchdnn counts dilation from 0
+        desc += '_dh%ddw%d' % (dilation - 1, dilation - 1)
+    return desc + '_ph%dpw%d' % (wkl.hpad, wkl.wpad)
+
+
+def _conv_candidates(data_shape, kernel_shape, out_shape, dtype, out_dtype, workload):
+    """Workloads consistent with the packed shapes of an NCHW[x]c conv, the graph json keeps no conv attrs"""
+    in_h, in_w = data_shape[2], data_shape[3]
+    out_h, out_w = out_shape[2], out_shape[3]
+    if tuple(kernel_shape[4:]) == (1, 1):
+        # 1x1 convs: (OC, IC, ic, oc, 1, 1)
+        kh, kw, ic_block = 1, 1, kernel_shape[2]
+    else:
+        # (OC, IC, kh, kw, ic, oc)
+        kh, kw, ic_block = kernel_shape[2], kernel_shape[3], kernel_shape[4]
+    # the stem takes NCHW data
+    in_filter = data_shape[1] * data_shape[4] if len(data_shape) == 5 else data_shape[1]
+    out_filter = out_shape[1] * out_shape[4]
+    groups = in_filter // (kernel_shape[1] * ic_block)
+    # topi's own Workload, used by the e2e packages, has no groups / dilation
+    extended = 'groups' in workload._fields
+    if not extended and groups != 1:
+        return
+    for dilation in ((1, 2, 4, 6) if extended else (1, )):
+        for stride in (1, 2):
+            hpad2 = (out_h - 1) * stride + (kh - 1) * dilation + 1 - in_h
+            wpad2 = (out_w - 1) * stride + (kw - 1) * dilation + 1 - in_w
+            if hpad2 < 0 or wpad2 < 0 or hpad2 % 2 or wpad2 % 2 or \
+                    (in_h + hpad2 - (kh - 1) * dilation - 1) // stride + 1 != out_h:
+                continue
+            fields = (dtype, out_dtype, in_h, in_w, in_filter, out_filter, kh, kw, hpad2 // 2, wpad2 // 2, stride, stride)
+            yield workload(*(fields + ((groups, dilation, dilation) if extended else ())))
+
+
+def conv_workload(schedule_module, data_shape, kernel_shape, out_shape, dtype, out_dtype):
+    """(Workload, schedule), the first candidate the schedule table knows, schedule None if none is"""
+    candidates = list(_conv_candidates(data_shape, kernel_shape, out_shape, dtype, out_dtype,
+                                       schedule_module.Workload))
+    for wkl in candidates:
+        try:
+            return wkl, schedule_module._get_schedule_conv(wkl)
+        except ValueError:
+            pass
+    return (candidates[0] if candidates else None), None
+
+
+def _nbytes(shape, dtype):
+    return int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+
+def graph_convs(graph, schedule_module):
+    """{node name: (Workload, schedule, output shape)} of the (possibly fused) convs of a graph json"""
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+    convs = {}
+    for nid, node in enumerate(graph['nodes']):
+        in_eids = [row_ptr[e[0]] + e[1] for e in node['inputs']]
+        # 5-d data (4-d for the stem), 6-d packed kernel
+        if node['op'] != 'tvm_op' or len(in_eids) < 2 or \
+                len(shapes[in_eids[0]]) not in (4, 5) or len(shapes[in_eids[1]]) != 6:
+            continue
+        out_shape = shapes[row_ptr[nid]]
+        wkl, sch = conv_workload(schedule_module, shapes[in_eids[0]], shapes[in_eids[1]], out_shape,
+                                 dtypes[in_eids[0]], dtypes[row_ptr[nid]])
+        if wkl is not None:
+            convs[node['name']] = (wkl, sch, out_shape)
+    return convs
+
+
+def conv_flops(wkl, out_shape):
+    return 2.0 * out_shape[0] * out_shape[2] * out_shape[3] * wkl.out_filter * \
+        (wkl.in_filter // getattr(wkl, 'groups', 1)) * wkl.hkernel * wkl.wkernel
+
+
+def profile_graph(graph, lib, schedule_module=None, number=100, mkldnn=None, roofline=None):
+    """One row per fused node, in graph order, roofline (see bench.roofline) adds the fraction of the
+    roofline bound each conv reaches"""
+    ctx = tvm.cpu()
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+    convs = graph_convs(graph, schedule_module) if schedule_module is not None else {}
+    rows = []
+    for nid, node in enumerate(graph['nodes']):
+        if node['op'] != 'tvm_op':
+            continue
+        attrs = node['attrs']
+        in_eids = [row_ptr[e[0]] + e[1] for e in node['inputs']]
+        out_eids = list(range(row_ptr[nid], row_ptr[nid + 1]))
+        args = []
+        for eid in in_eids + out_eids:
+            shape = shapes[eid]
+            if attrs.get('flatten_data') == '1':
+                shape = (int(np.prod(shape)), )
+            args.append(tvm.nd.array(np.random.uniform(size=shape).astype(dtypes[eid]), ctx))
+        cost = lib.time_evaluator(attrs['func_name'], ctx, number=number)(*args).mean
+
+        row = {'node': node['name'], 'func': attrs['func_name'], 'ms': cost * 1000.0,
+               'bytes': sum(_nbytes(shapes[eid], dtypes[eid]) for eid in in_eids + out_eids),
+               'workload': '', 'schedule': '', 'gflops': 0.0, 'gflop/s': 0.0, 'mkldnn_ms': '', 'roofline': ''}
+        row['gb/s'] = row['bytes'] / cost / 1e9
+        if node['name'] in convs:
+            wkl, sch, out_shape = convs[node['name']]
+            flops = conv_flops(wkl, out_shape)
+            row['workload'] = str(wkl)
+            row['schedule'] = str(sch) if sch is not None else ''
+            row['gflops'] = flops / 1e9
+            row['gflop/s'] = flops / cost / 1e9
+            if roofline:
+                row['roofline'] = roofline_fraction(roofline, flops, row['bytes'], cost)
+            if mkldnn:
+                row['mkldnn_ms'] = mkldnn.get(mkldnn_desc(wkl, out_shape[0], out_shape[2], out_shape[3]), '')
+        rows.append(row)
+    return rows
+
+
+_COLUMNS = ['node', 'ms', 'gflop/s', 'gb/s', 'roofline', 'mkldnn_ms', 'gflops', 'bytes', 'workload', 'schedule', 'func']
+
+
+def print_table(rows, top=None):
+    total = sum(row['ms'] for row in rows)
+    print('%-48s %9s %6s %9s %8s %9s %10s' % ('node', 'ms', '%', 'GFLOPS', 'GBps', 'roofline', 'MKL-DNN ms'))
+    for row in sorted(rows, key=lambda r: -r['ms'])[:top]:
+        roofline = '%.0f%%' % (100.0 * row['roofline']) if row['roofline'] != '' else ''
+        print('%-48s %9.4f %6.2f %9.2f %8.2f %9s %10s' % (row['node'][:48], row['ms'], 100.0 * row['ms'] / total,
+                                                         row['gflop/s'], row['gb/s'], roofline, row['mkldnn_ms']))
+        if row['workload']:
+            print('    %s\n    %s' % (row['workload'], row['schedule'] or 'no schedule in the table'))
+    print('sum of %d nodes: %.3f ms' % (len(rows), total))
+
+
+def write_csv(rows, path):
+    with open(path, 'w') as fn:
+        writer = csv.DictWriter(fn, fieldnames=_COLUMNS)
+        writer.writeheader()
+        for row in sorted(rows, key=lambda r: -r['ms']):
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='ssd_resnet50')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--schedule', default='ssd/schedule_pack')
+    parser.add_argument('--target', default='llvm -mcpu=skylake-avx512')
+    parser.add_argument('--opt-level', type=int, default=3)
+    parser.add_argument('--number', type=int, default=100, help='runs per node')
+    parser.add_argument('--mkldnn', help='benchdnn perf log, defaults to the timings quoted in mem_issue/conv.py')
+    parser.add_argument('--top', type=int, default=None, help='only print the slowest nodes')
+    parser.add_argument('--csv')
+    args = parser.parse_args()
+
+    package = import_schedule(args.schedule)
+    model = get_model(args.model, args.batch_size)
+    graph, lib, params = cached_build(model.net, args.target, {'data': model.data_shape}, model.params,
+                                      args.opt_level, args.schedule)
+
+    module = graph_runtime.create(graph, lib, tvm.cpu())
+    module.set_input(**params)
+    module.run()
+    time_f = module.module.time_evaluator('run', tvm.cpu(), number=args.number)
+    print('graph run: %.3f ms' % (time_f().mean * 1000.0))
+
+    rows = profile_graph(json.loads(graph.json()), lib, package.avx512_conv_fwd if package else None,
+                         args.number, mkldnn_reference(*([args.mkldnn] if args.mkldnn else [])), load_roofline())
+    print_table(rows, args.top)
+    if args.csv:
+        write_csv(rows, args.csv)
+        print('layers written to %s' % args.csv)
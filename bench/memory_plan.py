@@ -0,0 +1,191 @@
+"""Static activation-memory plan of a compiled graph.
+
+Every intermediate of the graph, plus the padded / packed input copy each conv makes inside its
+kernel, gets a live range in op order. Buffers are then placed by offset in a single 64-byte
+aligned arena, two buffers may overlap only when their live ranges don't.
+
+    python -m bench.memory_plan graph.json
+"""
+import json
+import sys
+from collections import namedtuple
+import numpy as np
+
+ALIGN = 64
+
+# live from the op producing it (start) to the last op reading it (end), both inclusive
+Buffer = namedtuple('Buffer', ['name', 'nbytes', 'start', 'end'])
+# buffers a conv allocates inside its kernel, named '<node>:<kind>', see conv_workspaces
+WORKSPACES = ('data_vec', 'kernel_pack')
+
+
+def _round_up(x, factor):
+    return (x + factor - 1) // factor * factor
+
+
+def _nbytes(shape, dtype):
+    size = np.dtype(dtype).itemsize
+    for x in shape:
+        size *= x
+    return size
+
+
+def kernel_hw(kernel_shape):
+    """(kh, kw) of a packed kernel: (OC, IC, ic, oc, 1, 1) for 1x1 convs, (OC, IC, kh, kw, ic, oc) otherwise"""
+    if tuple(kernel_shape[4:]) == (1, 1):
+        return 1, 1
+    return kernel_shape[2], kernel_shape[3]
+
+
+def conv_stride_pad(in_size, out_size, kernel_size):
+    """(stride, padding per side) of one spatial dim of a conv, the graph json keeps no conv attrs. Strides
+    1 and 2 with up to kernel_size // 2 padding are tried, 'same' padding first: SSD's stride-2 3x3 convs
+    on odd maps (19 -> 10, 5 -> 3) also fit stride 1 with less padding. None if nothing fits."""
+    pads = sorted(range(kernel_size // 2 + 1), key=lambda p: p != (kernel_size - 1) // 2)
+    for pad in pads:
+        for stride in (1, 2):
+            if (in_size + 2 * pad - kernel_size) // stride + 1 == out_size:
+                return stride, pad
+    return None
+
+
+def _conv_workspace(data_shape, kernel_shape, out_shape, dtype):
+    """Bytes of the padded / packed data copy of an NCHW[x]c conv (NCHW for the stem), which the graph
+    planner never sees. Padding is recovered from the shapes, assuming the kernel extent the packed
+    kernel has."""
+    kh, kw = kernel_hw(kernel_shape)
+    geometry = conv_stride_pad(data_shape[2], out_shape[2], kh), conv_stride_pad(data_shape[3], out_shape[3], kw)
+    if None in geometry:
+        return 0
+    (_, pad_h), (_, pad_w) = geometry
+    if pad_h == 0 and pad_w == 0:
+        # 1x1 convs read the input in place
+        return 0
+    shape = list(data_shape)
+    shape[2] += 2 * pad_h
+    shape[3] += 2 * pad_w
+    return _nbytes(shape, dtype)
+
+
+def conv_workspaces(graph, nid):
+    """{'data_vec': bytes, 'kernel_pack': bytes} a (possibly fused) conv node allocates inside its kernel: the
+    padded / packed data copy, and the packed kernel unless it is a param precompute packed at build time.
+    None if the node is no conv: 5-d data (4-d for the stem), 6-d packed kernel."""
+    nodes = graph['nodes']
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+    inputs = nodes[nid]['inputs']
+    in_eids = [row_ptr[e[0]] + e[1] for e in inputs]
+    if len(in_eids) < 2 or len(shapes[in_eids[0]]) not in (4, 5) or len(shapes[in_eids[1]]) != 6:
+        return None
+    eid = row_ptr[nid]
+    kernel_param = nodes[inputs[1][0]]['op'] == 'null'
+    return {'data_vec': _conv_workspace(shapes[in_eids[0]], shapes[in_eids[1]], shapes[eid], dtypes[eid]),
+            'kernel_pack': 0 if kernel_param else _nbytes(shapes[in_eids[1]], dtypes[in_eids[1]])}
+
+
+def graph_buffers(graph):
+    """Activation buffers of a graph json (nnvm graph.json()), graph inputs and params excluded."""
+    nodes = graph['nodes']
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+
+    ops = [nid for nid, node in enumerate(nodes) if node['op'] != 'null']
+    step = dict((nid, i) for i, nid in enumerate(ops))
+    last_use = {}
+    for nid in ops:
+        for e in nodes[nid]['inputs']:
+            last_use[row_ptr[e[0]] + e[1]] = step[nid]
+    for e in graph['heads']:
+        # outputs stay alive until they are read back
+        last_use[row_ptr[e[0]] + e[1]] = len(ops)
+
+    buffers = []
+    for nid in ops:
+        node = nodes[nid]
+        for idx in range(row_ptr[nid + 1] - row_ptr[nid]):
+            eid = row_ptr[nid] + idx
+            buffers.append(Buffer('%s:%d' % (node['name'], idx), _nbytes(shapes[eid], dtypes[eid]),
+                                  step[nid], last_use.get(eid, step[nid])))
+        workspaces = conv_workspaces(graph, nid)
+        for kind in WORKSPACES:
+            if workspaces and workspaces[kind]:
+                buffers.append(Buffer('%s:%s' % (node['name'], kind), workspaces[kind], step[nid], step[nid]))
+    return buffers
+
+
+def param_bytes(graph):
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+    return sum(_nbytes(shapes[row_ptr[nid]], dtypes[row_ptr[nid]]) for nid in graph['arg_nodes'])
+
+
+def plan_arena(buffers, align=ALIGN):
+    """Offsets in one arena, largest buffers first, each at the lowest offset free over its live range.
+    Returns ({name: offset}, arena bytes)."""
+    placed = []
+    for buf in sorted(buffers, key=lambda b: (-b.nbytes, b.start)):
+        size = _round_up(buf.nbytes, align)
+        conflicts = sorted((offset, offset + other_size) for other, offset, other_size in placed
+                           if other.start <= buf.end and buf.start <= other.end)
+        offset = 0
+        for lo, hi in conflicts:
+            if offset + size <= lo:
+                break
+            offset = max(offset, hi)
+        placed.append((buf, offset, size))
+    offsets = dict((buf.name, offset) for buf, offset, _ in placed)
+    peak = max([offset + size for _, offset, size in placed] + [0])
+    return offsets, peak
+
+
+def check_plan(buffers, offsets, align=ALIGN):
+    for i, a in enumerate(buffers):
+        assert offsets[a.name] % align == 0, "%s is not %d-byte aligned" % (a.name, align)
+        for b in buffers[i + 1:]:
+            if a.start <= b.end and b.start <= a.end:
+                assert offsets[a.name] + a.nbytes <= offsets[b.name] or \
+                       offsets[b.name] + b.nbytes <= offsets[a.name], \
+                       "%s and %s overlap while both alive" % (a.name, b.name)
+
+
+def aligned_arena(nbytes, align=ALIGN):
+    """Preallocated arena, a uint8 array starting on an align-byte boundary."""
+    raw = np.empty(nbytes + align, dtype='uint8')
+    start = -raw.ctypes.data % align
+    return raw[start:start + nbytes]
+
+
+def graph_runtime_bytes(graph):
+    """Storage the graph runtime allocates for activations with its own plan (one pool per storage_id)."""
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+    storage_ids = graph['attrs']['storage_id'][1]
+    args = set(row_ptr[nid] for nid in graph['arg_nodes'])
+    pools = {}
+    for eid, sid in enumerate(storage_ids):
+        if eid not in args:
+            pools[sid] = max(pools.get(sid, 0), _nbytes(shapes[eid], dtypes[eid]))
+    return sum(pools.values())
+
+
+def report_memory_plan(graph):
+    buffers = graph_buffers(graph)
+    offsets, peak = plan_arena(buffers)
+    check_plan(buffers, offsets)
+    workspace = sum(buf.nbytes for buf in buffers if buf.name.rsplit(':', 1)[1] in WORKSPACES)
+    print('activations without reuse: %.2f MB (%.2f MB of conv workspaces)' %
+          (sum(buf.nbytes for buf in buffers) / 1e6, workspace / 1e6))
+    print('graph runtime plan: %.2f MB, workspaces not included' % (graph_runtime_bytes(graph) / 1e6))
+    print('arena plan: %.2f MB peak' % (peak / 1e6))
+    print('inputs and params: %.2f MB' % (param_bytes(graph) / 1e6))
+    return offsets, peak
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1] if len(sys.argv) > 1 else 'graph.json') as fn:
+        report_memory_plan(json.load(fn))
@@ -0,0 +1,134 @@
+"""Memory footprint of a compiled model.
+
+The build-time part comes from the graph json: packed weight bytes per layer, activation storage of
+the graph runtime's storage plan (and of the tighter arena plan of memory_plan.py), and the
+intra-op workspace each conv allocates for its padded / packed data copy (data_vec) and for a kernel
+not pre-packed at build time (kernel_pack). It is saved as
+memory.json next to an exported build, deploy.Predictor reads it back and adds the peak RSS measured
+while running.
+
+    python -m bench.memory_report deploy/resnet50_v1 [--baseline old/memory.json]
+"""
+import argparse
+import json
+import os
+import sys
+
+# no bench.models import, deploy loads this module without nnvm
+from .memory_plan import conv_workspaces, graph_buffers, graph_runtime_bytes, plan_arena, _nbytes
+
+# a total growing by more than this fraction over the baseline is a regression
+REGRESSION = 0.01
+
+
+def memory_report(graph):
+    """Footprint of a graph json (nnvm graph.json()), every size in bytes"""
+    nodes = graph['nodes']
+    row_ptr = graph['node_row_ptr']
+    shapes = graph['attrs']['shape'][1]
+    dtypes = graph['attrs']['dltype'][1]
+    # graph inputs are null nodes too, params are the ones not fed by the caller
+    inputs = set(nid for nid in graph['arg_nodes'] if nodes[nid]['name'] == 'data')
+
+    weights = []
+    for node in nodes:
+        if node['op'] == 'null':
+            continue
+        params = [e[0] for e in node['inputs'] if nodes[e[0]]['op'] == 'null' and e[0] not in inputs]
+        size = sum(_nbytes(shapes[row_ptr[nid]], dtypes[row_ptr[nid]]) for nid in params)
+        if size:
+            weights.append({'node': node['name'], 'bytes': size,
+                            'shapes': [shapes[row_ptr[nid]] for nid in params]})
+
+    # per conv: padded / packed data copy and kernel packed at run time
+    workspace = []
+    for nid, node in enumerate(nodes):
+        sizes = conv_workspaces(graph, nid) if node['op'] != 'null' else None
+        if sizes and any(sizes.values()):
+            workspace.append(dict(sizes, node=node['name'], bytes=sum(sizes.values())))
+    _, arena = plan_arena(graph_buffers(graph))
+    report = {
+        'weights': weights,
+        'weight_bytes': sum(w['bytes'] for w in weights),
+        'input_bytes': sum(_nbytes(shapes[row_ptr[nid]], dtypes[row_ptr[nid]]) for nid in inputs),
+        'activation_bytes': graph_runtime_bytes(graph),
+        'arena_bytes': arena,
+        'workspace': workspace,
+        'workspace_bytes': sum(w['bytes'] for w in workspace),
+        'data_vec_bytes': sum(w['data_vec'] for w in workspace),
+        'kernel_pack_bytes': sum(w['kernel_pack'] for w in workspace),
+        # ops run one at a time, only one workspace is alive
+        'peak_workspace_bytes': max([w['bytes'] for w in workspace] + [0]),
+    }
+    report['total_bytes'] = report['weight_bytes'] + report['input_bytes'] + report['activation_bytes'] + \
+        report['peak_workspace_bytes']
+    return report
+
+
+def _proc_status(field):
+    with open('/proc/self/status') as fn:
+        for line in fn:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def rss_bytes():
+    return _proc_status('VmRSS')
+
+
+def peak_rss_bytes():
+    return _proc_status('VmHWM')
+
+
+def reset_peak_rss():
+    """Restart the peak RSS from the current RSS (linux >= 4.0), False when the kernel refuses"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as fn:
+            fn.write('5')
+        return True
+    except IOError:
+        return False
+
+
+_TOTALS = ['weight_bytes', 'input_bytes', 'activation_bytes', 'arena_bytes', 'peak_workspace_bytes',
+           'workspace_bytes', 'data_vec_bytes', 'kernel_pack_bytes', 'total_bytes', 'peak_rss_bytes']
+
+
+def print_report(report, top=10):
+    for key in _TOTALS:
+        if key in report:
+            print('%-22s %10.2f MB' % (key, report[key] / 1e6))
+    print('largest weights:')
+    for w in sorted(report['weights'], key=lambda w: -w['bytes'])[:top]:
+        print('    %-48s %8.2f MB' % (w['node'][:48], w['bytes'] / 1e6))
+    print('largest workspaces:')
+    for w in sorted(report['workspace'], key=lambda w: -w['bytes'])[:top]:
+        print('    %-48s %8.2f MB (data_vec %.2f MB, kernel_pack %.2f MB)' %
+              (w['node'][:48], w['bytes'] / 1e6, w['data_vec'] / 1e6, w['kernel_pack'] / 1e6))
+
+
+def compare(baseline, report, tolerance=REGRESSION):
+    """Totals grown over the baseline by more than tolerance, [(key, baseline bytes, bytes)]"""
+    regressions = []
+    for key in _TOTALS:
+        if key in baseline and key in report and report[key] > baseline[key] * (1 + tolerance):
+            regressions.append((key, baseline[key], report[key]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='memory footprint of an exported build')
+    parser.add_argument('path', help='exported build directory')
+    parser.add_argument('--baseline', help='memory.json of a previous build')
+    args = parser.parse_args()
+
+    with open(os.path.join(args.path, 'graph.json')) as fn:
+        report = memory_report(json.load(fn))
+    print_report(report)
+    if args.baseline:
+        with open(args.baseline) as fn:
+            regressions = compare(json.load(fn), report)
+        for key, old, new in regressions:
+            print('REGRESSION %s: %.2f MB -> %.2f MB' % (key, old / 1e6, new / 1e6))
+        sys.exit(1 if regressions else 0)
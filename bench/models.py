@@ -0,0 +1,74 @@
+"""Models of the benchmark matrix, every loader returns an nnvm graph, its params and the input shape."""
+import glob
+import os
+import sys
+from collections import namedtuple
+
+import nnvm
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SSD_PREFIX = os.path.join(ROOT, 'ssd', 'model', 'ssd_resnet50_512')
+
+# mxnet_forward(data numpy array) -> list of numpy outputs, for the MKL-DNN reference and accuracy checks
+Model = namedtuple('Model', ['net', 'params', 'data_shape', 'mxnet_forward'])
+
+
+def _gluon_model(name, batch_size):
+    import mxnet as mx
+    from mxnet.gluon.model_zoo.vision import get_model
+    block = get_model(name, pretrained=True)
+    net, params = nnvm.frontend.from_mxnet(block)
+    forward = lambda data: [block(mx.nd.array(data)).asnumpy()]
+    return Model(net, params, data_shape(name, batch_size), forward)
+
+
+def _ssd_model(name, batch_size, image_size=512, prefix=SSD_PREFIX):
+    import mxnet as mx
+    sys.path.insert(0, os.path.join(ROOT, 'ssd'))
+    from symbol.symbol_factory import get_symbol
+    body = name.split('_')[1]
+    data_shape = (batch_size, 3, image_size, image_size)
+    _, arg_params, aux_params = mx.model.load_checkpoint(prefix, 0)
+    sym = get_symbol(body, image_size, num_classes=20)
+    mod = mx.mod.Module(symbol=sym, context=mx.cpu(), label_names=None)
+    mod.bind(data_shapes=[('data', data_shape)])
+    mod.set_params(arg_params, aux_params)
+    net, params = nnvm.frontend.from_mxnet(sym, mod.get_params()[0], mod.get_params()[1])
+
+    def forward(data):
+        mod.forward(mx.io.DataBatch(data=[mx.nd.array(data)]), is_train=False)
+        return [out.asnumpy() for out in mod.get_outputs()]
+    return Model(net, params, data_shape, forward)
+
+
+def data_shape(name, batch_size):
+    """Input shape of a model, without loading it"""
+    return (batch_size, 3, 512, 512) if name.startswith('ssd_') else (batch_size, 3, 224, 224)
+
+
+def model_files(name):
+    """[(file name, bytes, mtime)] of the files a model is loaded from, without loading it. Empty for a
+    gluon model that was never downloaded."""
+    if name.startswith('ssd_'):
+        paths = glob.glob(SSD_PREFIX + '-*')
+    else:
+        mxnet_home = os.environ.get('MXNET_HOME', os.path.join(os.path.expanduser('~'), '.mxnet'))
+        paths = glob.glob(os.path.join(mxnet_home, 'models', '%s-*.params' % name))
+    return sorted((os.path.basename(p), os.path.getsize(p), int(os.path.getmtime(p))) for p in paths)
+
+
+def get_model(name, batch_size):
+    """'ssd_resnet50' for the SSD-512 detector, any gluon model zoo name (resnet50_v1, ...) otherwise"""
+    if name.startswith('ssd_'):
+        return _ssd_model(name, batch_size)
+    return _gluon_model(name, batch_size)
+
+
+def import_schedule(path):
+    """Register the schedules of a schedule package directory (ssd/schedule_pack, e2e_general_pack/schedule_pack, ...),
+    'default' keeps TVM's own."""
+    if path == 'default':
+        return None
+    path = os.path.abspath(os.path.join(ROOT, path))
+    sys.path.insert(0, os.path.dirname(path))
+    return __import__(os.path.basename(path) + '.avx512_conv_fwd')
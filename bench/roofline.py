@@ -0,0 +1,232 @@
+"""Roofline of the host: FMA peak, cache / DRAM bandwidth and reduction throughput, all measured with
+TVM-generated kernels, stored per host and used to put achieved kernel / layer performance against
+the bound for its arithmetic intensity.
+
+- fma: independent vector accumulators, each a chain of dependent FMAs acc = acc * y + x on
+  register-resident operands, one task (a core) and one task per thread (every core, the socket
+  figure is that over the number of NUMA nodes)
+- bandwidth: STREAM triad a = b + 3 * c (12 bytes per element), working sets of half of L1 / L2 on
+  one core, half of L3 and 16x L3 (DRAM) on every thread, swept repeatedly within one call so the
+  call overhead does not show on the small working sets
+- reduction: partial sums of a DRAM-sized array on every thread
+
+    TVM_NUM_THREADS=18 python -m bench.roofline
+"""
+import glob
+import json
+import os
+import platform
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+ROOFLINE_DIR = os.environ.get('TOPI_ROOFLINE_DIR',
+                              os.path.join(os.path.expanduser('~'), '.cache', 'topi-intel', 'roofline'))
+
+target = 'llvm -mcpu=skylake-avx512'
+dtype = 'float32'
+VEC = 16
+# accumulators kept in flight, enough to hide the FMA latency on both FMA ports
+ACCUMULATORS = 12
+# bytes a triad call moves at least, in repeated sweeps of its working set
+TRIAD_BYTES = 64 << 20
+
+
+def _cache_sizes():
+    """{'l1': bytes, 'l2': bytes, 'l3': bytes} of the data caches of cpu0"""
+    sizes = {}
+    for path in glob.glob('/sys/devices/system/cpu/cpu0/cache/index*'):
+        with open(os.path.join(path, 'type')) as fn:
+            if fn.read().strip() == 'Instruction':
+                continue
+        with open(os.path.join(path, 'level')) as fn:
+            level = int(fn.read())
+        with open(os.path.join(path, 'size')) as fn:
+            size = fn.read().strip()
+        sizes['l%d' % level] = int(size.rstrip('KM')) << (20 if size.endswith('M') else 10)
+    return sizes
+
+
+def _physical_cores():
+    cores = set()
+    for path in glob.glob('/sys/devices/system/cpu/cpu[0-9]*/topology'):
+        with open(os.path.join(path, 'physical_package_id')) as fn:
+            package = fn.read().strip()
+        with open(os.path.join(path, 'core_id')) as fn:
+            cores.add((package, fn.read().strip()))
+    return len(cores)
+
+
+def _num_sockets():
+    return max(1, len(glob.glob('/sys/devices/system/node/node[0-9]*')))
+
+
+def _cpu_model():
+    with open('/proc/cpuinfo') as fn:
+        for line in fn:
+            if line.startswith('model name'):
+                return line.split(':', 1)[1].strip()
+    return platform.processor()
+
+
+def _time(func, args, number):
+    ctx = tvm.cpu()
+    return func.time_evaluator(func.entry_name, ctx, number=number)(*args).mean
+
+
+def measure_fma(tasks, steps=1 << 16, number=20):
+    """GFLOPS of tasks parallel tasks, each FMA-ing ACCUMULATORS vectors steps times"""
+    X = tvm.placeholder((tasks, ACCUMULATORS, VEC), name='X')
+    y = tvm.var('y', dtype=dtype)
+    # acc = acc * y + x, the multiply depends on the previous step and cannot be hoisted out of k
+    # as that of a sum of x * y would be
+    fma = tvm.comm_reducer(lambda acc, x: acc * y + x, lambda t: tvm.const(0, t), name='fma')
+    k = tvm.reduce_axis((0, steps), name='k')
+    Out = tvm.compute((tasks, ACCUMULATORS, VEC), lambda p, r, v: fma(X[p, r, v], axis=k), name='Out')
+    s = tvm.create_schedule(Out.op)
+    OL = s.cache_write(Out, 'global')
+    p, r, v = s[Out].op.axis
+    s[Out].vectorize(v)
+    if tasks > 1:
+        s[Out].parallel(p)
+    s[OL].compute_at(s[Out], p)
+    _, r, v = s[OL].op.axis
+    k, = s[OL].op.reduce_axis
+    s[OL].reorder(k, r, v)
+    s[OL].unroll(r)
+    s[OL].vectorize(v)
+    func = tvm.build(s, [X, y, Out], target)
+
+    ctx = tvm.cpu()
+    args = [tvm.nd.array(np.random.uniform(size=get_const_tuple(t.shape)).astype(dtype), ctx) for t in (X, Out)]
+    # |y| < 1 keeps the accumulators bounded
+    cost = _time(func, [args[0], 0.5, args[1]], number)
+    return 2.0 * tasks * ACCUMULATORS * VEC * steps / cost / 1e9
+
+
+def _triad_ir(b, c, a, repeats):
+    """repeats sweeps of a = b + 3 * c over each task's row"""
+    ib = tvm.ir_builder.create()
+    tasks, n = get_const_tuple(b.shape)
+    bp, cp, ap = ib.buffer_ptr(b), ib.buffer_ptr(c), ib.buffer_ptr(a)
+    with ib.for_range(0, tasks, name='p', for_type='parallel' if tasks > 1 else 'serial') as p:
+        with ib.for_range(0, repeats, name='t'):
+            with ib.for_range(0, n // VEC, name='io') as io:
+                with ib.for_range(0, VEC, name='ii', for_type='vectorize') as ii:
+                    i = p * n + io * VEC + ii
+                    ap[i] = bp[i] + 3.0 * cp[i]
+    return ib.get()
+
+
+def measure_triad(nbytes, tasks, number=50):
+    """GB/s of a = b + 3 * c over arrays totalling nbytes, split in tasks parallel chunks"""
+    n = max(VEC, nbytes // (3 * 4 * tasks) // VEC * VEC)
+    repeats = max(1, TRIAD_BYTES // (3 * 4 * tasks * n))
+    B = tvm.placeholder((tasks, n), name='B')
+    C = tvm.placeholder((tasks, n), name='C')
+    A = tvm.extern((tasks, n), [B, C], lambda ins, outs: _triad_ir(ins[0], ins[1], outs[0], repeats), name='A')
+    s = tvm.create_schedule(A.op)
+    func = tvm.build(s, [B, C, A], target)
+
+    ctx = tvm.cpu()
+    args = [tvm.nd.array(np.random.uniform(size=(tasks, n)).astype(dtype), ctx) for _ in range(3)]
+    # the first call pulls the working set into the cache level under test
+    func(*args)
+    cost = _time(func, args, number)
+    return 3 * 4.0 * tasks * n * repeats / cost / 1e9
+
+
+def measure_reduction(nbytes, tasks, number=20):
+    """GB/s of summing an array of nbytes, each of tasks parallel chunks into ACCUMULATORS partial vectors"""
+    n = max(1, nbytes // (4 * tasks * ACCUMULATORS * VEC))
+    X = tvm.placeholder((tasks, n, ACCUMULATORS, VEC), name='X')
+    k = tvm.reduce_axis((0, n), name='k')
+    Out = tvm.compute((tasks, ACCUMULATORS, VEC), lambda p, r, v: tvm.sum(X[p, k, r, v], axis=k), name='Out')
+    s = tvm.create_schedule(Out.op)
+    OL = s.cache_write(Out, 'global')
+    p, r, v = s[Out].op.axis
+    s[Out].vectorize(v)
+    if tasks > 1:
+        s[Out].parallel(p)
+    s[OL].compute_at(s[Out], p)
+    _, r, v = s[OL].op.axis
+    k, = s[OL].op.reduce_axis
+    s[OL].reorder(k, r, v)
+    s[OL].unroll(r)
+    s[OL].vectorize(v)
+    func = tvm.build(s, [X, Out], target)
+
+    ctx = tvm.cpu()
+    x = np.random.uniform(size=(tasks, n, ACCUMULATORS, VEC)).astype(dtype)
+    out = tvm.nd.array(np.zeros((tasks, ACCUMULATORS, VEC), dtype=dtype), ctx)
+    args = [tvm.nd.array(x, ctx), out]
+    cost = _time(func, args, number)
+    np.testing.assert_allclose(out.asnumpy().sum(), x.sum(dtype='float64'), rtol=1e-3)
+    return 4.0 * x.size / cost / 1e9
+
+
+def measure(threads=None):
+    threads = threads or int(os.environ.get('TVM_NUM_THREADS', _physical_cores()))
+    caches = _cache_sizes()
+    sockets = _num_sockets()
+    fma_all = measure_fma(threads)
+    return {
+        'host': platform.node(),
+        'cpu': _cpu_model(),
+        'threads': threads,
+        'sockets': sockets,
+        'caches': caches,
+        'fma_gflops': {'core': measure_fma(1), 'socket': fma_all / sockets, 'all': fma_all},
+        'bandwidth_gbs': {
+            'l1': measure_triad(caches.get('l1', 32 << 10) // 2, 1),
+            'l2': measure_triad(caches.get('l2', 1 << 20) // 2, 1),
+            'l3': measure_triad(caches.get('l3', 16 << 20) // 2, threads),
+            'dram': measure_triad(caches.get('l3', 16 << 20) * 16, threads, number=10),
+        },
+        'reduction_gbs': measure_reduction(caches.get('l3', 16 << 20) * 16, threads),
+    }
+
+
+def roofline_path(host=None, roofline_dir=ROOFLINE_DIR):
+    return os.path.join(roofline_dir, '%s.json' % (host or platform.node()))
+
+
+def save_roofline(roofline, roofline_dir=ROOFLINE_DIR):
+    if not os.path.isdir(roofline_dir):
+        os.makedirs(roofline_dir)
+    with open(roofline_path(roofline['host'], roofline_dir), 'w') as fn:
+        json.dump(roofline, fn, indent=2)
+
+
+def load_roofline(host=None, roofline_dir=ROOFLINE_DIR):
+    """Stored roofline of host (this one by default), None if it was never measured"""
+    path = roofline_path(host, roofline_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path) as fn:
+        return json.load(fn)
+
+
+def attainable_gflops(roofline, intensity, level='dram', scope='all'):
+    """Roofline bound at intensity flops per byte: min(FMA peak, intensity x bandwidth of level)"""
+    return min(roofline['fma_gflops'][scope], intensity * roofline['bandwidth_gbs'][level])
+
+
+def roofline_fraction(roofline, flops, nbytes, seconds, level='dram', scope='all'):
+    """Achieved fraction of the roofline bound of a kernel doing flops over nbytes in seconds"""
+    return flops / seconds / 1e9 / attainable_gflops(roofline, float(flops) / nbytes, level, scope)
+
+
+if __name__ == "__main__":
+    roofline = measure()
+    save_roofline(roofline)
+    print('%s (%s), %d threads, %d sockets' % (roofline['host'], roofline['cpu'], roofline['threads'],
+                                             roofline['sockets']))
+    print('FMA peak: %.1f GFLOPS per core, %.1f per socket, %.1f total' %
+          (roofline['fma_gflops']['core'], roofline['fma_gflops']['socket'], roofline['fma_gflops']['all']))
+    bw = roofline['bandwidth_gbs']
+    print('triad: L1 %.1f GB/s, L2 %.1f GB/s per core; L3 %.1f GB/s, DRAM %.1f GB/s total' %
+          (bw['l1'], bw['l2'], bw['l3'], bw['dram']))
+    print('reduction: %.1f GB/s' % roofline['reduction_gbs'])
+    print('ridge point: %.1f flops/byte (DRAM)' % (roofline['fma_gflops']['all'] / bw['dram']))
+    print('written to %s' % roofline_path(roofline['host']))
@@ -0,0 +1,79 @@
+"""One configuration of the benchmark matrix, run in its own process since the TVM thread pool size
+is fixed once the runtime has started.
+
+    TVM_NUM_THREADS=16 python -m bench.runner '{"model": "resnet50_v1", "batch_size": 1, ...}'
+"""
+import json
+import os
+import sys
+import time
+import numpy as np
+
+import nnvm.compiler
+import tvm
+from tvm.contrib import graph_runtime
+
+from .build_cache import cached_model_build
+from .golden import check_outputs, load_golden
+from .latency import latency_stats, record, warmup
+from .memory_report import memory_report, peak_rss_bytes, reset_peak_rss, rss_bytes
+from .models import data_shape, get_model, import_schedule
+
+def run_config(config):
+    """config: model, batch_size, target, schedule, opt_level, num_pass, mxnet, build_cache"""
+    import_schedule(config['schedule'])
+    shape = data_shape(config['model'], config['batch_size'])
+    # the model (mxnet import, download) is only loaded on a build cache miss or for the mxnet timing
+    model = None
+
+    start = time.time()
+    if config.get('build_cache', True):
+        graph, lib, params = cached_model_build(config['model'], config['batch_size'], config['target'],
+                                                config['opt_level'], config['schedule'])
+    else:
+        model = get_model(config['model'], config['batch_size'])
+        with nnvm.compiler.build_config(opt_level=config['opt_level']):
+            graph, lib, params = nnvm.compiler.build(model.net, config['target'],
+                                                     shape={'data': shape}, params=model.params)
+    memory = memory_report(json.loads(graph.json()))
+    # peak RSS from here on: the runtime, its params and activations, not the compiler
+    rss_before = rss_bytes()
+    reset_peak_rss()
+    ctx = tvm.cpu()
+    module = graph_runtime.create(graph, lib, ctx)
+    module.set_input(**params)
+    golden = load_golden(config['model'], shape)
+    if golden is not None:
+        data = golden[0]
+    else:
+        data = np.random.uniform(0, 255, size=shape).astype('float32')
+    module.set_input('data', tvm.nd.array(data, ctx))
+
+    result = dict(config)
+    result['num_threads'] = int(os.environ.get('TVM_NUM_THREADS', 0))
+    result['build_s'] = time.time() - start
+    warmup_latencies = warmup(module.run)
+    result['warmup_runs'] = len(warmup_latencies)
+    result['warmup_ms'] = [x * 1000.0 for x in warmup_latencies]
+    result['tvm'] = latency_stats(record(module.run, config['num_pass']))
+    if golden is not None:
+        outputs = [module.get_output(i, tvm.nd.empty(out.shape, str(out.dtype), ctx)).asnumpy()
+                   for i, out in enumerate(golden[1])]
+        check_outputs(outputs, golden[1])
+    result['checked'] = golden is not None
+    result['memory'] = dict((k, v) for k, v in memory.items() if k.endswith('_bytes'))
+    result['memory']['rss_before_load_bytes'] = rss_before
+    result['memory']['peak_rss_bytes'] = peak_rss_bytes()
+
+    if config.get('mxnet'):
+        model = model or get_model(config['model'], config['batch_size'])
+        # measured after TVM in every configuration, with the same warmup rule
+        forward = lambda: model.mxnet_forward(data)
+        warmup(forward)
+        result['mxnet'] = latency_stats(record(forward, config['num_pass']))
+    return result
+
+
+if __name__ == "__main__":
+    # the last stdout line is the result, everything before it is build output
+    print(json.dumps(run_config(json.loads(sys.argv[1]))))
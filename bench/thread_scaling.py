@@ -0,0 +1,157 @@
+"""Per-layer thread scaling of a network.
+
+The model is built once (through the build cache) and exported, then every thread count profiles all
+layers in a worker loading the exported library: the TVM thread pool is sized once per process, a
+fresh worker is the only way to resize it, and with the build done upfront a worker only pays the
+deploy load. Per layer this gives speedup and parallel efficiency over the smallest thread count,
+flags convs whose parallel axis has fewer tasks than threads or splits unevenly over them, and the
+suggested thread count: the fewest threads within 5% of the layer's best time.
+
+    python -m bench.thread_scaling --model resnet50_v1 --threads 1,2,4,8,16,18 --json scaling.json
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import tvm
+
+from .build_cache import cached_build, save_artifact
+from .layer_profile import graph_convs, profile_graph
+from .models import ROOT, get_model, import_schedule
+
+# a thread count whose slowest thread gets more than this share of extra tasks is flagged
+IMBALANCE = 0.9
+SUGGEST_TOLERANCE = 0.05
+
+
+def _ceil_div(a, b):
+    return (a + b - 1) // b
+
+
+def parallel_extent(wkl, sch, out_shape):
+    """Number of parallel tasks of a conv schedule, None for an unknown schedule"""
+    if sch is None or not hasattr(sch, 'oc_bn'):
+        return None
+    oc_chunk = _ceil_div(wkl.out_filter, sch.oc_bn)
+    out_h, out_w = out_shape[2], out_shape[3]
+    if hasattr(sch, 'oh_factor'):
+        # 1x1: fused (oc_chunk, oh_outer)
+        return oc_chunk * _ceil_div(out_h, sch.oh_factor)
+    if getattr(sch, 'oh_tile', 0):
+        tiles = _ceil_div(out_h, sch.oh_tile) * _ceil_div(out_w, sch.ow_tile)
+        return tiles if sch.tile_pack else oc_chunk * tiles
+    if getattr(sch, 'tile_pack', False):
+        return out_h
+    return oc_chunk * out_h
+
+
+def balance(extent, num_threads):
+    """Best parallel efficiency a static split of extent tasks over num_threads can reach"""
+    return float(extent) / (num_threads * _ceil_div(extent, num_threads))
+
+
+def _worker(path, number):
+    with open(os.path.join(path, 'graph.json')) as fn:
+        graph = json.load(fn)
+    lib = tvm.module.load(os.path.join(path, 'deploy.so'))
+    rows = profile_graph(graph, lib, number=number)
+    print(json.dumps(dict((row['node'], row['ms']) for row in rows)))
+
+
+def measure(path, threads, number):
+    """{num_threads: {node: ms}}, one worker process per thread count"""
+    times = {}
+    for num_threads in threads:
+        env = dict(os.environ)
+        env['TVM_NUM_THREADS'] = env['OMP_NUM_THREADS'] = str(num_threads)
+        env['KMP_AFFINITY'] = 'granularity=fine,compact,1,0'
+        out = subprocess.check_output([sys.executable, '-m', 'bench.thread_scaling', '--worker', path,
+                                       '--number', str(number)], env=env, cwd=ROOT, universal_newlines=True)
+        times[num_threads] = json.loads(out.strip().splitlines()[-1])
+    return times
+
+
+def analyze(times, convs):
+    """One row per layer: times, speedup and efficiency per thread count, warnings, suggested threads"""
+    threads = sorted(times)
+    base = threads[0]
+    rows = []
+    for node in times[base]:
+        ms = dict((t, times[t][node]) for t in threads)
+        speedup = dict((t, ms[base] / ms[t]) for t in threads)
+        best = min(ms.values())
+        row = {'node': node, 'ms': ms, 'speedup': speedup,
+               'efficiency': dict((t, speedup[t] * base / t) for t in threads),
+               'threads': min(t for t in threads if ms[t] <= best * (1 + SUGGEST_TOLERANCE)),
+               'extent': None, 'warnings': []}
+        if node in convs:
+            wkl, sch, out_shape = convs[node]
+            row['extent'] = extent = parallel_extent(wkl, sch, out_shape)
+            for t in threads:
+                if extent is None or t == 1:
+                    continue
+                if extent < t:
+                    row['warnings'].append('%d threads: only %d parallel tasks' % (t, extent))
+                elif balance(extent, t) < IMBALANCE:
+                    row['warnings'].append('%d threads: %d tasks split unevenly, %.0f%% balance' %
+                                           (t, extent, 100.0 * balance(extent, t)))
+        rows.append(row)
+    return rows
+
+
+def print_report(rows):
+    threads = sorted(rows[0]['ms'])
+    print('%-40s %7s %s %8s' % ('node', 'tasks', ' '.join('%13s' % ('%d thr ms/eff' % t) for t in threads),
+                                'suggest'))
+    for row in sorted(rows, key=lambda r: -r['ms'][threads[0]]):
+        print('%-40s %7s %s %8d' % (row['node'][:40], row['extent'] or '-',
+                                    ' '.join('%8.3f/%3.0f%%' % (row['ms'][t], 100.0 * row['efficiency'][t])
+                                             for t in threads), row['threads']))
+        for warning in row['warnings']:
+            print('    %s' % warning)
+    for t in threads:
+        total = sum(row['ms'][t] for row in rows)
+        print('%d threads: %.3f ms, %.0f%% efficiency' %
+              (t, total, 100.0 * sum(row['ms'][threads[0]] for row in rows) * threads[0] / (total * t)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='resnet50_v1')
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--threads', default='1,2,4,8,16,18')
+    parser.add_argument('--schedule', default='ssd/schedule_pack')
+    parser.add_argument('--target', default='llvm -mcpu=skylake-avx512')
+    parser.add_argument('--opt-level', type=int, default=3)
+    parser.add_argument('--number', type=int, default=50, help='runs per layer')
+    parser.add_argument('--json')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        _worker(args.worker, args.number)
+        sys.exit(0)
+
+    package = import_schedule(args.schedule)
+    model = get_model(args.model, args.batch_size)
+    graph, lib, params = cached_build(model.net, args.target, {'data': model.data_shape}, model.params,
+                                      args.opt_level, args.schedule)
+    path = tempfile.mkdtemp(prefix='thread_scaling.')
+    try:
+        save_artifact(path, graph, lib, params)
+        start = time.time()
+        times = measure(path, [int(t) for t in args.threads.split(',')], args.number)
+        print('measured in %.1f s' % (time.time() - start))
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+    graph = json.loads(graph.json())
+    rows = analyze(times, graph_convs(graph, package.avx512_conv_fwd) if package else {})
+    print_report(rows)
+    if args.json:
+        with open(args.json, 'w') as fn:
+            json.dump(rows, fn, indent=2)
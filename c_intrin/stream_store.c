@@ -0,0 +1,26 @@
+#include <immintrin.h>
+
+/* Copy the output block of one parallel task with non-temporal stores, the destination bypasses the
+ * caches. The block is chunks x rows runs of n floats (a multiple of 16), contiguous in src, c_stride /
+ * h_stride floats apart in dst. Called once per task from the tensorized output stores of the conv
+ * schedules, see schedule_pack/stream_store.py. */
+int tvm_stream_store_f32(float* dst, const float* src, int chunks, int rows, int n, int c_stride, int h_stride) {
+    int c, h, i;
+    for (c = 0; c < chunks; ++c) {
+        for (h = 0; h < rows; ++h, src += n) {
+            float* out = dst + c * c_stride + h * h_stride;
+            if (((size_t)out & 63) != 0) {
+                for (i = 0; i < n; i += 16) {
+                    _mm512_storeu_ps(out + i, _mm512_loadu_ps(src + i));
+                }
+                continue;
+            }
+            for (i = 0; i < n; i += 16) {
+                _mm512_stream_ps(out + i, _mm512_loadu_ps(src + i));
+            }
+        }
+    }
+    /* streaming stores are weakly ordered, one fence per task makes them visible before the parallel barrier */
+    _mm_sfence();
+    return 0;
+}
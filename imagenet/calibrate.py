@@ -0,0 +1,113 @@
+import json
+import sys
+import numpy as np
+import mxnet as mx
+from mxnet.gluon.model_zoo.vision import get_model
+
+
+def conv_inputs(sym):
+    """Map every Convolution node to the internal output that feeds its data input."""
+    graph = json.loads(sym.tojson())
+    nodes = graph['nodes']
+    convs = []
+    for node in nodes:
+        if node['op'] != 'Convolution':
+            continue
+        src = nodes[node['inputs'][0][0]]
+        src_name = src['name'] if src['op'] == 'null' else src['name'] + '_output'
+        weight_name = nodes[node['inputs'][1][0]]['name']
+        convs.append((node['name'], src_name, weight_name))
+    return convs
+
+
+def end2end_calibrate(model, batch_size, num_images=500, percentile=99.99):
+    image_shape = (3, 224, 224)
+    data_shape = (batch_size,) + image_shape
+    mx_data = mx.nd.array(np.random.uniform(0, 255, size=data_shape).astype("float32"))
+
+    block = get_model(model, pretrained=True)
+    block.hybridize()
+    block(mx_data)
+
+    block.export("symbol/" + model)
+    sym, arg_params, aux_params = mx.model.load_checkpoint("symbol/" + model, 0)
+
+    convs = conv_inputs(sym)
+    internals = sym.get_internals()
+    outputs = [internals[src] for _, src, _ in convs]
+    calib_sym = mx.sym.Group(outputs)
+
+    data_iter = mx.io.ImageRecordIter(
+        path_imgrec="/home/ubuntu/imagenet1k/imagenet1k-val.rec",
+        data_shape=image_shape,
+        batch_size=batch_size,
+    )
+
+    mod = mx.mod.Module(symbol=calib_sym, context=mx.cpu(), label_names=None)
+    mod.bind(for_training=False, data_shapes=[('data', data_shape)])
+    mod.set_params(arg_params, aux_params, allow_missing=True)
+
+    mean = np.array([[0.485, 0.456, 0.406]])
+    std = np.array([[0.229, 0.224, 0.225]])
+    mean = np.expand_dims(np.expand_dims(mean, 2), 2)
+    std = np.expand_dims(np.expand_dims(std, 2), 2)
+
+    # per-tensor activation range, accumulated over the calibration set
+    act_max = [0.0] * len(convs)
+    act_min = [0.0] * len(convs)
+    i = 0
+    for batch in data_iter:
+        images = batch.data[0]
+        normalized = images / 255
+        normalized = mx.image.color_normalize(normalized,
+                                              mean=mx.nd.array(mean),
+                                              std=mx.nd.array(std))
+        mod.forward(mx.io.DataBatch([normalized, ]), is_train=False)
+        for j, out in enumerate(mod.get_outputs()):
+            out_np = out.asnumpy()
+            act_max[j] = max(act_max[j], float(np.percentile(out_np, percentile)))
+            act_min[j] = min(act_min[j], float(out_np.min()))
+        i += batch_size
+        if i % 100 == 0:
+            print('calibrated %d images' % i)
+        if i >= num_images:
+            break
+
+    table = {}
+    for j, (name, src, weight_name) in enumerate(convs):
+        weight = arg_params[weight_name].asnumpy()
+        # symmetric int8 weights, one scale per output channel
+        w_max = np.abs(weight.reshape(weight.shape[0], -1)).max(axis=1)
+        # uint8 activations need a non-negative input, i.e. the conv follows a relu
+        signed = act_min[j] < 0
+        table[name] = {
+            'data': src,
+            # 7 bits, the AVX2 int8 kernel's vpmaddubsw saturates on full-range uint8
+            'data_scale': act_max[j] / 127.0,
+            'data_signed': bool(signed),
+            'weight_scales': (np.maximum(w_max, 1e-8) / 127.0).tolist(),
+        }
+        print('%s: data_scale=%g signed=%s' % (name, table[name]['data_scale'], signed))
+
+    with open('calib_%s.json' % model, 'w') as fn:
+        json.dump(table, fn, indent=2)
+    return table
+
+
+def requantize_params(table, conv_name, next_conv_name, bias=None):
+    """multiplier / bias of the fused requantize epilogue, per output channel:
+    uint8_out = clip(round(acc_int32 * multiplier + bias), 0, 127), scaled for the consumer's input."""
+    entry = table[conv_name]
+    out_scale = table[next_conv_name]['data_scale']
+    w_scales = np.array(entry['weight_scales'], dtype='float32')
+    multiplier = entry['data_scale'] * w_scales / out_scale
+    if bias is None:
+        bias = np.zeros_like(multiplier)
+    else:
+        bias = np.asarray(bias, dtype='float32') / out_scale
+    return multiplier.astype('float32'), bias.astype('float32')
+
+
+if __name__ == '__main__':
+    model = sys.argv[1] if len(sys.argv) > 1 else 'resnet50_v1'
+    end2end_calibrate(model, 1)
@@ -1,20 +1,31 @@
+import os
+import sys
 import numpy as np
 import tvm
 import topi
-from tvm.contrib.pickle_memoize import memoize
 from topi.util import get_const_tuple
+from collections import namedtuple
 from topi.nn.conv2d import SpatialPack, Im2ColPack, _WORKLOADS
+from topi.nn.conv2d import Workload as _Workload
 from topi.nn.conv2d import _get_workload
 from topi.nn.util import infer_pad, infer_stride
 from topi import tag
 from topi.nn import pad
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ssd'))
+from ref_conv import ref_data
 
 device = 'llvm -mcpu=skylake-avx512'
 # device = 'llvm -mcpu=core-avx2'
 
-def _spatial_get_sch(data, kernel, stride, padding, out_dtype):
+# topi's workload plus the kernel dilation
+Workload = namedtuple('Workload', _Workload._fields + ('hdilation', 'wdilation'))
+Workload.__new__.__defaults__ = (1, 1)
+
+
+def _spatial_get_sch(data, kernel, stride, padding, out_dtype, dilation=1):
     assert data.shape[0].value == 1, "spatial pack convolution only support batch size=1"
-    return _get_workload(data, kernel, stride, padding, out_dtype)
+    wkl = _get_workload(data, kernel, stride, padding, out_dtype)
+    return Workload(*wkl, hdilation=dilation, wdilation=dilation)
 
 
 def traverse(s, op):
@@ -34,7 +45,8 @@ def _spatial_pack_data_only(wkl, sch, data):
     KH, KW = wkl.hkernel, wkl.wkernel
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
-    HCAT, WCAT = KH-1, KW-1
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
+    HCAT, WCAT = (KH-1)*HDIL, (KW-1)*WDIL
 
     VH = sch.vh
     VW = sch.vw
@@ -43,12 +55,13 @@ def _spatial_pack_data_only(wkl, sch, data):
 
     TH = H + 2*HPAD
     TW = W + 2*WPAD
-    OH = (H + 2*HPAD - KH) // HSTR + 1
-    OW = (W + 2*WPAD - KW) // WSTR + 1
+    OH = (H + 2*HPAD - HCAT - 1) // HSTR + 1
+    OW = (W + 2*WPAD - WCAT - 1) // WSTR + 1
 
     dshape = (1, CI, H, W)
     dpshape = (1, CI, TH, TW)
-    dvshape = (1, TH//(VH*HSTR), TW//(VW*WSTR), CI, VH*HSTR+HCAT, VW*WSTR+WCAT)
+    # one input window per output tile, the dilated kernel extent can exceed the padding
+    dvshape = (1, OH//VH, OW//VW, CI, VH*HSTR+HCAT, VW*WSTR+WCAT)
 
     DOPAD = (HPAD != 0 and WPAD != 0)
     if DOPAD:
@@ -89,7 +102,8 @@ def _spatial_pack_kernel_only(wkl, sch, kernel):
     KH, KW = wkl.hkernel, wkl.wkernel
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
-    HCAT, WCAT = KH-1, KW-1
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
+    HCAT, WCAT = (KH-1)*HDIL, (KW-1)*WDIL
 
     VH = sch.vh
     VW = sch.vw
@@ -98,8 +112,8 @@ def _spatial_pack_kernel_only(wkl, sch, kernel):
 
     TH = H + 2*HPAD
     TW = W + 2*WPAD
-    OH = (H + 2*HPAD - KH) // HSTR + 1
-    OW = (W + 2*WPAD - KW) // WSTR + 1
+    OH = (H + 2*HPAD - HCAT - 1) // HSTR + 1
+    OW = (W + 2*WPAD - WCAT - 1) // WSTR + 1
 
     kshape = (CO, CI, KH, KW)
     kvshape = (CO//VC, CI, KH, KW, VC)
@@ -133,7 +147,8 @@ def _spatial_conv_only(wkl, sch, data_vec, kernel_vec, out_dtype):
     KH, KW = wkl.hkernel, wkl.wkernel
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
-    HCAT, WCAT = KH - 1, KW - 1
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
+    HCAT, WCAT = (KH - 1) * HDIL, (KW - 1) * WDIL
 
     VH = sch.vh
     VW = sch.vw
@@ -142,8 +157,8 @@ def _spatial_conv_only(wkl, sch, data_vec, kernel_vec, out_dtype):
 
     TH = H + 2 * HPAD
     TW = W + 2 * WPAD
-    OH = (H + 2 * HPAD - KH) // HSTR + 1
-    OW = (W + 2 * WPAD - KW) // WSTR + 1
+    OH = (H + 2 * HPAD - HCAT - 1) // HSTR + 1
+    OW = (W + 2 * WPAD - WCAT - 1) // WSTR + 1
 
     ci = tvm.reduce_axis((0, CI), name='ci')
     dh = tvm.reduce_axis((0, KH), name='dh')
@@ -153,7 +168,7 @@ def _spatial_conv_only(wkl, sch, data_vec, kernel_vec, out_dtype):
     oshape = (1, CO, OH, OW)
 
     conv = tvm.compute(ovshape, lambda n, co, h, w, vh, vw, vc: \
-        tvm.sum(data_vec[n, h, w, ci, vh * HSTR + dh, vw * WSTR + dw].astype(out_dtype) *
+        tvm.sum(data_vec[n, h, w, ci, vh * HSTR + dh * HDIL, vw * WSTR + dw * WDIL].astype(out_dtype) *
                 kernel_vec[co, ci, dh, dw, vc].astype(out_dtype),
                 axis=[ci, dh, dw]), name='conv')
     output = tvm.compute(oshape, lambda n, co, h, w:
@@ -204,13 +219,14 @@ def _spatial_conv_only(wkl, sch, data_vec, kernel_vec, out_dtype):
     return C, s
 
 
-def _spatial_conv_all(wkl, sch, data, kernel, out_dtype):
+def _spatial_conv_all(wkl, sch, data, kernel, out_dtype, tile_pack=False):
     H, W = wkl.height, wkl.width
     CI, CO = wkl.in_filter, wkl.out_filter
     KH, KW = wkl.hkernel, wkl.wkernel
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
-    HCAT, WCAT = KH - 1, KW - 1
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
+    HCAT, WCAT = (KH - 1) * HDIL, (KW - 1) * WDIL
 
     VH = sch.vh
     VW = sch.vw
@@ -219,12 +235,13 @@ def _spatial_conv_all(wkl, sch, data, kernel, out_dtype):
 
     TH = H + 2 * HPAD
     TW = W + 2 * WPAD
-    OH = (H + 2 * HPAD - KH) // HSTR + 1
-    OW = (W + 2 * WPAD - KW) // WSTR + 1
+    OH = (H + 2 * HPAD - HCAT - 1) // HSTR + 1
+    OW = (W + 2 * WPAD - WCAT - 1) // WSTR + 1
 
     dshape = (1, CI, H, W)
     dpshape = (1, CI, TH, TW)
-    dvshape = (1, TH // (VH * HSTR), TW // (VW * WSTR), CI, VH * HSTR + HCAT, VW * WSTR + WCAT)
+    # one input window per output tile, the dilated kernel extent can exceed the padding
+    dvshape = (1, OH // VH, OW // VW, CI, VH * HSTR + HCAT, VW * WSTR + WCAT)
 
     DOPAD = (HPAD != 0 and WPAD != 0)
     if DOPAD:
@@ -249,7 +266,7 @@ def _spatial_conv_all(wkl, sch, data, kernel, out_dtype):
     oshape = (1, CO, OH, OW)
 
     conv = tvm.compute(ovshape, lambda n, co, h, w, vh, vw, vc: \
-        tvm.sum(data_vec[n, h, w, ci, vh * HSTR + dh, vw * WSTR + dw].astype(out_dtype) *
+        tvm.sum(data_vec[n, h, w, ci, vh * HSTR + dh * HDIL, vw * WSTR + dw * WDIL].astype(out_dtype) *
                 kernel_vec[co, ci, dh, dw, vc].astype(out_dtype),
                 axis=[ci, dh, dw]), name='conv')
     output = tvm.compute(oshape, lambda n, co, h, w:
@@ -315,6 +332,20 @@ def _spatial_conv_all(wkl, sch, data, kernel, out_dtype):
     n, co, h, w = s[C].op.axis
     co, vc = s[C].split(co, VC)
     oh, ow, vh, vw = s[C].tile(h, w, VH, VW)
+
+    if tile_pack:
+        # s was recreated above: padding and kernel packing are scheduled again on it
+        if DOPAD:
+            s[A0].compute_inline()
+        s[B0].parallel(s[B0].op.axis[0])
+        # one output tile per task: its input window is packed into L1/L2 and reused by all co
+        s[C].reorder(n, oh, ow, co, vh, vw, vc)
+        s[C0].compute_at(s[C], co)
+        paxis = s[C].fuse(oh, ow)
+        s[A1].compute_at(s[C], paxis)
+        s[C].parallel(paxis)
+        return C, s
+
     s[C].reorder(n, co, oh, ow, vh, vw, vc)
     # if C != C1:
     #     s[C1].compute_inline()
@@ -347,9 +378,10 @@ def _im2col_pack(wkl, sch, data, kernel, stride, padding, out_dtype):
     KH, KW = wkl.hkernel, wkl.wkernel
     HPAD, WPAD = wkl.hpad, wkl.hpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
 
-    OH = (H + 2*HPAD - KH) // HSTR + 1
-    OW = (W + 2*WPAD - KW) // WSTR + 1
+    OH = (H + 2*HPAD - (KH-1)*HDIL - 1) // HSTR + 1
+    OW = (W + 2*WPAD - (KW-1)*WDIL - 1) // WSTR + 1
 
     P = sch.vp
     Q = sch.vq
@@ -375,7 +407,7 @@ def _im2col_pack(wkl, sch, data, kernel, stride, padding, out_dtype):
         data_pad = data
 
     data_col = tvm.compute(dcshape, lambda n, oh, ow, ci, hk, wk: \
-        data_pad[n][ci][oh*HSTR+hk][ow*WSTR+wk], name='data_col')
+        data_pad[n][ci][oh*HSTR+hk*HDIL][ow*WSTR+wk*WDIL], name='data_col')
 
     data_vec = tvm.compute(dvshape, lambda n, im, ci, hk, wk, vim: \
         data_col[n][(im*P+vim)//OW][(im*P+vim)%OW][ci][hk][wk], name='data_vec')
@@ -416,8 +448,9 @@ def _schedule_im2col_conv2d(wkl, sch, s, data, data_pad, data_col, data_vec,
     HK, WK = wkl.hkernel, wkl.wkernel
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
 
-    HCAT, WCAT = HK-1, WK-1
+    HCAT, WCAT = (HK-1)*HDIL, (WK-1)*WDIL
     DOPAD = (HPAD != 0 and WPAD != 0)
 
     P = sch.vp
@@ -514,7 +547,7 @@ def _schedule_im2col_conv2d(wkl, sch, s, data, data_pad, data_col, data_vec,
     return s
 
 
-def verify_conv2d_nchw(batch, in_channel, in_size, num_filter, kernel, stride, padding, sch=None):
+def verify_conv2d_nchw(batch, in_channel, in_size, num_filter, kernel, stride, padding, sch=None, dilation=1):
     in_height = in_width = in_size
 
     def check_device():
@@ -522,22 +555,15 @@ def verify_conv2d_nchw(batch, in_channel, in_size, num_filter, kernel, stride, p
         W = tvm.placeholder((num_filter, in_channel, kernel, kernel), name='W')
 
         out_dtype = 'float32'
-        wkl = _spatial_get_sch(A, W, stride, padding, out_dtype)
+        wkl = _spatial_get_sch(A, W, stride, padding, out_dtype, dilation)
 
         a_shape = get_const_tuple(A.shape)
         w_shape = get_const_tuple(W.shape)
 
         dtype = A.dtype
 
-        @memoize("topi.tests.test_topi_conv2d.verify_con2d_nchw")
-        def get_ref_data():
-            a_np = np.random.uniform(size=a_shape).astype(dtype)
-            w_np = np.random.uniform(size=w_shape).astype(dtype)
-            b_np = topi.testing.conv2d_nchw_python(a_np, w_np, stride, padding)
-            c_np = np.maximum(b_np, 0)
-            return a_np, w_np, b_np, c_np
-
-        a_np, w_np, b_np, c_np = get_ref_data()
+        # cached on disk and memory-mapped, the large workloads are only computed once
+        a_np, w_np, b_np = ref_data(a_shape, w_shape, stride, padding, dilation, dtype=dtype)
         ctx = tvm.context(device, 0)
         a = tvm.nd.array(a_np, ctx)
         w = tvm.nd.array(w_np, ctx)
@@ -578,7 +604,8 @@ def verify_conv2d_nchw(batch, in_channel, in_size, num_filter, kernel, stride, p
     check_device()
 
 
-def verify_conv2d_nchw_all(batch, in_channel, in_size, num_filter, kernel, stride, padding, sch=None):
+def verify_conv2d_nchw_all(batch, in_channel, in_size, num_filter, kernel, stride, padding, sch=None, dilation=1,
+                           tile_pack=False):
     in_height = in_width = in_size
 
     def check_device():
@@ -586,38 +613,40 @@ def verify_conv2d_nchw_all(batch, in_channel, in_size, num_filter, kernel, strid
         W = tvm.placeholder((num_filter, in_channel, kernel, kernel), name='W')
 
         out_dtype = 'float32'
-        wkl = _spatial_get_sch(A, W, stride, padding, out_dtype)
+        wkl = _spatial_get_sch(A, W, stride, padding, out_dtype, dilation)
 
         a_shape = get_const_tuple(A.shape)
         w_shape = get_const_tuple(W.shape)
 
         dtype = A.dtype
 
-        @memoize("topi.tests.test_topi_conv2d.verify_con2d_nchw")
-        def get_ref_data():
-            a_np = np.random.uniform(size=a_shape).astype(dtype)
-            w_np = np.random.uniform(size=w_shape).astype(dtype)
-            b_np = topi.testing.conv2d_nchw_python(a_np, w_np, stride, padding)
-            c_np = np.maximum(b_np, 0)
-            return a_np, w_np, b_np, c_np
-
-        a_np, w_np, b_np, _ = get_ref_data()
+        # cached on disk and memory-mapped, the large workloads are only computed once
+        a_np, w_np, b_np = ref_data(a_shape, w_shape, stride, padding, dilation, dtype=dtype)
         ctx = tvm.context(device, 0)
         a = tvm.nd.array(a_np, ctx)
         w = tvm.nd.array(w_np, ctx)
 
         with tvm.build_config(auto_unroll_max_step=1400,
                               unroll_explicit=(device != "cuda")):
-            B, s = _spatial_conv_all(wkl, sch, A, W, out_dtype=dtype)
+            B, s = _spatial_conv_all(wkl, sch, A, W, out_dtype=dtype, tile_pack=tile_pack)
             b = tvm.nd.array(np.zeros(get_const_tuple(B.shape), dtype=B.dtype), ctx)
             func = tvm.build(s, [A, W, B], target=device)
             time_f = func.time_evaluator(func.entry_name, ctx, number=2000)
             cost = time_f(a, w, b).mean
-            print('conv all: %g secs/op' % cost)
+            print('conv all (%s pack): %g secs/op' % ('tile' if tile_pack else 'global', cost))
 
             np.testing.assert_allclose(b.asnumpy(), b_np, rtol=1e-5)
+            return cost
 
-    check_device()
+    return check_device()
+
+
+def pick_pack_strategy(*args, **kwargs):
+    """Measure the global and the tile data packing of a workload, returns True if tiles are faster."""
+    cost_global = verify_conv2d_nchw_all(*args, tile_pack=False, **kwargs)
+    cost_tile = verify_conv2d_nchw_all(*args, tile_pack=True, **kwargs)
+    print('pack strategy: %s' % ('tile' if cost_tile < cost_global else 'global'))
+    return cost_tile < cost_global
 
 
 def test_resnet_0():
@@ -626,7 +655,7 @@ def test_resnet_0():
     print('Run separately ...')
     verify_conv2d_nchw(1, 3, 224, 64, 7, 2, 3, sch)
     print('Run together ...')
-    verify_conv2d_nchw_all(1, 3, 224, 64, 7, 2, 3, sch)
+    pick_pack_strategy(1, 3, 224, 64, 7, 2, 3, sch)
 
 def test_resnet_1():
     print('MKLDNN - g1mb1_ic64ih56iw56_oc64oh56ow56_kh3kw3_sh1sw1_ph1pw1_n : 0.72514 ms')
@@ -634,9 +663,29 @@ def test_resnet_1():
     print('Run separately ...')
     verify_conv2d_nchw(1, 64, 56, 64, 3, 1, 1, sch)
     print('Run together ...')
-    verify_conv2d_nchw_all(1, 64, 56, 64, 3, 1, 1, sch)
+    pick_pack_strategy(1, 64, 56, 64, 3, 1, 1, sch)
+
+def test_vgg_fc6():
+    # atrous fc6 of the SSD 300 VGG16 backbone
+    sch = SpatialPack(vh=1, vw=19, vc=16, ba=19, bc=4, unroll=True)
+    print('Run separately ...')
+    verify_conv2d_nchw(1, 512, 19, 1024, 3, 1, 6, sch, dilation=6)
+    print('Run together ...')
+    pick_pack_strategy(1, 512, 19, 1024, 3, 1, 6, sch, dilation=6)
+
+def test_ssd_128():
+    # SSD-512 stage 1, a bandwidth-bound 128x128 map
+    sch = SpatialPack(vh=2, vw=8, vc=16, ba=64, bc=4, unroll=True)
+    print('Run separately ...')
+    verify_conv2d_nchw(1, 64, 128, 64, 3, 1, 1, sch)
+    print('Run together ...')
+    pick_pack_strategy(1, 64, 128, 64, 3, 1, 1, sch)
 
 if __name__ == "__main__":
     test_resnet_0()
     print('\n')
     test_resnet_1()
+    print('\n')
+    test_vgg_fc6()
+    print('\n')
+    test_ssd_128()
@@ -21,9 +21,9 @@ A = tvm.placeholder((N, N), name = 'A')
 B = tvm.placeholder((N, N), name = 'B')
 
 bn = 8
-packedB = tvm.compute((N / bn, N, bn), lambda x, y, z: B[y, x * bn + z], name = 'packedB')
+packedB = tvm.compute((N // bn, N, bn), lambda x, y, z: B[y, x * bn + z], name = 'packedB')
 C = tvm.compute(A.shape,
-                lambda x, y: tvm.sum(A[x, k] * packedB[y / bn, k, y % bn], axis = k),
+                lambda x, y: tvm.sum(A[x, k] * packedB[y // bn, k, y % bn], axis = k),
                 name = 'C')
 
 # Same schedule
@@ -1,8 +1,13 @@
 #!/usr/bin/env bash
+# NUMA=1 ./bench.sh runs one instance per socket with NUM_THREADS threads each
 for NUM_THREADS in {18..1}
 do
     echo "nthreads = $NUM_THREADS"
-    KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=$NUM_THREADS OMP_NUM_THREADS=$NUM_THREADS \
-    python test_topi_dev.py
+    if [ "$NUMA" == "1" ]; then
+        python numa_launch.py --threads $NUM_THREADS test_topi_dev.py
+    else
+        KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=$NUM_THREADS OMP_NUM_THREADS=$NUM_THREADS \
+        python test_topi_dev.py
+    fi
     sleep 5
-done
\ No newline at end of file
+done
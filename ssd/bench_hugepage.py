@@ -0,0 +1,25 @@
+import subprocess
+import sys
+
+from hugepage import disable_thp, free_hugepages, hugepage_env, malloc_hugetlb_supported, thp_disable_supported, \
+    thp_mode
+
+
+def run(env=None, preexec_fn=None):
+    out = subprocess.check_output([sys.executable, 'test_topi_dev.py'], env=env, preexec_fn=preexec_fn,
+                                  universal_newlines=True)
+    return [line for line in out.splitlines() if 'inference time' in line]
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=18 OMP_NUM_THREADS=18 python bench_hugepage.py
+    explicit = '--explicit' in sys.argv
+    print('THP: %s, free explicit huge pages: %d' % (thp_mode(), free_hugepages()))
+    if not thp_disable_supported():
+        print('WARNING: no PR_SET_THP_DISABLE, with THP "always" the regular pages run gets huge pages too')
+    if not malloc_hugetlb_supported():
+        print('WARNING: glibc < 2.35 ignores glibc.malloc.hugetlb, the huge pages run only gets them from THP "always"')
+    print('--- regular pages ---')
+    print('\n'.join(run(preexec_fn=disable_thp)))
+    print('--- %s huge pages ---' % ('explicit' if explicit else 'transparent'))
+    print('\n'.join(run(hugepage_env(explicit))))
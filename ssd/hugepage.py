@@ -0,0 +1,64 @@
+"""2MB huge pages for packed weights and activations.
+
+TVM's buffers (graph runtime storage, params copied in by set_input) come from posix_memalign, they
+are moved to huge pages by launching the process with hugepage_env(): explicit huge pages from the
+HugePages pool or transparent huge pages. disable_thp() gives the regular pages baseline.
+"""
+import ctypes
+import os
+
+_PR_SET_THP_DISABLE = 41
+_PR_GET_THP_DISABLE = 42
+
+
+def thp_mode():
+    """'always', 'madvise' or 'never', None if the kernel has no transparent huge pages or selects no mode"""
+    try:
+        with open('/sys/kernel/mm/transparent_hugepage/enabled') as fn:
+            modes = fn.read().split()
+    except IOError:
+        return None
+    selected = [m.strip('[]') for m in modes if m.startswith('[')]
+    return selected[0] if selected else None
+
+
+def free_hugepages():
+    """Free pages in the explicit HugePages pool (vm.nr_hugepages)"""
+    with open('/proc/meminfo') as fn:
+        for line in fn:
+            if line.startswith('HugePages_Free:'):
+                return int(line.split()[1])
+    return 0
+
+
+def _prctl(option, arg):
+    libc = ctypes.CDLL(None, use_errno=True)
+    return libc.prctl(option, ctypes.c_ulong(arg), ctypes.c_ulong(0), ctypes.c_ulong(0), ctypes.c_ulong(0))
+
+
+def thp_disable_supported():
+    """Whether the kernel can turn THP off per process (PR_SET_THP_DISABLE, Linux >= 3.15)"""
+    return _prctl(_PR_GET_THP_DISABLE, 0) >= 0
+
+
+def disable_thp():
+    """Turns THP off for this process, inherited by its children and kept across exec. Used as the
+    preexec_fn of a regular pages baseline: with THP 'always' glibc's large mallocs get huge pages anyway."""
+    _prctl(_PR_SET_THP_DISABLE, 1)
+
+
+def malloc_hugetlb_supported():
+    """Whether glibc has the glibc.malloc.hugetlb tunable hugepage_env sets (glibc >= 2.35)"""
+    try:
+        name, version = os.confstr('CS_GNU_LIBC_VERSION').split()
+    except (ValueError, OSError, AttributeError):
+        return False
+    return name == 'glibc' and tuple(int(x) for x in version.split('.')[:2]) >= (2, 35)
+
+
+def hugepage_env(explicit=False):
+    """Environment for a child process whose malloc / posix_memalign use huge pages (glibc >= 2.35):
+    1 madvises every allocation for THP, 2 takes them from the explicit HugePages pool."""
+    env = dict(os.environ)
+    env['GLIBC_TUNABLES'] = 'glibc.malloc.hugetlb=%d' % (2 if explicit else 1)
+    return env
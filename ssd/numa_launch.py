@@ -0,0 +1,112 @@
+"""One model instance per NUMA node.
+
+Each instance runs with its threads and its memory bound to one socket, so the packed weights it
+loads (first touch from a bound thread) are replicated in every socket's local memory and no
+conv reads weights across the interconnect.
+
+    python numa_launch.py test_topi_dev.py
+    python numa_launch.py --threads 16 test_topi_dev.py
+"""
+import glob
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+_SYSFS_NODE = '/sys/devices/system/node'
+
+
+def _parse_cpulist(text):
+    cpus = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-')
+            cpus.extend(range(int(lo), int(hi) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def _physical_cpus(cpus):
+    """One logical cpu per core, the hyperthread siblings are dropped"""
+    physical = []
+    seen = set()
+    for cpu in cpus:
+        path = '/sys/devices/system/cpu/cpu%d/topology/thread_siblings_list' % cpu
+        try:
+            with open(path) as fn:
+                siblings = tuple(_parse_cpulist(fn.read()))
+        except IOError:
+            siblings = (cpu, )
+        if siblings not in seen:
+            seen.add(siblings)
+            physical.append(cpu)
+    return physical
+
+
+def numa_nodes():
+    """[(node id, physical cpus of the node)], a single node holding every cpu on non-NUMA hosts"""
+    nodes = []
+    for path in sorted(glob.glob(os.path.join(_SYSFS_NODE, 'node[0-9]*')),
+                       key=lambda p: int(re.findall(r'\d+$', p)[0])):
+        with open(os.path.join(path, 'cpulist')) as fn:
+            cpus = _parse_cpulist(fn.read())
+        if cpus:
+            nodes.append((int(re.findall(r'\d+$', path)[0]), _physical_cpus(cpus)))
+    if not nodes:
+        with open('/sys/devices/system/cpu/online') as fn:
+            nodes = [(0, _physical_cpus(_parse_cpulist(fn.read())))]
+    return nodes
+
+
+def _bind_command(node, cpus, have_numactl):
+    cpulist = ','.join(str(c) for c in cpus)
+    if have_numactl:
+        return ['numactl', '--physcpubind=%s' % cpulist, '--membind=%d' % node]
+    # default local allocation: memory first touched by the bound threads stays on the node
+    return ['taskset', '-c', cpulist]
+
+
+def launch(script, num_threads=None, work_dir=None):
+    """Start script once per node, from the script's directory (it loads the model by relative path).
+    Each instance gets its own work_dir/node<id> as TOPI_OUT_DIR, where the script writes its outputs,
+    and TMPDIR, so the instances never write over each other's files. Returns [(node, Popen)]"""
+    have_numactl = subprocess.call(['which', 'numactl'], stdout=open(os.devnull, 'w')) == 0
+    work_dir = work_dir or tempfile.mkdtemp(prefix='numa_launch.')
+    script = os.path.abspath(script)
+    procs = []
+    for node, cpus in numa_nodes():
+        cpus = cpus[:num_threads] if num_threads else cpus
+        out_dir = os.path.join(work_dir, 'node%d' % node)
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        env = dict(os.environ)
+        env['TVM_NUM_THREADS'] = env['OMP_NUM_THREADS'] = str(len(cpus))
+        env['KMP_AFFINITY'] = 'granularity=fine,compact,1,0'
+        env['TOPI_OUT_DIR'] = env['TMPDIR'] = out_dir
+        cmd = _bind_command(node, cpus, have_numactl) + [sys.executable, script]
+        procs.append((node, subprocess.Popen(cmd, env=env, cwd=os.path.dirname(script), stdout=subprocess.PIPE,
+                                             universal_newlines=True)))
+    return procs
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    num_threads = None
+    if args and args[0] == '--threads':
+        num_threads, args = int(args[1]), args[2:]
+    script = args[0] if args else 'test_topi_dev.py'
+    print('NUMA nodes: %s' % ', '.join('%d (%d cores)' % (n, len(c)) for n, c in numa_nodes()))
+    failed = []
+    for node, proc in launch(script, num_threads):
+        out, _ = proc.communicate()
+        for line in out.splitlines():
+            if 'inference time' in line:
+                print('node %d: %s' % (node, line))
+        if proc.returncode != 0:
+            print('node %d: %s exited with %d' % (node, script, proc.returncode))
+            failed.append(node)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,98 @@
+"""Vectorized NumPy reference convolution for the verify scripts.
+
+The padded input is viewed as im2col columns (n, ic, kh, kw, oh, ow) through strides, no copy, and
+contracted with the kernel by tensordot, which goes to BLAS for float inputs. Reference data is
+cached as .npy files and memory-mapped back, a workload is only ever computed once.
+"""
+import os
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+REF_DIR = os.environ.get('TOPI_REF_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'topi-intel', 'ref'))
+
+
+def _columns(a_pad, kh, kw, oh, ow, stride, dilation):
+    """(n, ic, kh, kw, oh, ow) view of the padded input"""
+    sn, sc, sh, sw = a_pad.strides
+    return as_strided(a_pad, shape=(a_pad.shape[0], a_pad.shape[1], kh, kw, oh, ow),
+                      strides=(sn, sc, sh * dilation, sw * dilation, sh * stride, sw * stride), writeable=False)
+
+
+def conv2d_nchw(a_np, w_np, stride, padding, dilation=1, groups=1, out_dtype=None):
+    """NCHW input, OIHW kernel (I = in_channel / groups), NCHW output"""
+    n, ic, h, w = a_np.shape
+    oc, ipg, kh, kw = w_np.shape
+    opg = oc // groups
+    out_dtype = out_dtype or ('int32' if a_np.dtype.kind in 'iu' else a_np.dtype)
+    oh = (h + 2 * padding - (kh - 1) * dilation - 1) // stride + 1
+    ow = (w + 2 * padding - (kw - 1) * dilation - 1) // stride + 1
+    a_pad = np.pad(a_np.astype(out_dtype), ((0, 0), (0, 0), (padding, padding), (padding, padding)), 'constant')
+    cols = _columns(a_pad, kh, kw, oh, ow, stride, dilation)
+    w_np = w_np.astype(out_dtype)
+    if groups == 1:
+        return np.tensordot(w_np, cols, axes=([1, 2, 3], [1, 2, 3])).transpose(1, 0, 2, 3)
+    cols = cols.reshape(n, groups, ipg, kh, kw, oh, ow)
+    return np.einsum('gocyx,ngcyxhw->ngohw', w_np.reshape(groups, opg, ipg, kh, kw), cols,
+                     optimize=True).reshape(n, oc, oh, ow)
+
+
+def nchw_to_nchwc(x, bn):
+    n, c, h, w = x.shape
+    return x.reshape(n, c // bn, bn, h, w).transpose(0, 1, 3, 4, 2)
+
+
+def nchwc_to_nchw(x):
+    n, chunk, h, w, bn = x.shape
+    return x.transpose(0, 1, 4, 2, 3).reshape(n, chunk * bn, h, w)
+
+
+def oihw_to_packed(w_np, ic_bn, oc_bn):
+    """OIHW kernel to the (oc_chunk, ic_chunk, kh, kw, ic_bn, oc_bn) layout of the packed convs"""
+    oc, ic, kh, kw = w_np.shape
+    return w_np.reshape(oc // oc_bn, oc_bn, ic // ic_bn, ic_bn, kh, kw).transpose(0, 2, 4, 5, 3, 1)
+
+
+def oihw_to_packed_1x1(w_np, ic_bn, oc_bn):
+    """OIHW 1x1 kernel to the (oc_chunk, ic_chunk, ic_bn, oc_bn, 1, 1) layout of the packed 1x1 convs"""
+    oc, ic, kh, kw = w_np.shape
+    return w_np.reshape(oc // oc_bn, oc_bn, ic // ic_bn, ic_bn, kh, kw).transpose(0, 2, 3, 1, 4, 5)
+
+
+def packed_to_oihw(w_vec):
+    oc_chunk, ic_chunk, kh, kw, ic_bn, oc_bn = w_vec.shape
+    return w_vec.transpose(0, 5, 1, 4, 2, 3).reshape(oc_chunk * oc_bn, ic_chunk * ic_bn, kh, kw)
+
+
+def conv2d_nchwc(a_vec, w_vec, stride, padding, dilation=1, groups=1, out_dtype=None):
+    """NCHW[x]c input, packed kernel, NCHW[oc_bn]c output"""
+    out = conv2d_nchw(nchwc_to_nchw(a_vec), packed_to_oihw(w_vec), stride, padding, dilation, groups, out_dtype)
+    return nchw_to_nchwc(out, w_vec.shape[5])
+
+
+def _random(shape, dtype, rng):
+    if dtype == 'uint8':
+        return rng.randint(0, 256, size=shape).astype(dtype)
+    if dtype == 'int8':
+        return rng.randint(-127, 128, size=shape).astype(dtype)
+    return rng.uniform(size=shape).astype(dtype)
+
+
+def ref_data(a_shape, w_shape, stride, padding, dilation=1, groups=1, dtype='float32', w_dtype=None, seed=0,
+             ref_dir=REF_DIR):
+    """(input, kernel, output) of a seeded random NCHW conv, read-only memory-mapped arrays"""
+    w_dtype = w_dtype or dtype
+    key = 'a%s_w%s_s%d_p%d_d%d_g%d_%s_%s_seed%d' % ('x'.join(map(str, a_shape)), 'x'.join(map(str, w_shape)),
+                                                 stride, padding, dilation, groups, dtype, w_dtype, seed)
+    paths = [os.path.join(ref_dir, '%s.%s.npy' % (key, name)) for name in ('a', 'w', 'out')]
+    if not all(os.path.exists(path) for path in paths):
+        if not os.path.isdir(ref_dir):
+            os.makedirs(ref_dir)
+        rng = np.random.RandomState(seed)
+        a_np = _random(a_shape, dtype, rng)
+        w_np = _random(w_shape, w_dtype, rng)
+        out = conv2d_nchw(a_np, w_np, stride, padding, dilation, groups)
+        for path, value in zip(paths, (a_np, w_np, out)):
+            # written under a temporary name, a concurrent reader never maps a partial file
+            np.save(path + '.tmp.npy', value)
+            os.rename(path + '.tmp.npy', path)
+    return tuple(np.load(path, mmap_mode='r') for path in paths)
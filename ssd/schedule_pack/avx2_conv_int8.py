@@ -0,0 +1,185 @@
+from __future__ import absolute_import as _abs
+import tvm
+from topi.util import get_const_tuple
+from collections import namedtuple
+
+from topi.nn.conv2d import _get_schedule
+from topi.nn.pad import pad
+
+# uint8 data x int8 kernel -> int32, 4 input channels are reduced per int32 lane
+AVX2Int8ConvCommonFwd = namedtuple('AVX2Int8ConvCommonFwd',
+                                   ['ic_bn', 'oc_bn', 'reg_n', 'unroll_kw', 'layout_in', 'layout_out'])
+
+# one ymm register of int32 accumulators
+int32_lanes = 8
+num_int8_elements = 4
+# activations are quantized to 7 bits: vpmaddubsw adds two u8 x s8 products into a saturating int16,
+# 2 * 127 * 127 fits in it, 2 * 255 * 127 does not
+data_max = 127
+
+
+def _intrin_reduce4int8_avx2():
+    """u8x4 . s8x(8x4) -> s32x8 with vpmaddubsw + vpmaddwd (no VNNI required), data is at most data_max"""
+    data = tvm.placeholder((num_int8_elements,), dtype='uint8', name='data')
+    kernel = tvm.placeholder((int32_lanes, num_int8_elements), dtype='int8', name='kernel')
+    k = tvm.reduce_axis((0, num_int8_elements), name='k')
+    C = tvm.compute((int32_lanes,),
+                    lambda i: tvm.sum(data[k].astype('int32') * kernel[i, k].astype('int32'), axis=k),
+                    name='C')
+
+    a_buffer = tvm.decl_buffer(data.shape, dtype='uint8', name='a_buffer', offset_factor=1, strides=[1])
+    b_buffer = tvm.decl_buffer(kernel.shape, dtype='int8', name='b_buffer', offset_factor=1,
+                               strides=[tvm.var('ldw'), 1])
+
+    def _intrin_func(ins, outs):
+        def _instr(index):
+            ib = tvm.ir_builder.create()
+            if index == 1:
+                ib.emit(outs[0].vstore(0, tvm.const(0, 'int32x%d' % int32_lanes)))
+                return ib.get()
+
+            a_int8 = ins[0].vload([0], 'uint8x4')
+            re_int32 = tvm.call_pure_intrin('int32', 'reinterpret', a_int8)
+            vec_ai32 = re_int32.astype('int32x%d' % int32_lanes)
+            vec_a = tvm.call_pure_intrin('int8x32', 'reinterpret', vec_ai32)
+            vec_b = ins[1].vload([0, 0], 'int8x32')
+            vec_one = tvm.const(1, 'int16x16')
+            pair_reduction = tvm.call_llvm_intrin('int16x16', 'llvm.x86.avx2.pmadd.ub.sw',
+                                                  tvm.const(0, 'uint32'), vec_a, vec_b)
+            quad_reduction = tvm.call_llvm_intrin('int32x8', 'llvm.x86.avx2.pmadd.wd',
+                                                  tvm.const(0, 'uint32'), pair_reduction, vec_one)
+            if index == 0:
+                ib.emit(outs[0].vstore(0, quad_reduction))
+            else:
+                ib.emit(outs[0].vstore(0, quad_reduction + outs[0].vload([0], 'int32x%d' % int32_lanes)))
+            return ib.get()
+
+        # body, reset, update
+        return _instr(0), _instr(1), _instr(2)
+
+    with tvm.build_config(offset_factor=1, partition_const_loop=True):
+        return tvm.decl_tensor_intrin(C.op, _intrin_func, binds={data: a_buffer, kernel: b_buffer})
+
+
+def _declaration_quantize(data, scale, name='data_quantize'):
+    # float32 activation -> uint8 in [0, data_max], scale is per-tensor
+    return tvm.compute(data.shape, lambda *i:
+                       tvm.max(tvm.min(tvm.floor(data(*i) / scale + 0.5), float(data_max)), 0.0).astype('uint8'),
+                       name=name, tag='quantize')
+
+
+def _declaration_kernel_pack(sch, kernel):
+    # (oc, ic, h, w) int8 -> (OC, IC, h, w, ic//4, oc, 4)
+    num_filter, in_channel, kernel_height, kernel_width = get_const_tuple(kernel.shape)
+    shape = (num_filter // sch.oc_bn, in_channel // sch.ic_bn, kernel_height, kernel_width,
+             sch.ic_bn // num_int8_elements, sch.oc_bn, num_int8_elements)
+    return tvm.compute(shape, lambda OC, IC, h, w, ic_f, oc, ic_s:
+                       kernel[OC * sch.oc_bn + oc,
+                              IC * sch.ic_bn + ic_f * num_int8_elements + ic_s, h, w],
+                       name='kernel_pack', tag='conv2d_int8_kernel_pack')
+
+
+def _declaration_conv(wkl, data, kernel, requantize=None):
+    """data is NCHW[ic_bn]c uint8 in [0, data_max], kernel comes from _declaration_kernel_pack.
+    requantize is an optional (multiplier, bias) pair of float32 (OC, oc_bn) tensors:
+    out = clip(round(acc * multiplier + bias), 0, data_max) as uint8, so the next layer reads it directly.
+    """
+    sch = _get_schedule(wkl)
+    assert wkl.groups == 1, "grouped conv is not supported by the int8 kernel"
+
+    HPAD, WPAD = wkl.hpad, wkl.wpad
+    HSTR, WSTR = wkl.hstride, wkl.wstride
+
+    batch_size, in_channel_chunk, in_height, in_width, in_channel_block = get_const_tuple(data.shape)
+    assert in_channel_block == sch.ic_bn and sch.ic_bn % num_int8_elements == 0
+    assert sch.oc_bn % int32_lanes == 0
+    num_filter, _, kernel_height, kernel_width, _, co, _ = get_const_tuple(kernel.shape)
+    num_filter *= co
+
+    out_height = (in_height + 2 * HPAD - kernel_height) // HSTR + 1
+    out_width = (in_width + 2 * WPAD - kernel_width) // WSTR + 1
+
+    DOPAD = (HPAD != 0 and WPAD != 0)
+    if DOPAD:
+        # zero point of uint8 activations is 0
+        data_pad = pad(data, (0, 0, HPAD, WPAD, 0), name="data_pad")
+    else:
+        data_pad = data
+
+    oshape = (batch_size, num_filter // sch.oc_bn, out_height, out_width, sch.oc_bn)
+
+    ic_outer = tvm.reduce_axis((0, in_channel_chunk), name='ic_outer')
+    ic_f_inner = tvm.reduce_axis((0, sch.ic_bn // num_int8_elements), name='ic_f_inner')
+    ic_s_inner = tvm.reduce_axis((0, num_int8_elements), name='ic_s_inner')
+    kh = tvm.reduce_axis((0, kernel_height), name='kh')
+    kw = tvm.reduce_axis((0, kernel_width), name='kw')
+
+    conv = tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
+        tvm.sum(data_pad[n, ic_outer, oh * HSTR + kh, ow * WSTR + kw,
+                         ic_f_inner * num_int8_elements + ic_s_inner].astype('int32') *
+                kernel[oc_chunk, ic_outer, kh, kw, ic_f_inner, oc_block, ic_s_inner].astype('int32'),
+                axis=[ic_outer, kh, kw, ic_f_inner, ic_s_inner]),
+                       name='conv2d', tag='conv2d_nChwc_int8')
+    if requantize is None:
+        return conv
+
+    multiplier, bias = requantize
+    return tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
+        tvm.max(tvm.min(tvm.floor(conv[n, oc_chunk, oh, ow, oc_block].astype('float32') *
+                                  multiplier[oc_chunk, oc_block] + bias[oc_chunk, oc_block] + 0.5),
+                        float(data_max)), 0.0).astype('uint8'),
+                       name='output_requantize', tag='conv2d_nChwc_int8_requantize')
+
+
+def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, last):
+    sch = _get_schedule(wkl)
+
+    HPAD, WPAD = wkl.hpad, wkl.wpad
+    DOPAD = (HPAD != 0 and WPAD != 0)
+
+    if DOPAD and data_pad is not None:
+        s[data_pad].compute_inline()
+
+    C, O0, O = conv_out, output, last
+    CC = s.cache_write(C, 'global')
+
+    _, oc_chunk, oh, ow, oc_block = s[C].op.axis
+    ow_chunk, ow_block = s[C].split(ow, factor=sch.reg_n)
+    s[C].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
+    parallel_axis = s[C].fuse(oc_chunk, oh)
+    s[C].vectorize(oc_block)
+    if C == O:
+        s[C].parallel(parallel_axis)
+
+    s[CC].compute_at(s[C], ow_chunk)
+    _, oc_chunk, oh, ow, oc_block = s[CC].op.axis
+    ic_outer, kh, kw, ic_f_inner, ic_s_inner = s[CC].op.reduce_axis
+
+    ow_chunk, ow_block = s[CC].split(ow, factor=sch.reg_n)
+    oc_f_inner, oc_s_inner = s[CC].split(oc_block, factor=int32_lanes)
+
+    if sch.unroll_kw:
+        s[CC].reorder(oc_chunk, oh, ow_chunk, ic_outer, kh, ic_f_inner, kw,
+                      ow_block, oc_f_inner, oc_s_inner, ic_s_inner)
+        s[CC].unroll(kw)
+    else:
+        s[CC].reorder(oc_chunk, oh, ow_chunk, ic_outer, kh, kw, ic_f_inner,
+                      ow_block, oc_f_inner, oc_s_inner, ic_s_inner)
+
+    s[CC].tensorize(oc_s_inner, _intrin_reduce4int8_avx2())
+    s[CC].unroll(ow_block)
+    s[CC].unroll(oc_f_inner)
+
+    if O0 != O:
+        s[O0].compute_inline()
+
+    if C != O:
+        batch, oc_chunk, oh, ow, oc_block = s[O].op.axis
+        ow_chunk, ow_block = s[O].split(ow, factor=sch.reg_n)
+        s[O].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
+        parallel_axis = s[O].fuse(oc_chunk, oh)
+        s[C].compute_at(s[O], parallel_axis)
+        s[O].vectorize(oc_block)
+        s[O].parallel(parallel_axis)
+
+    return s
@@ -10,13 +10,23 @@ from topi.nn.pad import pad
 
 from collections import namedtuple
 
+from .weight_precision import _weight_load, _weight_pair_load
+from .workload import _group_in_channel
+from .stream_store import use_stream_store, cache_stream_output, _schedule_stream_store
+
+# prefetch: software prefetch of the kernel block and the input channels this many ic_chunk iterations
+# ahead, 0 leaves it to the hardware prefetcher
+# nt_store: write large outputs with non-temporal stores, see stream_store.py
 AVX512Conv1x1Fwd = namedtuple('AVX512Conv1x1Fwd',
-                              ['ic_bn', 'oc_bn', 'oh_factor', 'ow_factor', 'layout_in', 'layout_out'])
+                              ['ic_bn', 'oc_bn', 'oh_factor', 'ow_factor', 'layout_in', 'layout_out',
+                               'weight_dtype', 'prefetch', 'nt_store'])
+AVX512Conv1x1Fwd.__new__.__defaults__ = ('float32', 0, False)
 
 
-def _declaration_conv(wkl, data, kernel):
+def _declaration_conv(wkl, data, kernel, sch=None):
     assert data.shape[0].value == 1, "only support batch size=1 convolution on rasp"
-    sch = _get_schedule(wkl)
+    if sch is None:
+        sch = _get_schedule(wkl)
 
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
@@ -31,7 +41,7 @@ def _declaration_conv(wkl, data, kernel):
         in_channel_block = 0
         batch_size, in_channel, in_height, in_width = get_const_tuple(data.shape)
 
-    num_filter, _, _, co, kernel_height, kernel_width = get_const_tuple(kernel.shape)
+    num_filter, _, kernel_ic_bn, co, kernel_height, kernel_width = get_const_tuple(kernel.shape)
     num_filter *= co
 
     pad_height = in_height + 2 * HPAD
@@ -69,16 +79,26 @@ def _declaration_conv(wkl, data, kernel):
         data_vec = data_pad
 
     kernel_vec = kernel
+    if sch.weight_dtype != 'float32' and kernel.dtype == 'float32':
+        # graph kernel, weights stored pairwise in float32 words (weight_precision._declaration_weight_pair)
+        kernel_load = lambda oc_chunk, ic, oc_block: _weight_pair_load(
+            kernel_vec[oc_chunk, ic // kernel_ic_bn, ic % kernel_ic_bn // 2, oc_block, 0, 0], ic % 2 == 1,
+            sch.weight_dtype)
+    else:
+        kernel_load = lambda oc_chunk, ic, oc_block: _weight_load(
+            kernel_vec[oc_chunk, ic // kernel_ic_bn, ic % kernel_ic_bn, oc_block, 0, 0], sch.weight_dtype)
 
     oshape = (batch_size, num_filter // sch.oc_bn, out_height, out_width, sch.oc_bn)
-    ic = tvm.reduce_axis((0, in_channel), name='ic')
+    # grouped conv: reduce over the group's input channels only
+    ic = tvm.reduce_axis((0, in_channel // wkl.groups), name='ic')
+    ic_in = lambda oc_chunk, oc_block, ic: _group_in_channel(wkl, sch.oc_bn, oc_chunk, oc_block, ic)
 
     import re
     unpack_channel_block = re.findall(r'\d+', sch.layout_out)
     if len(unpack_channel_block) == 0:
         conv = tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
-        tvm.sum(data_vec[n, ic // sch.ic_bn, oh * HSTR, ow * WSTR, ic % sch.ic_bn] *
-                kernel_vec[oc_chunk, ic // sch.ic_bn, ic % sch.ic_bn, oc_block, 0, 0],
+        tvm.sum(data_vec[n, ic_in(oc_chunk, oc_block, ic) // sch.ic_bn, oh * HSTR, ow * WSTR, ic_in(oc_chunk, oc_block, ic) % sch.ic_bn] *
+                kernel_load(oc_chunk, ic, oc_block),
                 axis=[ic]), name='conv2d') # tag='conv2d_nChwc')
         unpack_shape = (batch_size, num_filter, out_height, out_width)
         unpack = tvm.compute(unpack_shape,
@@ -90,13 +110,13 @@ def _declaration_conv(wkl, data, kernel):
         unpack_channel_block = int(unpack_channel_block[0])
         if unpack_channel_block == sch.oc_bn:
             return tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
-                    tvm.sum(data_vec[n, ic // sch.ic_bn, oh * HSTR, ow * WSTR, ic % sch.ic_bn] *
-                    kernel_vec[oc_chunk, ic // sch.ic_bn, ic % sch.ic_bn, oc_block, 0, 0],
+                    tvm.sum(data_vec[n, ic_in(oc_chunk, oc_block, ic) // sch.ic_bn, oh * HSTR, ow * WSTR, ic_in(oc_chunk, oc_block, ic) % sch.ic_bn] *
+                    kernel_load(oc_chunk, ic, oc_block),
                     axis=[ic]), name='conv2d', tag='conv2d_nChwc')
         else:
             conv = tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
-                    tvm.sum(data_vec[n, ic // sch.ic_bn, oh * HSTR, ow * WSTR, ic % sch.ic_bn] *
-                    kernel_vec[oc_chunk, ic // sch.ic_bn, ic % sch.ic_bn, oc_block, 0, 0],
+                    tvm.sum(data_vec[n, ic_in(oc_chunk, oc_block, ic) // sch.ic_bn, oh * HSTR, ow * WSTR, ic_in(oc_chunk, oc_block, ic) % sch.ic_bn] *
+                    kernel_load(oc_chunk, ic, oc_block),
                     axis=[ic]), name='conv2d')  # tag='conv2d_nChwc')
             unpack_shape = (batch_size, num_filter // unpack_channel_block, out_height, out_width, unpack_channel_block)
             unpack = tvm.compute(unpack_shape,
@@ -108,8 +128,9 @@ def _declaration_conv(wkl, data, kernel):
     return unpack
 
 
-def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, last):
-    sch = _get_schedule(wkl)
+def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, last, sch=None):
+    if sch is None:
+        sch = _get_schedule(wkl)
 
     HPAD, WPAD = wkl.hpad, wkl.wpad
     DOPAD = (HPAD != 0 and WPAD != 0)
@@ -127,13 +148,18 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
     C, O0, O = conv_out, output, last
     CC = s.cache_write(C, 'global')
 
+    # the output block of one task, oh_factor rows of one oc_chunk
+    block = (1, sch.oh_factor, get_const_tuple(C.shape)[3])
     batch, oc_chunk, oh, ow, oc_block = s[C].op.axis
     oh_outer, oh_inner = s[C].split(oh, factor=sch.oh_factor)
     ow_outer, ow_inner = s[C].split(ow, factor=sch.ow_factor)
     s[C].reorder(oc_chunk, oh_outer, ow_outer, oh_inner, ow_inner, oc_block)
-    s[C].vectorize(oc_block)
-
     parallel_axis = s[C].fuse(oc_chunk, oh_outer)
+    if C == O and use_stream_store(sch, C, block):
+        _schedule_stream_store(s, C, ow_outer, block)
+    else:
+        s[C].vectorize(oc_block)
+
     s[CC].compute_at(s[C], parallel_axis)
     if C == O:
         s[C].parallel(parallel_axis)
@@ -141,7 +167,8 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
     _, oc_chunk, oh, ow, oc_block = s[CC].op.axis
     ic, = s[CC].op.reduce_axis
 
-    ic_chunk, ic_block = s[CC].split(ic, factor=sch.ic_bn)
+    # a grouped conv only reduces over in_filter / groups channels
+    ic_chunk, ic_block = s[CC].split(ic, factor=min(sch.ic_bn, wkl.in_filter // wkl.groups))
 
     oh_outer, oh_inner = s[CC].split(oh, factor=sch.oh_factor)
     ow_outer, ow_inner = s[CC].split(ow, factor=sch.ow_factor)
@@ -152,12 +179,16 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
 
     s[CC].unroll(ow_inner)
     s[CC].unroll(oh_inner)
+    if sch.prefetch:
+        s[CC].prefetch(kernel, ic_chunk, sch.prefetch)
+        s[CC].prefetch(A1, ic_chunk, sch.prefetch)
 
     if O0 != O:
         s[O0].compute_inline()
 
     if C != O:
         if len(s[O].op.axis) == 5:
+            OL = cache_stream_output(s, sch, O, block)
             batch, oc_chunk, oh, ow, oc_block = s[O].op.axis
             oh_outer, oh_inner = s[O].split(oh, factor=sch.oh_factor)
             ow_outer, ow_inner = s[O].split(ow, factor=sch.ow_factor)
@@ -166,8 +197,14 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
             parallel_axis = s[O].fuse(oc_chunk, oh_outer)
             s[C].compute_at(s[O], parallel_axis)
 
-            _, oc_block = s[O].split(oc_block, factor=sch.oc_bn)
-            s[O].vectorize(oc_block)
+            if OL is None:
+                _, oc_block = s[O].split(oc_block, factor=sch.oc_bn)
+                s[O].vectorize(oc_block)
+            else:
+                # the fused ops of the task's block are computed in OL, O stores it at once
+                s[OL].compute_at(s[O], parallel_axis)
+                s[OL].vectorize(s[OL].op.axis[4])
+                _schedule_stream_store(s, O, ow_outer, block)
 
             s[O].parallel(parallel_axis)
         else:
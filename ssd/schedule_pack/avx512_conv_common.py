@@ -9,15 +9,32 @@ from topi.nn.conv2d import _get_schedule
 from topi.nn.conv2d import _get_workload
 from topi.nn.pad import pad
 
+from .weight_precision import _weight_load
+from .workload import _group_in_channel
+from .stream_store import use_stream_store, cache_stream_output, _schedule_stream_store
+
+# tile_pack: pack the input rows of one output row right before they are used, so the padded / repacked
+# data only lives in L1/L2. False packs the whole input into DRAM first, None (the default) leaves the
+# choice to _get_schedule_conv, see _pick_tile_pack.
+# oh_tile, ow_tile, ic_tile: L2 blocking for large feature maps, 0 sweeps whole output rows. A task is an
+# oh_tile x ow_tile output tile whose accumulators stay in cache while ic is swept ic_tile chunks at a
+# time, see _l2_tile_candidates for the working set.
+# prefetch: software prefetch of the next kernel block and input rows this many ic_chunk iterations ahead
+# nt_store: write large outputs with non-temporal stores, see stream_store.py
 AVX512ConvCommonFwd = namedtuple('AVX512ConvCommonFwd',
-                                 ['ic_bn', 'oc_bn', 'reg_n', 'unroll_kw', 'layout_in', 'layout_out'])
+                                 ['ic_bn', 'oc_bn', 'reg_n', 'unroll_kw', 'layout_in', 'layout_out',
+                                  'weight_dtype', 'tile_pack', 'oh_tile', 'ow_tile', 'ic_tile', 'prefetch',
+                                  'nt_store'])
+AVX512ConvCommonFwd.__new__.__defaults__ = ('float32', None, 0, 0, 0, 0, False)
 
 
-def _declaration_conv(wkl, data, kernel):
-    sch = _get_schedule(wkl)
+def _declaration_conv(wkl, data, kernel, sch=None):
+    if sch is None:
+        sch = _get_schedule(wkl)
 
     HPAD, WPAD = wkl.hpad, wkl.wpad
     HSTR, WSTR = wkl.hstride, wkl.wstride
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
 
     ndim_input = len(data.shape)
 
@@ -29,14 +46,14 @@ def _declaration_conv(wkl, data, kernel):
         in_channel_block = 0
         batch_size, in_channel, in_height, in_width = get_const_tuple(data.shape)
 
-    num_filter, _, kernel_height, kernel_width, _, co = get_const_tuple(kernel.shape)
+    num_filter, _, kernel_height, kernel_width, kernel_ic_bn, co = get_const_tuple(kernel.shape)
     num_filter *= co
 
     pad_height = in_height + 2 * HPAD
     pad_width = in_width + 2 * WPAD
 
-    out_height = (in_height + 2 * HPAD - kernel_height) // HSTR + 1
-    out_width = (in_width + 2 * WPAD - kernel_width) // WSTR + 1
+    out_height = (in_height + 2 * HPAD - (kernel_height - 1) * HDIL - 1) // HSTR + 1
+    out_width = (in_width + 2 * WPAD - (kernel_width - 1) * WDIL - 1) // WSTR + 1
 
     # pack data
     DOPAD = (HPAD != 0 and WPAD != 0)
@@ -72,7 +89,11 @@ def _declaration_conv(wkl, data, kernel):
     # convolution
     oshape = (batch_size, num_filter//sch.oc_bn, out_height, out_width, sch.oc_bn)
 
-    ic = tvm.reduce_axis((0, in_channel), name='ic')
+    # grouped conv: reduce over the group's input channels only
+    ic = tvm.reduce_axis((0, in_channel // wkl.groups), name='ic')
+    ic_in = lambda oc_chunk, oc_block, ic: _group_in_channel(wkl, sch.oc_bn, oc_chunk, oc_block, ic)
+    data_at = lambda n, c, oh, ow, kh, kw: \
+        data_vec[n, c // sch.ic_bn, oh * HSTR + kh * HDIL, ow * WSTR + kw * WDIL, c % sch.ic_bn]
     kh = tvm.reduce_axis((0, kernel_height), name='kh')
     kw = tvm.reduce_axis((0, kernel_width), name='kw')
 
@@ -80,8 +101,9 @@ def _declaration_conv(wkl, data, kernel):
     unpack_channel_block = re.findall(r'\d+', sch.layout_out)
     if len(unpack_channel_block) == 0:
         conv = tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
-            tvm.sum(data_vec[n, ic // sch.ic_bn, oh * HSTR + kh, ow * WSTR + kw, ic % sch.ic_bn] *
-                kernel_vec[oc_chunk, ic // sch.ic_bn, kh, kw, ic % sch.ic_bn, oc_block],
+            tvm.sum(data_at(n, ic_in(oc_chunk, oc_block, ic), oh, ow, kh, kw) *
+                _weight_load(kernel_vec[oc_chunk, ic // kernel_ic_bn, kh, kw, ic % kernel_ic_bn, oc_block],
+                             sch.weight_dtype),
                 axis=[ic, kh, kw]), name='conv2d')  # , tag="conv2d_nChwc")
         unpack_shape = (batch_size, num_filter, out_height, out_width)
         unpack = tvm.compute(unpack_shape,
@@ -93,13 +115,15 @@ def _declaration_conv(wkl, data, kernel):
         unpack_channel_block = int(unpack_channel_block[0])
         if unpack_channel_block == sch.oc_bn:
             return tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
-                    tvm.sum(data_vec[n, ic // sch.ic_bn, oh * HSTR + kh, ow * WSTR + kw, ic % sch.ic_bn] *
-                    kernel_vec[oc_chunk, ic // sch.ic_bn, kh, kw, ic % sch.ic_bn, oc_block],
+                    tvm.sum(data_at(n, ic_in(oc_chunk, oc_block, ic), oh, ow, kh, kw) *
+                    _weight_load(kernel_vec[oc_chunk, ic // kernel_ic_bn, kh, kw, ic % kernel_ic_bn, oc_block],
+                             sch.weight_dtype),
                     axis=[ic, kh, kw]), name='conv2d', tag="conv2d_nChwc")
         else:
             conv = tvm.compute(oshape, lambda n, oc_chunk, oh, ow, oc_block:
-            tvm.sum(data_vec[n, ic // sch.ic_bn, oh * HSTR + kh, ow * WSTR + kw, ic % sch.ic_bn] *
-                    kernel_vec[oc_chunk, ic // sch.ic_bn, kh, kw, ic % sch.ic_bn, oc_block],
+            tvm.sum(data_at(n, ic_in(oc_chunk, oc_block, ic), oh, ow, kh, kw) *
+                    _weight_load(kernel_vec[oc_chunk, ic // kernel_ic_bn, kh, kw, ic % kernel_ic_bn, oc_block],
+                             sch.weight_dtype),
                     axis=[ic, kh, kw]), name='conv2d')
             unpack_shape = (batch_size, num_filter//unpack_channel_block, out_height, out_width, unpack_channel_block)
             unpack = tvm.compute(unpack_shape,
@@ -110,8 +134,9 @@ def _declaration_conv(wkl, data, kernel):
     return unpack
 
 
-def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, last):
-    sch = _get_schedule(wkl)
+def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, last, sch=None):
+    if sch is None:
+        sch = _get_schedule(wkl)
 
     HPAD, WPAD = wkl.hpad, wkl.wpad
     DOPAD = (HPAD != 0 and WPAD != 0)
@@ -122,7 +147,8 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
     # schedule data
     if DOPAD and "conv2d_data_pack" in s[A1].op.tag:
         s[A0].compute_inline()
-    if isinstance(s[A1].op, tvm.tensor.ComputeOp): #and "conv2d_data_pack" in s[A1].op.tag:
+    pack_data = isinstance(s[A1].op, tvm.tensor.ComputeOp)
+    if pack_data and not sch.tile_pack:
         batch, ic_chunk, ih, iw, ic_block = s[A1].op.axis
         parallel_axis = s[A1].fuse(ic_chunk, ih)
         s[A1].parallel(parallel_axis)
@@ -131,20 +157,41 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
     C, O0, O = conv_out, output, last
     CC = s.cache_write(C, 'global')
 
+    if sch.oh_tile:
+        if O0 != O:
+            s[O0].compute_inline()
+        return _schedule_conv_l2(s, wkl, sch, A1, pack_data, kernel, C, CC, O)
+
+    _, oc_chunks, _, out_width, _ = get_const_tuple(C.shape)
+    # the output block of one task: every oc_chunk of a row with tile_pack, one row of one oc_chunk otherwise
+    block = (oc_chunks, 1, out_width) if sch.tile_pack else (1, 1, out_width)
+    stream = C == O and use_stream_store(sch, C, block)
     _, oc_chunk, oh, ow, oc_block = s[C].op.axis
     ow_chunk, ow_block = s[C].split(ow, factor=sch.reg_n)
-    s[C].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
-    parallel_axis = s[C].fuse(oc_chunk, oh)
-    s[C].vectorize(oc_block)
+    if sch.tile_pack:
+        # output rows are the parallel tasks, the packed input rows are reused by every oc_chunk
+        s[C].reorder(oh, oc_chunk, ow_chunk, ow_block, oc_block)
+        parallel_axis, task_axis = oh, oc_chunk
+    else:
+        s[C].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
+        parallel_axis, task_axis = s[C].fuse(oc_chunk, oh), ow_chunk
+    if stream:
+        _schedule_stream_store(s, C, task_axis, block)
+    else:
+        s[C].vectorize(oc_block)
     if C == O:
         s[C].parallel(parallel_axis)
+        if pack_data and sch.tile_pack:
+            s[A1].compute_at(s[C], parallel_axis)
 
-    s[CC].compute_at(s[C], ow_chunk)
+    # a stream-stored task accumulates its whole block before storing it
+    s[CC].compute_at(s[C], parallel_axis if stream else ow_chunk)
     _, oc_chunk, oh, ow, oc_block = s[CC].op.axis
     ic, kh, kw = s[CC].op.reduce_axis
 
     ow_chunk, ow_block = s[CC].split(ow, factor=sch.reg_n)
-    ic_chunk, ic_block = s[CC].split(ic, factor=sch.ic_bn)
+    # a grouped conv only reduces over in_filter / groups channels
+    ic_chunk, ic_block = s[CC].split(ic, factor=min(sch.ic_bn, wkl.in_filter // wkl.groups))
 
     if sch.unroll_kw:
         s[CC].reorder(oc_chunk, oh, ow_chunk, ic_chunk, kh, ic_block, kw, ow_block, oc_block)
@@ -154,31 +201,158 @@ def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, l
 
     s[CC].vectorize(oc_block)
     s[CC].unroll(ow_block)
+    _schedule_prefetch(s, sch, CC, A1, kernel, ic_chunk)
 
     if O0 != O:
         s[O0].compute_inline()
 
     if C != O:
         if len(s[O].op.axis) == 5:
+            OL = cache_stream_output(s, sch, O, block)
             batch, oc_chunk, oh, ow, oc_block = s[O].op.axis
             ow_chunk, ow_block = s[O].split(ow, factor=sch.reg_n)
-            s[O].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
-            parallel_axis = s[O].fuse(oc_chunk, oh)
-            s[C].compute_at(s[O], parallel_axis)
-            _, oc_block = s[O].split(oc_block, factor=sch.oc_bn)
-            s[O].vectorize(oc_block)
-
-            s[O].parallel(parallel_axis)
+            _schedule_output_rows(s, sch, A1 if pack_data else None, C, O, oc_chunk, oh, ow_chunk, ow_block,
+                                  oc_block, OL, block)
+            if OL is None:
+                _, oc_block = s[O].split(oc_block, factor=sch.oc_bn)
+                s[O].vectorize(oc_block)
         else:
             assert len(s[O].op.axis) == 4
             batch, oc, oh, ow = s[O].op.axis
             ow_chunk, ow_block = s[O].split(ow, factor=sch.reg_n)
             oc_chunk, oc_block = s[O].split(oc, factor=sch.oc_bn)
-            s[O].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
-            parallel_axis = s[O].fuse(oc_chunk, oh)
-            s[C].compute_at(s[O], parallel_axis)
+            _schedule_output_rows(s, sch, A1 if pack_data else None, C, O, oc_chunk, oh, ow_chunk, ow_block,
+                                  oc_block)
             s[O].vectorize(oc_block)
 
-            s[O].parallel(parallel_axis)
+    return s
+
+
+def _schedule_prefetch(s, sch, CC, data_vec, kernel, ic_chunk):
+    if sch.prefetch:
+        # the kernel block and the input rows of ic_chunk + prefetch
+        s[CC].prefetch(kernel, ic_chunk, sch.prefetch)
+        s[CC].prefetch(data_vec, ic_chunk, sch.prefetch)
+
+
+def _schedule_output_rows(s, sch, data_vec, C, O, oc_chunk, oh, ow_chunk, ow_block, oc_block, OL=None, block=None):
+    """Parallel loop of the unpack stage O, with the conv C (and the tile-packed data) computed inside it.
+    OL is the cache_write stage of a stream-stored O, it computes the task's block that O then stores."""
+    if sch.tile_pack:
+        s[O].reorder(oh, oc_chunk, ow_chunk, ow_block, oc_block)
+        # (parallel axis, axis C is computed at, outermost loop of a task)
+        parallel_axis, conv_axis, task_axis = oh, oc_chunk, oc_chunk
+        if data_vec is not None:
+            s[data_vec].compute_at(s[O], oh)
+    else:
+        s[O].reorder(oc_chunk, oh, ow_chunk, ow_block, oc_block)
+        parallel_axis = s[O].fuse(oc_chunk, oh)
+        conv_axis, task_axis = parallel_axis, ow_chunk
+    if OL is None:
+        s[C].compute_at(s[O], conv_axis)
+    else:
+        _schedule_stream_output(s, sch, C, O, OL, parallel_axis, task_axis, block)
+    s[O].parallel(parallel_axis)
+
+
+def _schedule_stream_output(s, sch, C, O, OL, parallel_axis, store_axis, block):
+    """OL computes the fused elementwise ops of a task's block next to the conv, O stores it from store_axis"""
+    s[OL].compute_at(s[O], parallel_axis)
+    _, oc_chunk, _, ow, oc_block = s[OL].op.axis
+    s[OL].split(ow, factor=sch.reg_n)
+    s[OL].vectorize(oc_block)
+    if sch.tile_pack:
+        s[C].compute_at(s[OL], oc_chunk)
+    else:
+        s[C].compute_at(s[O], parallel_axis)
+    _schedule_stream_store(s, O, store_axis, block)
+
+
+def _schedule_conv_l2(s, wkl, sch, data_vec, pack_data, kernel, C, CC, O):
+    def tile(stage, oc_chunk, oh, ow, oc_block):
+        """returns (parallel axis, axis the conv of one tile is computed at, outermost loop of a task)"""
+        oh_outer, ow_outer, oh_inner, ow_inner = s[stage].tile(oh, ow, sch.oh_tile, sch.ow_tile)
+        if sch.tile_pack:
+            # the packed input tile is reused by every oc_chunk
+            s[stage].reorder(oh_outer, ow_outer, oc_chunk, oh_inner, ow_inner, oc_block)
+            return s[stage].fuse(oh_outer, ow_outer), oc_chunk, oc_chunk
+        s[stage].reorder(oc_chunk, oh_outer, ow_outer, oh_inner, ow_inner, oc_block)
+        axis = s[stage].fuse(oc_chunk, oh_outer, ow_outer)
+        return axis, axis, oh_inner
+
+    oc_chunks = get_const_tuple(C.shape)[1]
+    block = (oc_chunks if sch.tile_pack else 1, sch.oh_tile, sch.ow_tile)
+    stream = C == O and use_stream_store(sch, C, block)
+    _, oc_chunk, oh, ow, oc_block = s[C].op.axis
+    parallel_axis, tile_axis, task_axis = tile(C, oc_chunk, oh, ow, oc_block)
+    if stream:
+        _schedule_stream_store(s, C, task_axis, block)
+    else:
+        s[C].vectorize(oc_block)
+
+    # the accumulators of the whole tile live in CC while ic is swept ic_tile chunks at a time
+    s[CC].compute_at(s[C], parallel_axis if stream else tile_axis)
+    _, oc_chunk, oh, ow, oc_block = s[CC].op.axis
+    ic, kh, kw = s[CC].op.reduce_axis
+    ow_chunk, ow_block = s[CC].split(ow, factor=sch.reg_n)
+    ic_chunk, ic_block = s[CC].split(ic, factor=min(sch.ic_bn, wkl.in_filter // wkl.groups))
+    ic_outer, ic_chunk = s[CC].split(ic_chunk, factor=sch.ic_tile or 1 << 30)
+    if sch.unroll_kw:
+        s[CC].reorder(oc_chunk, ic_outer, oh, ow_chunk, ic_chunk, kh, ic_block, kw, ow_block, oc_block)
+        s[CC].unroll(kw)
+    else:
+        s[CC].reorder(oc_chunk, ic_outer, oh, ow_chunk, ic_chunk, kh, kw, ic_block, ow_block, oc_block)
+    s[CC].vectorize(oc_block)
+    s[CC].unroll(ow_block)
+    _schedule_prefetch(s, sch, CC, data_vec, kernel, ic_chunk)
+
+    if C != O:
+        if len(s[O].op.axis) == 5:
+            OL = cache_stream_output(s, sch, O, block)
+            batch, oc_chunk, oh, ow, oc_block = s[O].op.axis
+            parallel_axis, tile_axis, task_axis = tile(O, oc_chunk, oh, ow, oc_block)
+            if OL is None:
+                _, oc_block = s[O].split(oc_block, factor=sch.oc_bn)
+        else:
+            OL = None
+            batch, oc, oh, ow = s[O].op.axis
+            oc_chunk, oc_block = s[O].split(oc, factor=sch.oc_bn)
+            parallel_axis, tile_axis, _ = tile(O, oc_chunk, oh, ow, oc_block)
+        if OL is None:
+            s[C].compute_at(s[O], tile_axis)
+            s[O].vectorize(oc_block)
+        else:
+            _schedule_stream_output(s, sch, C, O, OL, parallel_axis, task_axis, block)
+    s[O].parallel(parallel_axis)
+    if pack_data and sch.tile_pack:
+        s[data_vec].compute_at(s[O], parallel_axis)
 
     return s
+
+
+def _l2_tile_candidates(wkl, sch, l2_bytes=1 << 20):
+    """(oh_tile, ow_tile, ic_tile) whose per-task working set, input tile + kernel tile + accumulators,
+    fits in 3/4 of L2, largest first. The rest of L2 is left to the prefetched next tile."""
+    HSTR, WSTR = wkl.hstride, wkl.wstride
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
+    KH, KW = wkl.hkernel, wkl.wkernel
+    out_height = (wkl.height + 2 * wkl.hpad - (KH - 1) * HDIL - 1) // HSTR + 1
+    out_width = (wkl.width + 2 * wkl.wpad - (KW - 1) * WDIL - 1) // WSTR + 1
+    ic_bn = min(sch.ic_bn, wkl.in_filter // wkl.groups)
+    ic_chunks = wkl.in_filter // wkl.groups // ic_bn
+    weight_bytes = np.dtype(sch.weight_dtype if sch.weight_dtype != 'bfloat16' else 'uint16').itemsize
+
+    # whole rows when no multiple of reg_n divides out_width (19, 38), reg_n then leaves a remainder tile
+    ow_tiles = [t for t in range(sch.reg_n, out_width + 1, sch.reg_n) if out_width % t == 0] or [out_width]
+    candidates = []
+    for oh_tile in [t for t in range(1, out_height + 1) if out_height % t == 0]:
+        for ow_tile in ow_tiles:
+            for ic_tile in [t for t in range(1, ic_chunks + 1) if ic_chunks % t == 0]:
+                in_tile = ic_tile * ic_bn * ((oh_tile - 1) * HSTR + (KH - 1) * HDIL + 1) * \
+                          ((ow_tile - 1) * WSTR + (KW - 1) * WDIL + 1) * 4
+                kernel_tile = ic_tile * ic_bn * KH * KW * sch.oc_bn * weight_bytes
+                acc = oh_tile * ow_tile * sch.oc_bn * 4
+                working_set = in_tile + kernel_tile + acc
+                if working_set <= l2_bytes * 3 // 4:
+                    candidates.append((working_set, (oh_tile, ow_tile, ic_tile)))
+    return [tile for _, tile in sorted(candidates, reverse=True)]
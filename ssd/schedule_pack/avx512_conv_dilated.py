@@ -0,0 +1,144 @@
+from __future__ import absolute_import as _abs
+import re
+import tvm
+from topi.util import get_const_tuple
+from collections import namedtuple
+
+from topi.nn.conv2d import _get_schedule
+from topi.nn.pad import pad
+
+from .weight_precision import _weight_load
+from .workload import _group_in_channel
+
+# Dilated conv computed by dilation phase: the outputs with the same (oh % HDIL, ow % WDIL) only read
+# inputs of that phase. Once the input is packed by phase, every phase is a plain unit-stride conv and
+# the reg_n register tile reads neighbouring pixels instead of pixels HDIL / WDIL apart.
+AVX512ConvDilatedFwd = namedtuple('AVX512ConvDilatedFwd',
+                                  ['ic_bn', 'oc_bn', 'reg_n', 'unroll_kw', 'layout_in', 'layout_out',
+                                   'weight_dtype'])
+AVX512ConvDilatedFwd.__new__.__defaults__ = ('float32',)
+
+
+def _declaration_conv(wkl, data, kernel):
+    sch = _get_schedule(wkl)
+
+    HPAD, WPAD = wkl.hpad, wkl.wpad
+    HDIL, WDIL = wkl.hdilation, wkl.wdilation
+    assert wkl.hstride == 1 and wkl.wstride == 1, "dilated conv only supports stride 1"
+
+    ndim_input = len(data.shape)
+    if ndim_input == 5:
+        batch_size, in_channel_chunk, in_height, in_width, in_channel_block = get_const_tuple(data.shape)
+        in_channel = in_channel_block * in_channel_chunk
+    else:
+        assert ndim_input == 4
+        batch_size, in_channel, in_height, in_width = get_const_tuple(data.shape)
+
+    num_filter, _, kernel_height, kernel_width, kernel_ic_bn, co = get_const_tuple(kernel.shape)
+    num_filter *= co
+
+    out_height = in_height + 2 * HPAD - (kernel_height - 1) * HDIL
+    out_width = in_width + 2 * WPAD - (kernel_width - 1) * WDIL
+
+    # every phase gets the same extent, rounded up
+    phase_out_height = (out_height + HDIL - 1) // HDIL
+    phase_out_width = (out_width + WDIL - 1) // WDIL
+    phase_in_height = phase_out_height + kernel_height - 1
+    phase_in_width = phase_out_width + kernel_width - 1
+
+    # zeros at the bottom / right fill the rounded up phases
+    pad_before = (0, 0, HPAD, WPAD)
+    pad_after = (0, 0, phase_in_height * HDIL - in_height - HPAD, phase_in_width * WDIL - in_width - WPAD)
+    if ndim_input == 5:
+        data_pad = pad(data, pad_before + (0, ), pad_after + (0, ), name="data_pad")
+    else:
+        data_pad = pad(data, pad_before, pad_after, name="data_pad")
+
+    # (n, C, h, w, c) -> (n, C, h % HDIL, w % WDIL, h // HDIL, w // WDIL, c)
+    shape = (batch_size, in_channel // sch.ic_bn, HDIL, WDIL, phase_in_height, phase_in_width, sch.ic_bn)
+    if ndim_input == 5:
+        data_vec = tvm.compute(shape,
+                               lambda n, C, ph, pw, h, w, c:
+                               data_pad[n, (C * sch.ic_bn + c) // in_channel_block, h * HDIL + ph, w * WDIL + pw,
+                                        (C * sch.ic_bn + c) % in_channel_block],
+                               name='data_vec', tag="conv2d_data_pack_phase")
+    else:
+        data_vec = tvm.compute(shape,
+                               lambda n, C, ph, pw, h, w, c:
+                               data_pad[n, C * sch.ic_bn + c, h * HDIL + ph, w * WDIL + pw],
+                               name='data_vec', tag="conv2d_data_pack_phase")
+
+    ic = tvm.reduce_axis((0, in_channel // wkl.groups), name='ic')
+    kh = tvm.reduce_axis((0, kernel_height), name='kh')
+    kw = tvm.reduce_axis((0, kernel_width), name='kw')
+    ic_in = lambda oc_chunk, oc_block, ic: _group_in_channel(wkl, sch.oc_bn, oc_chunk, oc_block, ic)
+
+    pshape = (batch_size, num_filter // sch.oc_bn, HDIL, WDIL, phase_out_height, phase_out_width, sch.oc_bn)
+    conv = tvm.compute(pshape, lambda n, oc_chunk, ph, pw, oh, ow, oc_block:
+            tvm.sum(data_vec[n, ic_in(oc_chunk, oc_block, ic) // sch.ic_bn, ph, pw, oh + kh, ow + kw,
+                             ic_in(oc_chunk, oc_block, ic) % sch.ic_bn] *
+                    _weight_load(kernel[oc_chunk, ic // kernel_ic_bn, kh, kw, ic % kernel_ic_bn, oc_block],
+                                 sch.weight_dtype),
+                    axis=[ic, kh, kw]), name='conv2d')
+
+    # interleave the phases back into NCHW[x]c
+    unpack_channel_block = re.findall(r'\d+', sch.layout_out)
+    assert len(unpack_channel_block) == 1, "dilated conv only writes NCHW[x]c"
+    unpack_channel_block = int(unpack_channel_block[0])
+    unpack_shape = (batch_size, num_filter // unpack_channel_block, out_height, out_width, unpack_channel_block)
+    unpack = tvm.compute(unpack_shape,
+                         lambda n, C, h, w, c:
+                         conv[n, (C * unpack_channel_block + c) // sch.oc_bn, h % HDIL, w % WDIL, h // HDIL, w // WDIL,
+                              (C * unpack_channel_block + c) % sch.oc_bn],
+                         name='output_unpack',
+                         tag='conv2d_nChwc_unpack')
+    return unpack
+
+
+def _schedule_conv(s, wkl, data, data_pad, data_vec, kernel, conv_out, output, last):
+    sch = _get_schedule(wkl)
+
+    # schedule data
+    A0, A1 = data_pad, data_vec
+    s[A0].compute_inline()
+    batch, ic_chunk, ph, pw, ih, iw, ic_block = s[A1].op.axis
+    parallel_axis = s[A1].fuse(ic_chunk, ph, pw, ih)
+    s[A1].parallel(parallel_axis)
+
+    # schedule conv, the register tile runs along one phase row
+    C, O0, O = conv_out, output, last
+    CC = s.cache_write(C, 'global')
+
+    _, oc_chunk, ph, pw, oh, ow, oc_block = s[C].op.axis
+    ow_chunk, ow_block = s[C].split(ow, factor=sch.reg_n)
+    s[C].reorder(oc_chunk, ph, oh, pw, ow_chunk, ow_block, oc_block)
+    s[C].vectorize(oc_block)
+
+    s[CC].compute_at(s[C], ow_chunk)
+    _, oc_chunk, ph, pw, oh, ow, oc_block = s[CC].op.axis
+    ic, kh, kw = s[CC].op.reduce_axis
+
+    ow_chunk, ow_block = s[CC].split(ow, factor=sch.reg_n)
+    ic_chunk, ic_block = s[CC].split(ic, factor=min(sch.ic_bn, wkl.in_filter // wkl.groups))
+
+    if sch.unroll_kw:
+        s[CC].reorder(oc_chunk, ph, oh, pw, ow_chunk, ic_chunk, kh, ic_block, kw, ow_block, oc_block)
+        s[CC].unroll(kw)
+    else:
+        s[CC].reorder(oc_chunk, ph, oh, pw, ow_chunk, ic_chunk, kh, kw, ic_block, ow_block, oc_block)
+
+    s[CC].vectorize(oc_block)
+    s[CC].unroll(ow_block)
+
+    if O0 != O:
+        s[O0].compute_inline()
+
+    # one output row needs one row of a single phase, for all width phases
+    batch, oc_chunk, oh, ow, oc_block = s[O].op.axis
+    parallel_axis = s[O].fuse(oc_chunk, oh)
+    s[C].compute_at(s[O], parallel_axis)
+    _, oc_block = s[O].split(oc_block, factor=sch.oc_bn)
+    s[O].vectorize(oc_block)
+    s[O].parallel(parallel_axis)
+
+    return s
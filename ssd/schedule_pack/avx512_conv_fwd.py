@@ -1,20 +1,30 @@
 from __future__ import absolute_import as _abs
 
-from . import avx512_conv_common, avx512_conv_1x1
+from . import avx512_conv_common, avx512_conv_1x1, avx512_conv_dilated, avx512_dense, avx2_conv_int8, gemm
 
 from .avx512_conv_common import AVX512ConvCommonFwd
 from .avx512_conv_1x1 import AVX512Conv1x1Fwd
+from .avx512_conv_dilated import AVX512ConvDilatedFwd
+from .avx2_conv_int8 import AVX2Int8ConvCommonFwd
+from .avx512_dense import AVX512DenseFwd, DenseWorkload, _get_dense_workload
+from .avx512_dense import _declaration_dense_pack, _declaration_dense, _schedule_dense
+from .avx512_dense import _declaration_softmax, _softmax_input, _schedule_softmax
+from .gemm import AVX512GemmFwd, GemmWorkload, _default_gemm_schedule
+from .gemm import _declaration_gemm_pack_a, _declaration_gemm_pack_b, _declaration_gemm, _schedule_gemm
 
 import nnvm
 import nnvm.symbol as sym
 from nnvm.top import registry as reg
 
 import tvm
+import topi
 from topi.nn.conv2d import conv2d, _get_schedule
 from topi.util import get_const_tuple, get_const_int
 from topi.nn.conv2d import conv2d_NCHWc
-from topi.nn.conv2d import _WORKLOADS, Workload
-from topi.nn.conv2d import _get_workload
+from topi.nn.dense import dense
+from topi.nn.conv2d import _WORKLOADS
+from .workload import Workload, _get_workload, _infer_groups, _kernel_ic_bn
+from .weight_precision import _declaration_weight_pair
 from topi import generic
 from topi.nn.util import infer_pad, infer_stride
 from topi import tag
@@ -41,8 +51,11 @@ _SCHEDULES = [
     AVX512Conv1x1Fwd(ic_bn=256, oc_bn=32, oh_factor=1, ow_factor=8, layout_in="NCHW32c", layout_out="NCHW32c"), #17
     AVX512ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #18
     AVX512Conv1x1Fwd(ic_bn=32, oc_bn=32, oh_factor=2, ow_factor=4, layout_in="NCHW32c", layout_out="NCHW32c"), #19
-    AVX512Conv1x1Fwd(ic_bn=512, oc_bn=32, oh_factor=2, ow_factor=4, layout_in="NCHW32c", layout_out="NCHW32c"), #20
-    AVX512Conv1x1Fwd(ic_bn=512, oc_bn=32, oh_factor=1, ow_factor=8, layout_in="NCHW32c", layout_out="NCHW32c"), #21
+    # the largest kernels (8 and 4 MB) on the smallest maps, stored as bfloat16
+    AVX512Conv1x1Fwd(ic_bn=512, oc_bn=32, oh_factor=2, ow_factor=4, layout_in="NCHW32c", layout_out="NCHW32c",
+                     weight_dtype='bfloat16'), #20
+    AVX512Conv1x1Fwd(ic_bn=512, oc_bn=32, oh_factor=1, ow_factor=8, layout_in="NCHW32c", layout_out="NCHW32c",
+                     weight_dtype='bfloat16'), #21
     AVX512ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #22
     # SSD Resnet50 other
     # Layer 2
@@ -71,16 +84,67 @@ _SCHEDULES = [
     AVX512ConvCommonFwd(ic_bn=64, oc_bn=14, reg_n=4, unroll_kw=True, layout_in="NCHW64c", layout_out="NCHW14c"), #40
     AVX512ConvCommonFwd(ic_bn=128, oc_bn=12, reg_n=2, unroll_kw=False, layout_in="NCHW128c", layout_out="NCHW12c"), #41
     AVX512ConvCommonFwd(ic_bn=128, oc_bn=4, reg_n=1, unroll_kw=False, layout_in="NCHW128c", layout_out="NCHW4c"), #42
+    # int8 SSD Resnet50, uint8 data x int8 kernel -> int32
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #43
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #44
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #45
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #46
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #47
+    AVX2Int8ConvCommonFwd(ic_bn=64, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW64c", layout_out="NCHW32c"), #48
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #49
+    AVX2Int8ConvCommonFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #50
+    # ResNeXt-50 32x4d, grouped 3x3 convs keep 16-channel blocks: 4 or 8 wide groups share a block,
+    # 16 and 32 wide groups are split into whole blocks
+    AVX512ConvCommonFwd(ic_bn=3, oc_bn=16, reg_n=8, unroll_kw=True, layout_in="NCHW", layout_out="NCHW16c"), #51
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=8, layout_in="NCHW16c", layout_out="NCHW16c"), #52
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=8, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #53
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=8, layout_in="NCHW16c", layout_out="NCHW16c"), #54
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=8, layout_in="NCHW16c", layout_out="NCHW16c"), #55
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=8, layout_in="NCHW16c", layout_out="NCHW16c"), #56
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=8, layout_in="NCHW16c", layout_out="NCHW16c"), #57
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=4, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #58
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=4, layout_in="NCHW16c", layout_out="NCHW16c"), #59
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=4, layout_in="NCHW16c", layout_out="NCHW16c"), #60
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=4, layout_in="NCHW16c", layout_out="NCHW16c"), #61
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=4, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #62
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=4, layout_in="NCHW16c", layout_out="NCHW16c"), #63
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=7, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #64
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #65
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #66
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #67
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=7, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #68
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=2, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #69
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=7, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #70
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=1, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #71
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=1, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #72
+    AVX512Conv1x1Fwd(ic_bn=16, oc_bn=16, oh_factor=1, ow_factor=7, layout_in="NCHW16c", layout_out="NCHW16c"), #73
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=7, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #74
+    # depthwise, the groups == in_filter limit: every lane of a block reads its own input channel
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=8, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #75
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=4, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #76
+    AVX512ConvCommonFwd(ic_bn=16, oc_bn=16, reg_n=7, unroll_kw=True, layout_in="NCHW16c", layout_out="NCHW16c"), #77
+    # dilated 3x3, phase split: reg_n tiles the per-phase width ceil(ow / dilation)
+    # atrous VGG16 fc6 (SSD 512 / 300)
+    AVX512ConvDilatedFwd(ic_bn=32, oc_bn=32, reg_n=6, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #78
+    AVX512ConvDilatedFwd(ic_bn=32, oc_bn=32, reg_n=4, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #79
+    # DeepLab-style ResNet-50, output stride 16 / 8 at 512x512
+    AVX512ConvDilatedFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #80
+    AVX512ConvDilatedFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #81
+    AVX512ConvDilatedFwd(ic_bn=32, oc_bn=32, reg_n=8, unroll_kw=True, layout_in="NCHW32c", layout_out="NCHW32c"), #82
 ]
 
 _SCH_TO_DECL_FUNC = {
     AVX512ConvCommonFwd: avx512_conv_common._declaration_conv,
-    AVX512Conv1x1Fwd: avx512_conv_1x1._declaration_conv
+    AVX512Conv1x1Fwd: avx512_conv_1x1._declaration_conv,
+    AVX512ConvDilatedFwd: avx512_conv_dilated._declaration_conv,
+    AVX2Int8ConvCommonFwd: avx2_conv_int8._declaration_conv
 }
 
 _SCH_TO_SCH_FUNC = {
     AVX512ConvCommonFwd: avx512_conv_common._schedule_conv,
-    AVX512Conv1x1Fwd: avx512_conv_1x1._schedule_conv
+    AVX512Conv1x1Fwd: avx512_conv_1x1._schedule_conv,
+    AVX512ConvDilatedFwd: avx512_conv_dilated._schedule_conv,
+    AVX2Int8ConvCommonFwd: avx2_conv_int8._schedule_conv
 }
 
 
@@ -138,14 +202,70 @@ def _get_schedule_conv(wkl):
         Workload('float32', 'float32', 4, 4, 256, 126, 3, 3, 1, 1, 1, 1),
         Workload('float32', 'float32', 2, 2, 256, 84, 3, 3, 1, 1, 1, 1),
         Workload('float32', 'float32', 1, 1, 128, 84, 3, 3, 1, 1, 1, 1),
+        # int8 SSD Resnet50 43-50
+        Workload('uint8', 'int32', 128, 128, 64, 64, 1, 1, 0, 0, 1, 1),
+        Workload('uint8', 'int32', 128, 128, 64, 64, 3, 3, 1, 1, 1, 1),
+        Workload('uint8', 'int32', 128, 128, 64, 256, 1, 1, 0, 0, 1, 1),
+        Workload('uint8', 'int32', 64, 64, 128, 128, 3, 3, 1, 1, 1, 1),
+        Workload('uint8', 'int32', 32, 32, 256, 256, 3, 3, 1, 1, 1, 1),
+        Workload('uint8', 'int32', 32, 32, 1024, 256, 1, 1, 0, 0, 1, 1),
+        Workload('uint8', 'int32', 16, 16, 512, 512, 3, 3, 1, 1, 1, 1),
+        Workload('uint8', 'int32', 16, 16, 512, 2048, 1, 1, 0, 0, 1, 1),
+        # ResNeXt-50 32x4d 51-74
+        Workload('float32', 'float32', 224, 224, 3, 64, 7, 7, 3, 3, 2, 2),
+        Workload('float32', 'float32', 56, 56, 64, 128, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 56, 56, 128, 128, 3, 3, 1, 1, 1, 1, groups=32),
+        Workload('float32', 'float32', 56, 56, 128, 256, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 56, 56, 64, 256, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 56, 56, 256, 128, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 56, 56, 256, 256, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 56, 56, 256, 256, 3, 3, 1, 1, 2, 2, groups=32),
+        Workload('float32', 'float32', 28, 28, 256, 512, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 56, 56, 256, 512, 1, 1, 0, 0, 2, 2),
+        Workload('float32', 'float32', 28, 28, 512, 256, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 28, 28, 256, 256, 3, 3, 1, 1, 1, 1, groups=32),
+        Workload('float32', 'float32', 28, 28, 512, 512, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 28, 28, 512, 512, 3, 3, 1, 1, 2, 2, groups=32),
+        Workload('float32', 'float32', 14, 14, 512, 1024, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 28, 28, 512, 1024, 1, 1, 0, 0, 2, 2),
+        Workload('float32', 'float32', 14, 14, 1024, 512, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 14, 14, 512, 512, 3, 3, 1, 1, 1, 1, groups=32),
+        Workload('float32', 'float32', 14, 14, 1024, 1024, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 14, 14, 1024, 1024, 3, 3, 1, 1, 2, 2, groups=32),
+        Workload('float32', 'float32', 7, 7, 1024, 2048, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 14, 14, 1024, 2048, 1, 1, 0, 0, 2, 2),
+        Workload('float32', 'float32', 7, 7, 2048, 1024, 1, 1, 0, 0, 1, 1),
+        Workload('float32', 'float32', 7, 7, 1024, 1024, 3, 3, 1, 1, 1, 1, groups=32),
+        # depthwise 3x3 (MobileNet) 75-77
+        Workload('float32', 'float32', 56, 56, 128, 128, 3, 3, 1, 1, 1, 1, groups=128),
+        Workload('float32', 'float32', 28, 28, 256, 256, 3, 3, 1, 1, 1, 1, groups=256),
+        Workload('float32', 'float32', 14, 14, 512, 512, 3, 3, 1, 1, 1, 1, groups=512),
+        # dilated 3x3 78-82
+        Workload('float32', 'float32', 32, 32, 512, 1024, 3, 3, 6, 6, 1, 1, hdilation=6, wdilation=6),
+        Workload('float32', 'float32', 19, 19, 512, 1024, 3, 3, 6, 6, 1, 1, hdilation=6, wdilation=6),
+        Workload('float32', 'float32', 32, 32, 512, 512, 3, 3, 2, 2, 1, 1, hdilation=2, wdilation=2),
+        Workload('float32', 'float32', 64, 64, 256, 256, 3, 3, 2, 2, 1, 1, hdilation=2, wdilation=2),
+        Workload('float32', 'float32', 64, 64, 512, 512, 3, 3, 4, 4, 1, 1, hdilation=4, wdilation=4),
     ]
     if wkl not in workloads:
         raise ValueError("no schedule for such workload: {}".format(wkl))
     idx = workloads.index(wkl)
     sch = _SCHEDULES[idx]
+    if isinstance(sch, AVX512ConvCommonFwd) and sch.tile_pack is None:
+        sch = sch._replace(tile_pack=_pick_tile_pack(wkl))
     return sch
 
 
+# input maps from this size up are packed tile by tile (SSD-512 256x256 and 128x128)
+_TILE_PACK_MIN_AREA = 128 * 128
+
+
+def _pick_tile_pack(wkl):
+    """tile_pack of a common schedule that leaves it unset: a globally packed large input is written to and
+    read back from DRAM, test_conv_tile_pack.py pick_pack_strategy measures both for an explicit entry"""
+    return wkl.height * wkl.width >= _TILE_PACK_MIN_AREA
+
+
 @reg.register_alter_op_layout("conv2d")
 def alter_conv2d_layout(attrs, inputs, tinfos):
     copy_inputs = [s for s in inputs]
@@ -156,11 +276,15 @@ def alter_conv2d_layout(attrs, inputs, tinfos):
     import ast
     padding = ast.literal_eval(attrs['padding'])
     stride = ast.literal_eval(attrs['strides'])
+    groups = int(attrs['groups']) if 'groups' in attrs.keys() else 1
+    dilation = ast.literal_eval(attrs['dilation']) if 'dilation' in attrs.keys() else (1, 1)
 
-    wkl = _get_workload(data, kernel, stride, padding, 'float32')
+    wkl = _get_workload(data, kernel, stride, padding, 'float32', groups, dilation)
     sch = _get_schedule_conv(wkl)
     is_kernel_1x1 = isinstance(sch, AVX512Conv1x1Fwd)
     ic_bn, oc_bn = sch.ic_bn, sch.oc_bn
+    # the kernel of a grouped conv is only in_filter / groups wide
+    kernel_ic_bn = _kernel_ic_bn(wkl, ic_bn)
 
     new_attrs = {k : attrs[k] for k in attrs.keys()}
     new_attrs['layout'] = sch.layout_in if sch.layout_in else 'NCHW%dc' % ic_bn
@@ -168,16 +292,20 @@ def alter_conv2d_layout(attrs, inputs, tinfos):
 
     if is_kernel_1x1:
         # (oc, ic, h, w) -> (OC, IC, ic, oc, h, w)
-        new_attrs['kernel_layout'] = 'OI%di%doHW' % (ic_bn, oc_bn)
+        new_attrs['kernel_layout'] = 'OI%di%doHW' % (kernel_ic_bn, oc_bn)
+        if sch.weight_dtype != 'float32' and groups == 1 and kernel_ic_bn % 2 == 0:
+            # half-width weights, two per float32 word (see compute_cast), precompute folds it
+            copy_inputs[1] = sym.cast(inputs[1], dtype='float32', __weight_pair__=sch.weight_dtype,
+                                      __ic_block__=kernel_ic_bn)
     else:
         # (oc, ic, h, w) -> (OC, IC, h, w, ic, oc)
-        new_attrs['kernel_layout'] = 'OIHW%di%do' % (ic_bn, oc_bn)
+        new_attrs['kernel_layout'] = 'OIHW%di%do' % (kernel_ic_bn, oc_bn)
 
     return sym.contrib.conv2d_NCHWc(*copy_inputs, **new_attrs)
 
 
 @conv2d_NCHWc.register("cpu", override=True)
-def _declaration_conv(data, kernel, num_filter, kernel_size, stride, padding, out_dtype):
+def _declaration_conv(data, kernel, num_filter, kernel_size, stride, padding, out_dtype, dilation=(1, 1)):
     assert data.shape[0].value == 1, "only support batch size=1 convolution on avx"
     ndim_input = len(data.shape)
     if ndim_input == 5:
@@ -189,14 +317,17 @@ def _declaration_conv(data, kernel, num_filter, kernel_size, stride, padding, ou
 
     oc = num_filter
     kh, kw = kernel_size
-    wkl = _get_workload(tvm.placeholder((n, ic, h, w), dtype=out_dtype),
-                        tvm.placeholder((oc, ic, kh, kw), dtype=out_dtype), stride, padding, out_dtype)
+    # the NCHWc op does not carry groups, the packed kernel size gives it back
+    groups = _infer_groups(ic, oc, kernel_size, kernel)
+    wkl = _get_workload(tvm.placeholder((n, ic, h, w), dtype=data.dtype),
+                        tvm.placeholder((oc, ic, kh, kw), dtype=data.dtype), stride, padding, out_dtype,
+                        groups, dilation)
     sch = _get_schedule(wkl)
     return _SCH_TO_DECL_FUNC[type(sch)](wkl, data, kernel)
 
 
 @generic.schedule_conv2d_NCHWc.register(["cpu"], override=True)
-def schedule_conv2d_NCHWc(num_filter, kernel_size, stride, padding, outs):
+def schedule_conv2d_NCHWc(num_filter, kernel_size, stride, padding, outs, dilation=(1, 1)):
     """Create schedule for tensors"""
     s = tvm.create_schedule([x.op for x in outs])
 
@@ -213,7 +344,8 @@ def schedule_conv2d_NCHWc(num_filter, kernel_size, stride, padding, outs):
         if 'conv2d_nChwc' in op.tag:
             output = op.output(0)
             # conv_out = op.input_tensors[0]
-            conv_out = op.input_tensors[0] if 'conv2d_nChwc_unpack' in op.tag else output
+            conv_out = op.input_tensors[0] \
+                if 'conv2d_nChwc_unpack' in op.tag or 'requantize' in op.tag else output
             kernel = conv_out.op.input_tensors[1]
             # kernel = kernel_vec.op.input_tensors[0]
             data_vec = conv_out.op.input_tensors[0]
@@ -232,13 +364,15 @@ def schedule_conv2d_NCHWc(num_filter, kernel_size, stride, padding, outs):
                 ic = ic_chunk * ic_block
             else:
                 n, ic, h, w = [x.value for x in data.shape]
-            original_data = tvm.placeholder((n, ic, h, w), dtype=output.dtype)
+            original_data = tvm.placeholder((n, ic, h, w), dtype=data.dtype)
 
             oc = num_filter
             kh, kw = kernel_size
-            original_kernel = tvm.placeholder((oc, ic, kh, kw), dtype=output.dtype)
+            original_kernel = tvm.placeholder((oc, ic, kh, kw), dtype=data.dtype)
 
-            wkl = _get_workload(original_data, original_kernel, stride, padding, output.dtype)
+            groups = _infer_groups(ic, oc, kernel_size, kernel)
+            wkl = _get_workload(original_data, original_kernel, stride, padding, conv_out.dtype,
+                                groups, dilation)
             sch = _get_schedule(wkl)
             _SCH_TO_SCH_FUNC[type(sch)](s, wkl, data, data_pad, data_vec,
                                         kernel, conv_out, output, outs[0])
@@ -246,3 +380,219 @@ def schedule_conv2d_NCHWc(num_filter, kernel_size, stride, padding, outs):
 
     traverse(outs[0].op)
     return s
+
+
+@reg.register_compute("cast", level=100)
+def compute_cast(attrs, inputs, _):
+    """Same as nnvm's, but a cast alter_conv2d_layout put on a kernel stores it pairwise at half width"""
+    if '__weight_pair__' in attrs.keys():
+        return _declaration_weight_pair(inputs[0], attrs['__weight_pair__'], attrs.get_int('__ic_block__'))
+    return topi.cast(inputs[0], attrs['dtype'])
+
+
+@reg.register_compute("_contrib_conv2d_NCHWc", level=100)
+def compute_conv2d_NCHWc(attrs, inputs, _):
+    """Same as nnvm's, but passes dilation on, the declarations handle it and groups themselves"""
+    padding = attrs.get_int_tuple("padding")
+    strides = attrs.get_int_tuple("strides")
+    dilation = attrs.get_int_tuple("dilation")
+    kh, kw = attrs.get_int_tuple("kernel_size")
+    channels = attrs.get_int("channels")
+    out = _declaration_conv(inputs[0], inputs[1], channels, (kh, kw), strides, padding,
+                            inputs[0].dtype, dilation)
+    if attrs.get_bool("use_bias"):
+        bias = inputs[2]
+        bias = topi.expand_dims(bias, axis=1, num_newaxis=2)
+        out = topi.broadcast_add(out, bias)
+    return out
+
+
+@reg.register_schedule("_contrib_conv2d_NCHWc", level=100)
+def schedule_conv2d_NCHWc_nnvm(attrs, outs, target):
+    """Same as nnvm's, but passes dilation on"""
+    kh, kw = attrs.get_int_tuple("kernel_size")
+    with tvm.target.create(target):
+        return schedule_conv2d_NCHWc(attrs.get_int("channels"), (kh, kw), attrs.get_int_tuple("strides"),
+                                     attrs.get_int_tuple("padding"), outs, attrs.get_int_tuple("dilation"))
+
+
+_DENSE_SCHEDULES = [
+    # resnet50 classification head, oc_bn divides 1000 so the graph pre-packs the weight, GEMV is bound
+    # by streaming it anyway. Batch > 1 goes to the GEMM engine.
+    AVX512DenseFwd(oc_bn=8, reg_n=1, k_factor=16),
+    # resnet50 with num_classes=20
+    AVX512DenseFwd(oc_bn=4, reg_n=1, k_factor=16),
+    # vgg fc6, fc7, fc8
+    AVX512DenseFwd(oc_bn=16, reg_n=1, k_factor=8),
+    AVX512DenseFwd(oc_bn=16, reg_n=1, k_factor=8),
+    AVX512DenseFwd(oc_bn=8, reg_n=1, k_factor=16),
+]
+
+# used for classifier shapes not tuned yet, dense is much less shape sensitive than conv
+_DENSE_DEFAULT_SCHEDULE = AVX512DenseFwd(oc_bn=16, reg_n=4, k_factor=4)
+
+
+def _get_schedule_dense(wkl):
+    workloads = [
+        # resnet50 classification head
+        DenseWorkload('float32', 'float32', 1, 2048, 1000),
+        # resnet50 with num_classes=20
+        DenseWorkload('float32', 'float32', 1, 2048, 20),
+        # vgg fc6, fc7, fc8
+        DenseWorkload('float32', 'float32', 1, 25088, 4096),
+        DenseWorkload('float32', 'float32', 1, 4096, 4096),
+        DenseWorkload('float32', 'float32', 1, 4096, 1000),
+    ]
+    if wkl not in workloads:
+        return _DENSE_DEFAULT_SCHEDULE
+    idx = workloads.index(wkl)
+    return _DENSE_SCHEDULES[idx]
+
+
+_GEMM_SCHEDULES = [
+    # opt_gemm.py
+    AVX512GemmFwd(mc=128, nc=256, kc=256, mr=8, nr=32),
+    # resnet50 classification head, batch 16, nc divides 1000 so the graph pre-packs B
+    AVX512GemmFwd(mc=16, nc=40, kc=256, mr=16, nr=8),
+    # resnet50 3x3 conv 64 -> 64 at 56x56 as im2col
+    AVX512GemmFwd(mc=32, nc=224, kc=192, mr=8, nr=32),
+]
+
+
+def _get_schedule_gemm(wkl):
+    workloads = [
+        # opt_gemm.py
+        GemmWorkload('float32', 'float32', 1024, 1024, 1024),
+        # resnet50 classification head, batch 16
+        GemmWorkload('float32', 'float32', 16, 1000, 2048),
+        # resnet50 3x3 conv 64 -> 64 at 56x56 as im2col
+        GemmWorkload('float32', 'float32', 64, 3136, 576),
+    ]
+    if wkl not in workloads:
+        return _default_gemm_schedule(wkl)
+    idx = workloads.index(wkl)
+    return _GEMM_SCHEDULES[idx]
+
+
+def _dense_weight_block(wkl):
+    """Block width of the dense weight packed in the graph, None if it has to be packed in the kernel:
+    the pre-packed weight is an (out_dim, in_dim) view, there is no room for padding"""
+    if wkl.batch > 1:
+        # B of the GEMM, padded to nc blocks
+        sch = _get_schedule_gemm(GemmWorkload(wkl.in_dtype, wkl.out_dtype, wkl.batch, wkl.out_dim, wkl.in_dim))
+        block, padded_to = sch.nr, sch.nc
+    else:
+        sch = _get_schedule_dense(wkl)
+        if sch.weight_dtype != 'float32':
+            return None
+        block, padded_to = sch.oc_bn, sch.oc_bn
+    if wkl.out_dim % padded_to or wkl.in_dim % block:
+        return None
+    return block
+
+
+@reg.register_alter_op_layout("dense", level=100)
+def alter_dense_layout(attrs, inputs, tinfos):
+    """Packs the weight in the graph like the conv kernels, precompute then packs it once at build time.
+    The packed weight only exists in the built params, updated raw weights take a rebuild."""
+    copy_inputs = [s for s in inputs]
+    wkl = _get_dense_workload(tinfos[0], tinfos[1], tinfos[0].dtype)
+    block = _dense_weight_block(wkl)
+
+    new_attrs = {k : attrs[k] for k in attrs.keys()}
+    # hidden attribute, dense's own parameters are left alone, 0 is a weight packed in the kernel
+    new_attrs['__weight_pack__'] = block or 0
+    if block:
+        # (out_dim, in_dim) -> (OUT, in_dim, out), kept as (out_dim, in_dim) for dense's shape inference
+        weight = sym.reshape(inputs[1], shape=(wkl.out_dim // block, block, wkl.in_dim))
+        weight = sym.transpose(weight, axes=(0, 2, 1))
+        copy_inputs[1] = sym.reshape(weight, shape=(wkl.out_dim, wkl.in_dim))
+    return sym.dense(*copy_inputs, **new_attrs)
+
+
+@reg.register_alter_op_layout("softmax", level=100)
+def alter_softmax_layout(attrs, inputs, tinfos):
+    """Fuses a softmax over the rows into the dense computing them, nnvm never fuses softmax"""
+    dense_attrs = inputs[0].list_attr()
+    axis = int(attrs['axis']) if 'axis' in attrs.keys() else -1
+    # only a dense rewritten by alter_dense_layout carries the attribute
+    if '__weight_pack__' not in dense_attrs or len(tinfos[0].shape) != 2 or axis not in (-1, 1):
+        return None
+    children = inputs[0].get_children()
+    dense_inputs = [children[i] for i in range(len(children.list_output_names()))]
+    dense_attrs['__softmax__'] = 1
+    return sym.dense(*dense_inputs, **dense_attrs)
+
+
+@reg.register_compute("dense", level=100)
+def compute_dense(attrs, inputs, _):
+    """Same as nnvm's, but takes the weight alter_dense_layout pre-packed and the softmax fused into it"""
+    bias = inputs[2] if attrs.get_bool("use_bias") else None
+    weight_packed = '__weight_pack__' in attrs.keys() and attrs.get_int('__weight_pack__') > 0
+    out = _declaration_dense_cpu(inputs[0], inputs[1], bias, weight_packed)
+    if '__softmax__' in attrs.keys():
+        out = _declaration_softmax(out)
+    return out
+
+
+@dense.register("cpu", override=True)
+def _declaration_dense_cpu(data, weight, bias=None, weight_packed=False):
+    """weight_packed: weight is the (out_dim, in_dim) view of the pack alter_dense_layout made"""
+    wkl = _get_dense_workload(data, weight, data.dtype)
+    if wkl.batch > 1:
+        # a real GEMM, the blocked GEMM engine beats the per-panel dense schedule
+        sch = _get_schedule_gemm(GemmWorkload(data.dtype, data.dtype, wkl.batch, wkl.out_dim, wkl.in_dim))
+        B_pack = weight if weight_packed else _declaration_gemm_pack_b(sch, weight, transpose_b=True)
+        out = _declaration_gemm(sch, _declaration_gemm_pack_a(sch, data), B_pack,
+                                wkl.batch, wkl.out_dim, data.dtype)
+        if bias is None:
+            return out
+        return tvm.compute(out.shape, lambda b, oc: out[b, oc] + bias[oc], name='dense_bias', tag=tag.BROADCAST)
+    sch = _get_schedule_dense(wkl)
+    weight_pack = weight if weight_packed else _declaration_dense_pack(sch, weight)
+    return _declaration_dense(sch, data, weight_pack, bias, wkl.out_dim, data.dtype)
+
+
+@generic.schedule_dense.register(["cpu"], override=True)
+def schedule_dense(outs):
+    """Create schedule for dense with packed weight"""
+    s = tvm.create_schedule([x.op for x in outs])
+    # a fused softmax needs the dense output materialized, the dense schedule ends there
+    softmax_out = outs[0] if outs[0].op.tag == 'dense_softmax' else None
+    last = _softmax_input(softmax_out) if softmax_out is not None else outs[0]
+
+    def traverse(op):
+        """Traverse operators from computation graph"""
+        # inline all one-to-one-mapping operators except the last stage (output)
+        if tag.is_broadcast(op.tag):
+            if op not in s.outputs and op != last.op:
+                s[op].compute_inline()
+            for tensor in op.input_tensors:
+                if tensor.op.input_tensors:
+                    traverse(tensor.op)
+
+        if 'dense_pack' in op.tag:
+            output = op.output(0)
+            dense_out = op.input_tensors[0] if 'dense_pack_bias' in op.tag else output
+            data, weight_pack = dense_out.op.input_tensors
+            weight = weight_pack.op.input_tensors[0] \
+                if isinstance(weight_pack.op, tvm.tensor.ComputeOp) else weight_pack
+
+            wkl = _get_dense_workload(data, weight, output.dtype)
+            sch = _get_schedule_dense(wkl)
+            _schedule_dense(s, sch, data, weight_pack, dense_out, output, last)
+
+        if op.tag == 'gemm':
+            output = op.output(0)
+            C_pad = op.input_tensors[0]
+            A_pack, B_pack = C_pad.op.input_tensors
+            M, N = get_const_tuple(output.shape)
+            wkl = GemmWorkload(A_pack.dtype, output.dtype, M, N, get_const_int(A_pack.shape[1]))
+            sch = _get_schedule_gemm(wkl)
+            _schedule_gemm(s, sch, A_pack, B_pack, C_pad, output, last)
+
+    traverse(last.op)
+    if softmax_out is not None:
+        # one zmm of floats
+        _schedule_softmax(s, softmax_out, 16)
+    return s
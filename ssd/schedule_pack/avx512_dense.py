@@ -0,0 +1,178 @@
+from __future__ import absolute_import as _abs
+import tvm
+from topi.util import get_const_tuple
+from collections import namedtuple
+
+from .weight_precision import _weight_load, _weight_store
+
+DenseWorkload = namedtuple('DenseWorkload', ['in_dtype', 'out_dtype', 'batch', 'in_dim', 'out_dim'])
+
+# oc_bn: output features per packed weight block (vector lanes)
+# reg_n: batch rows kept in registers (GEMM mode only)
+# k_factor: unroll factor of the reduction loop
+# weight_dtype: storage precision of the packed weight (float32, float16 or bfloat16)
+AVX512DenseFwd = namedtuple('AVX512DenseFwd', ['oc_bn', 'reg_n', 'k_factor', 'weight_dtype'])
+AVX512DenseFwd.__new__.__defaults__ = ('float32',)
+
+
+def _get_dense_workload(data, weight, out_dtype):
+    batch, in_dim = get_const_tuple(data.shape)
+    out_dim, _ = get_const_tuple(weight.shape)
+    return DenseWorkload(data.dtype, out_dtype, batch, in_dim, out_dim)
+
+
+def _declaration_dense_pack(sch, weight):
+    # (out_dim, in_dim) -> (OUT, in_dim, out), tail block is zero-padded
+    out_dim, in_dim = get_const_tuple(weight.shape)
+    oc_chunk = (out_dim + sch.oc_bn - 1) // sch.oc_bn
+    return tvm.compute((oc_chunk, in_dim, sch.oc_bn),
+                       lambda oc, k, oc_block:
+                       _weight_store(tvm.select(oc * sch.oc_bn + oc_block < out_dim,
+                                                weight[oc * sch.oc_bn + oc_block, k],
+                                                tvm.const(0, weight.dtype)), sch.weight_dtype),
+                       name='weight_pack', tag='dense_weight_pack')
+
+
+def _packed_weight(weight_pack, in_dim, block):
+    """(reduce axes, input feature, load(n)) of a packed weight, load(n) reads the weight of output n.
+    weight_pack is either the (N / block, in_dim, block) pack or the (N, in_dim) view of it the graph
+    pre-packs (see avx512_conv_fwd.alter_dense_layout). Row o * block + q of the view holds the inputs
+    q * in_dim / block ... (q + 1) * in_dim / block - 1 of block o, the reduction is split the same way
+    so the view is indexed without div / mod."""
+    if len(weight_pack.shape) == 3:
+        k = tvm.reduce_axis((0, in_dim), name='k')
+        return [k], k, lambda n: weight_pack[n // block, k, n % block]
+    k_rows = in_dim // block
+    kq = tvm.reduce_axis((0, block), name='kq')
+    k = tvm.reduce_axis((0, k_rows), name='k')
+    return [kq, k], kq * k_rows + k, lambda n: weight_pack[n // block * block + kq, k * block + n % block]
+
+
+def _declaration_dense(sch, data, weight_pack, bias=None, out_dim=None, out_dtype='float32'):
+    batch, in_dim = get_const_tuple(data.shape)
+    if len(weight_pack.shape) == 3:
+        oc_chunk, _, oc_bn = get_const_tuple(weight_pack.shape)
+        out_dim = out_dim or oc_chunk * oc_bn
+    else:
+        oc_bn = sch.oc_bn
+        out_dim = out_dim or get_const_tuple(weight_pack.shape)[0]
+
+    axes, k, load = _packed_weight(weight_pack, in_dim, oc_bn)
+    matmul = tvm.compute((batch, out_dim), lambda b, oc:
+                         tvm.sum(data[b, k].astype(out_dtype) *
+                                 _weight_load(load(oc), sch.weight_dtype).astype(out_dtype),
+                                 axis=axes), name='dense', tag='dense_pack')
+    if bias is None:
+        return matmul
+    return tvm.compute((batch, out_dim), lambda b, oc: matmul[b, oc] + bias[oc].astype(out_dtype),
+                       name='dense_bias', tag='dense_pack_bias')
+
+
+def _declaration_softmax(out):
+    """Softmax over the rows of a dense output, in the same kernel"""
+    batch, out_dim = get_const_tuple(out.shape)
+    k1 = tvm.reduce_axis((0, out_dim), name='k1')
+    k2 = tvm.reduce_axis((0, out_dim), name='k2')
+    max_elem = tvm.compute((batch, ), lambda b: tvm.max(out[b, k1], axis=k1), name='softmax_max')
+    expsum = tvm.compute((batch, ), lambda b: tvm.sum(tvm.exp(out[b, k2] - max_elem[b]), axis=k2),
+                         name='softmax_expsum')
+    return tvm.compute((batch, out_dim), lambda b, oc: tvm.exp(out[b, oc] - max_elem[b]) / expsum[b],
+                       name='softmax_norm', tag='dense_softmax')
+
+
+def _softmax_input(softmax_out):
+    return [t for t in softmax_out.op.input_tensors if t.op.name not in ('softmax_max', 'softmax_expsum')][0]
+
+
+def _declaration_dense_softmax(sch, data, weight_pack, bias=None, out_dim=None, out_dtype='float32'):
+    return _declaration_softmax(_declaration_dense(sch, data, weight_pack, bias, out_dim, out_dtype))
+
+
+def _schedule_dense_pack(s, sch, weight_pack):
+    oc_chunk, k, oc_block = s[weight_pack].op.axis
+    s[weight_pack].vectorize(oc_block)
+    s[weight_pack].parallel(oc_chunk)
+
+
+def _schedule_dense(s, sch, data, weight_pack, dense_out, output, last):
+    C, O0, O = dense_out, output, last
+    CC = s.cache_write(C, 'global')
+
+    batch = get_const_tuple(C.shape)[0]
+    gemv = (batch == 1)
+
+    b, oc = s[C].op.axis
+    oc_chunk, oc_block = s[C].split(oc, factor=sch.oc_bn)
+    if gemv:
+        # memory-bound: one packed panel per task, streamed once
+        s[C].reorder(oc_chunk, b, oc_block)
+        parallel_axis = oc_chunk
+    else:
+        b_chunk, b_block = s[C].split(b, factor=sch.reg_n)
+        s[C].reorder(oc_chunk, b_chunk, b_block, oc_block)
+        parallel_axis = s[C].fuse(oc_chunk, b_chunk)
+    s[C].vectorize(oc_block)
+    if C == O:
+        s[C].parallel(parallel_axis)
+
+    s[CC].compute_at(s[C], parallel_axis)
+    b, oc = s[CC].op.axis
+    # (kq, k) on a weight pre-packed in the graph, see _packed_weight
+    reduce_axes = list(s[CC].op.reduce_axis)
+    oc_chunk, oc_block = s[CC].split(oc, factor=sch.oc_bn)
+    k_outer, k_inner = s[CC].split(reduce_axes[-1], factor=sch.k_factor)
+    k_axes = reduce_axes[:-1] + [k_outer, k_inner]
+    if gemv:
+        s[CC].reorder(*([oc_chunk] + k_axes + [b, oc_block]))
+    else:
+        b_chunk, b_block = s[CC].split(b, factor=sch.reg_n)
+        s[CC].reorder(*([oc_chunk, b_chunk] + k_axes + [b_block, oc_block]))
+        s[CC].unroll(b_block)
+    s[CC].unroll(k_inner)
+    s[CC].vectorize(oc_block)
+
+    # packed in the kernel only when the graph could not pre-pack the weight
+    if isinstance(weight_pack.op, tvm.tensor.ComputeOp):
+        if gemv:
+            # pack one panel right before it is consumed, so the weight is still read from DRAM only once
+            s[weight_pack].compute_at(s[C], parallel_axis)
+            s[weight_pack].vectorize(s[weight_pack].op.axis[2])
+        else:
+            _schedule_dense_pack(s, sch, weight_pack)
+
+    if O0 != O:
+        s[O0].compute_inline()
+
+    if C != O:
+        b, oc = s[O].op.axis
+        oc_chunk, oc_block = s[O].split(oc, factor=sch.oc_bn)
+        if gemv:
+            s[O].reorder(oc_chunk, b, oc_block)
+            parallel_axis = oc_chunk
+        else:
+            b_chunk, b_block = s[O].split(b, factor=sch.reg_n)
+            s[O].reorder(oc_chunk, b_chunk, b_block, oc_block)
+            parallel_axis = s[O].fuse(oc_chunk, b_chunk)
+        s[C].compute_at(s[O], parallel_axis)
+        s[O].vectorize(oc_block)
+        s[O].parallel(parallel_axis)
+
+    return s
+
+
+def _schedule_softmax(s, softmax_out, vec):
+    stages = dict((t.op.name, t) for t in softmax_out.op.input_tensors)
+    max_elem, expsum = stages['softmax_max'], stages['softmax_expsum']
+    b, oc = s[softmax_out].op.axis
+    oc_chunk, oc_block = s[softmax_out].split(oc, factor=vec)
+    s[softmax_out].vectorize(oc_block)
+    s[softmax_out].parallel(b)
+    s[max_elem].compute_at(s[softmax_out], b)
+    s[expsum].compute_at(s[softmax_out], b)
+
+
+def _schedule_dense_softmax(s, sch, data, weight_pack, dense_out, output, softmax_out):
+    # dense (+bias) is materialized once, the row reductions run in their own parallel loop
+    _schedule_dense(s, sch, data, weight_pack, dense_out, output, output)
+    _schedule_softmax(s, softmax_out, sch.oc_bn)
+    return s
@@ -0,0 +1,338 @@
+from __future__ import absolute_import as _abs
+import tvm
+from topi.util import get_const_tuple
+from topi.nn.pad import pad
+from collections import namedtuple
+
+from .avx512_dense import _packed_weight
+
+GemmWorkload = namedtuple('GemmWorkload', ['in_dtype', 'out_dtype', 'M', 'N', 'K'])
+
+# C[M, N] = A[M, K] * B[K, N], blocked as in GotoBLAS
+# mr x nr: register tile, nr columns are vectorized and mr rows unrolled
+# kc: K block, a kc x nr panel of B stays in L1 while it is swept over the mr row tiles
+# mc: M block, the mc x kc block of packed A stays in L2
+# nc: N block, the kc x nc panel of packed B stays in L3
+# (mc, nc) blocks are the parallel tasks, M and N are padded to multiples of them
+# prefetch: software prefetch of the packed B panel this many nr panels ahead, 0 is off
+AVX512GemmFwd = namedtuple('AVX512GemmFwd', ['mc', 'nc', 'kc', 'mr', 'nr', 'prefetch'])
+AVX512GemmFwd.__new__.__defaults__ = (0,)
+
+
+def _round_up(x, factor):
+    return (x + factor - 1) // factor * factor
+
+
+def _default_gemm_schedule(wkl):
+    """Fallback for shapes not in the table, sized for skylake-avx512: 32 zmm, 32KB L1, 1MB L2"""
+    nr = 32 if wkl.N >= 32 else 16
+    mr = min(8, wkl.M)
+    kc = min(256, wkl.K)
+    mc = min(_round_up(wkl.M, mr), mr * 8)
+    nc = min(_round_up(wkl.N, nr), nr * 8)
+    return AVX512GemmFwd(mc=mc, nc=nc, kc=kc, mr=mr, nr=nr)
+
+
+def _pack_panel(rows, K, block, padded_rows, load, dtype, name, tag):
+    """(rows, K) -> (padded_rows / block, K, block), load(k, row) gives one element, the tail is zero"""
+    return tvm.compute((padded_rows // block, K, block),
+                       lambda o, k, i:
+                       tvm.select(o * block + i < rows, load(k, o * block + i), tvm.const(0, dtype)),
+                       name=name, tag=tag)
+
+
+def _declaration_gemm_pack_a(sch, A):
+    """(M, K) -> (Mp / mr, K, mr)"""
+    M, K = get_const_tuple(A.shape)
+    return _pack_panel(M, K, sch.mr, _round_up(M, sch.mc), lambda k, m: A[m, k], A.dtype,
+                       'A_pack', 'gemm_pack_a')
+
+
+def _declaration_gemm_pack_b(sch, B, transpose_b=False):
+    """(K, N), or (N, K) with transpose_b, -> (Np / nr, K, nr). For a dense weight this is the
+    same layout as avx512_dense's weight_pack with oc_bn = nr, the graph pre-packs it when nc divides N."""
+    if transpose_b:
+        N, K = get_const_tuple(B.shape)
+        load = lambda k, n: B[n, k]
+    else:
+        K, N = get_const_tuple(B.shape)
+        load = lambda k, n: B[k, n]
+    return _pack_panel(N, K, sch.nr, _round_up(N, sch.nc), load, B.dtype, 'B_pack', 'gemm_pack_b')
+
+
+def _declaration_gemm_pad(sch, A_pack, B_pack, out_dtype='float32'):
+    a_chunk, K, mr = get_const_tuple(A_pack.shape)
+    if len(B_pack.shape) == 3:
+        b_chunk, _, nr = get_const_tuple(B_pack.shape)
+        Np = b_chunk * nr
+    else:
+        # (N, K) view of a dense weight pre-packed in the graph, N is a multiple of nc
+        nr, Np = sch.nr, get_const_tuple(B_pack.shape)[0]
+    axes, k, load_b = _packed_weight(B_pack, K, nr)
+    return tvm.compute((a_chunk * mr, Np), lambda m, n:
+                       tvm.sum(A_pack[m // mr, k, m % mr].astype(out_dtype) *
+                               load_b(n).astype(out_dtype), axis=axes),
+                       name='gemm_pad', tag='gemm_pad')
+
+
+def _declaration_gemm(sch, A_pack, B_pack, M, N, out_dtype='float32'):
+    """Operands come from the pack declarations, either inline or packed offline (placeholders)."""
+    C_pad = _declaration_gemm_pad(sch, A_pack, B_pack, out_dtype)
+    return tvm.compute((M, N), lambda m, n: C_pad[m, n], name='gemm', tag='gemm')
+
+
+def _declaration_conv_im2col(sch, data, kernel_pack, num_filter, kernel_size, stride, padding,
+                             out_dtype='float32', dilation=(1, 1)):
+    """NCHW conv as (CO, CI*KH*KW) x (CI*KH*KW, OH*OW). The kernel is the A operand, packed offline with
+    _declaration_gemm_pack_a on kernel.reshape(CO, -1). im2col is fused into the packing of B, for a
+    1x1 conv with unit stride that packing is a plain copy.
+
+    Standalone: no entry of _SCH_TO_DECL_FUNC dispatches here, graph convs keep the NCHWc schedules."""
+    batch_size, in_channel, in_height, in_width = get_const_tuple(data.shape)
+    assert batch_size == 1, "only support batch size=1 im2col convolution"
+    KH, KW = kernel_size
+    HSTR, WSTR = stride
+    HPAD, WPAD = padding
+    HDIL, WDIL = dilation
+    out_height = (in_height + 2 * HPAD - (KH - 1) * HDIL - 1) // HSTR + 1
+    out_width = (in_width + 2 * WPAD - (KW - 1) * WDIL - 1) // WSTR + 1
+    K = in_channel * KH * KW
+    P = out_height * out_width
+
+    if HPAD != 0 or WPAD != 0:
+        data_pad = pad(data, (0, 0, HPAD, WPAD), name="data_pad")
+    else:
+        data_pad = data
+
+    def col(k, p):
+        ci, r = k // (KH * KW), k % (KH * KW)
+        return data_pad[0, ci, (p // out_width) * HSTR + (r // KW) * HDIL, (p % out_width) * WSTR + (r % KW) * WDIL]
+    data_col = _pack_panel(P, K, sch.nr, _round_up(P, sch.nc), col, data.dtype, 'data_col', 'gemm_pack_b')
+
+    C_pad = _declaration_gemm_pad(sch, kernel_pack, data_col, out_dtype)
+    return tvm.compute((batch_size, num_filter, out_height, out_width),
+                       lambda n, co, h, w: C_pad[co, h * out_width + w],
+                       name='conv_im2col', tag='gemm')
+
+
+def _schedule_gemm_pack(s, sch, pack):
+    for t in pack.op.input_tensors:
+        if isinstance(t.op, tvm.tensor.ComputeOp) and 'pad' in t.op.tag:
+            s[t].compute_inline()
+    o, k, i = s[pack].op.axis
+    s[pack].vectorize(i)
+    s[pack].parallel(o)
+
+
+def _schedule_gemm(s, sch, A_pack, B_pack, C_pad, output, last):
+    C, O0, O = C_pad, output, last
+
+    if O0 != O:
+        s[O0].compute_inline()
+
+    # one (mc, nc) block per task, parallel over both M and N blocks
+    if len(s[O].op.axis) == 4:
+        _, m, h, w = s[O].op.axis
+        n = s[O].fuse(h, w)
+    else:
+        m, n = s[O].op.axis
+    mo, mi = s[O].split(m, factor=sch.mc)
+    no, ni = s[O].split(n, factor=sch.nc)
+    s[O].reorder(no, mo, mi, ni)
+    parallel_axis = s[O].fuse(no, mo)
+    _, ni = s[O].split(ni, factor=sch.nr)
+    s[O].vectorize(ni)
+    s[O].parallel(parallel_axis)
+
+    # the block is accumulated in place, one K block at a time
+    s[C].compute_at(s[O], parallel_axis)
+    m, n = s[C].op.axis
+    # (kq, k) on a B pre-packed in the graph, see avx512_dense._packed_weight
+    reduce_axes = list(s[C].op.reduce_axis)
+    mo, mi = s[C].split(m, factor=sch.mr)
+    no, ni = s[C].split(n, factor=sch.nr)
+    ko, ki = s[C].split(reduce_axes[-1], factor=sch.kc)
+    s[C].reorder(*(reduce_axes[:-1] + [ko, no, mo, ki, mi, ni]))
+    s[C].unroll(mi)
+    s[C].vectorize(ni)
+    if sch.prefetch:
+        s[C].prefetch(B_pack, no, sch.prefetch)
+
+    # activations are packed per call: A one L2 block at a time, B as its own parallel stage
+    if isinstance(A_pack.op, tvm.tensor.ComputeOp):
+        s[A_pack].compute_at(s[C], ko)
+        s[A_pack].unroll(s[A_pack].op.axis[2])
+    if isinstance(B_pack.op, tvm.tensor.ComputeOp):
+        _schedule_gemm_pack(s, sch, B_pack)
+
+    return s
+
+
+# Many small independent GEMMs in one kernel. Problems of one shape come as (batch, M, K) x (batch, K, N)
+# tensors, the parallel loop runs over (problem, mr row tile), so every problem costs a few tasks
+# instead of a launch and a barrier of its own. Problems of different shapes come as lists, one
+# extern kernel computes all of them with a single parallel loop over (problem, mr row tile, nr
+# column panel), each task packing its B panel at the problem's shape.
+BatchGemmWorkload = namedtuple('BatchGemmWorkload', ['in_dtype', 'out_dtype', 'shapes'])
+AVX512BatchGemmFwd = namedtuple('AVX512BatchGemmFwd', ['kc', 'mr', 'nr'])
+
+
+def _default_batch_gemm_schedule(wkl):
+    M = max(m for m, _, _ in wkl.shapes)
+    N = max(n for _, n, _ in wkl.shapes)
+    K = max(k for _, _, k in wkl.shapes)
+    return AVX512BatchGemmFwd(kc=min(256, K), mr=min(8, M), nr=32 if N > 16 else 16)
+
+
+def _get_batch_gemm_workload(A, B, out_dtype):
+    if isinstance(A, tvm.tensor.Tensor):
+        batch, M, K = get_const_tuple(A.shape)
+        _, _, N = get_const_tuple(B.shape)
+        shapes = ((M, N, K), ) * batch
+        return BatchGemmWorkload(A.dtype, out_dtype, shapes)
+    shapes = tuple((get_const_tuple(a.shape)[0], get_const_tuple(b.shape)[1], get_const_tuple(a.shape)[1])
+                   for a, b in zip(A, B))
+    return BatchGemmWorkload(A[0].dtype, out_dtype, shapes)
+
+
+def _gemm_list_tiles(sch, shapes):
+    """[(first tile, mr, column panels)] of each (M, N, K) problem of a list, and the number of tiles"""
+    tiles, start = [], 0
+    for M, N, K in shapes:
+        mr = min(sch.mr, M)
+        panels = (N + sch.nr - 1) // sch.nr
+        tiles.append((start, mr, panels))
+        start += (M + mr - 1) // mr * panels
+    return tiles, start
+
+
+def _gemm_list_ir(sch, a_bufs, b_bufs, c_bufs, shapes, out_dtype):
+    """One parallel loop over the tiles of all problems. A task packs the K x nr panel of B its tile
+    needs, zero padded past N, and accumulates the mr x nr tile in registers. Rows past M repeat
+    the last row of A and are not stored."""
+    ib = tvm.ir_builder.create()
+    tiles, num_tiles = _gemm_list_tiles(sch, shapes)
+    nr = sch.nr
+
+    def tile_ir(t, idx):
+        M, N, K = shapes[idx]
+        start, mr, panels = tiles[idx]
+        a, b, c = ib.buffer_ptr(a_bufs[idx]), ib.buffer_ptr(b_bufs[idx]), ib.buffer_ptr(c_bufs[idx])
+        m0 = (t - start) // panels * mr
+        n0 = (t - start) % panels * nr
+        row = (lambda i: m0 + i) if M % mr == 0 else (lambda i: tvm.min(m0 + i, M - 1))
+
+        b_pack = ib.allocate(b_bufs[idx].dtype, (K * nr, ), name='b_pack', scope='local')
+        with ib.for_range(0, K, name='k') as k:
+            if N % nr == 0:
+                with ib.for_range(0, nr, name='j', for_type='vectorize') as j:
+                    b_pack[k * nr + j] = b[k * N + n0 + j]
+            else:
+                with ib.if_scope(n0 + nr <= N):
+                    with ib.for_range(0, nr, name='j', for_type='vectorize') as j:
+                        b_pack[k * nr + j] = b[k * N + n0 + j]
+                with ib.else_scope():
+                    with ib.for_range(0, nr, name='j') as j:
+                        b_pack[k * nr + j] = tvm.select(n0 + j < N, b[k * N + tvm.min(n0 + j, N - 1)],
+                                                        tvm.const(0, b_bufs[idx].dtype))
+
+        acc = ib.allocate(out_dtype, (mr * nr, ), name='acc', scope='local')
+        with ib.for_range(0, mr, name='i', for_type='unroll') as i:
+            with ib.for_range(0, nr, name='j', for_type='vectorize') as j:
+                acc[i * nr + j] = tvm.const(0, out_dtype)
+        with ib.for_range(0, K, name='k') as k:
+            with ib.for_range(0, mr, name='i', for_type='unroll') as i:
+                with ib.for_range(0, nr, name='j', for_type='vectorize') as j:
+                    acc[i * nr + j] = acc[i * nr + j] + \
+                        a[row(i) * K + k].astype(out_dtype) * b_pack[k * nr + j].astype(out_dtype)
+
+        with ib.for_range(0, mr, name='i', for_type='unroll') as i:
+            with ib.if_scope(m0 + i < M):
+                if N % nr == 0:
+                    with ib.for_range(0, nr, name='j', for_type='vectorize') as j:
+                        c[(m0 + i) * N + n0 + j] = acc[i * nr + j]
+                else:
+                    with ib.if_scope(n0 + nr <= N):
+                        with ib.for_range(0, nr, name='j', for_type='vectorize') as j:
+                            c[(m0 + i) * N + n0 + j] = acc[i * nr + j]
+                    with ib.else_scope():
+                        with ib.for_range(0, N % nr, name='j') as j:
+                            c[(m0 + i) * N + n0 + j] = acc[i * nr + j]
+
+    def problem_ir(t, idx):
+        # the tiles of problem idx are [start, next start)
+        if idx + 1 == len(shapes):
+            tile_ir(t, idx)
+            return
+        with ib.if_scope(t < tiles[idx + 1][0]):
+            tile_ir(t, idx)
+        with ib.else_scope():
+            problem_ir(t, idx + 1)
+
+    with ib.for_range(0, num_tiles, name='t', for_type='parallel' if num_tiles > 1 else 'serial') as t:
+        problem_ir(t, 0)
+    return ib.get()
+
+
+def _declaration_batch_gemm(sch, A, B, out_dtype='float32'):
+    """C_i = A_i * B_i for A, B either (batch, M, K) x (batch, K, N) tensors, the output is then
+    (batch, M, N), or lists of (M_i, K_i) x (K_i, N_i) tensors, the output is then the list of C_i."""
+    wkl = _get_batch_gemm_workload(A, B, out_dtype)
+    if not isinstance(A, tvm.tensor.Tensor):
+        # a single extern op with one output per problem, nothing to schedule
+        num = len(wkl.shapes)
+        outputs = tvm.extern([(M, N) for M, N, _ in wkl.shapes], list(A) + list(B),
+                             lambda ins, outs: _gemm_list_ir(sch, ins[:num], ins[num:], outs, wkl.shapes, out_dtype),
+                             name='batch_gemm', tag='batch_gemm_list', dtype=[out_dtype] * num)
+        return outputs if isinstance(outputs, list) else [outputs]
+
+    batch, M, K = get_const_tuple(A.shape)
+    N = get_const_tuple(B.shape)[2]
+    Mp, Np = _round_up(M, sch.mr), _round_up(N, sch.nr)
+    zero = tvm.const(0, wkl.in_dtype)
+    A_pack = tvm.compute((batch, Mp // sch.mr, K, sch.mr), lambda b, o, k, i:
+                         tvm.select(o * sch.mr + i < M, A[b, tvm.min(o * sch.mr + i, M - 1), k], zero),
+                         name='A_pack', tag='gemm_pack_a')
+    B_pack = tvm.compute((batch, Np // sch.nr, K, sch.nr), lambda b, o, k, i:
+                         tvm.select(o * sch.nr + i < N, B[b, k, tvm.min(o * sch.nr + i, N - 1)], zero),
+                         name='B_pack', tag='gemm_pack_b')
+
+    k = tvm.reduce_axis((0, K), name='k')
+    C_pad = tvm.compute((batch, Mp, Np), lambda b, m, n:
+                        tvm.sum(A_pack[b, m // sch.mr, k, m % sch.mr].astype(out_dtype) *
+                                B_pack[b, n // sch.nr, k, n % sch.nr].astype(out_dtype), axis=k),
+                        name='batch_gemm_pad', tag='batch_gemm_pad')
+    return tvm.compute((batch, M, N), lambda b, m, n: C_pad[b, m, n], name='batch_gemm', tag='batch_gemm')
+
+
+def _schedule_batch_gemm(s, sch, A_pack, B_pack, C_pad, output, last):
+    C, O0, O = C_pad, output, last
+
+    if O0 != O:
+        s[O0].compute_inline()
+
+    # one (problem, mr rows) tile per task
+    b, m, n = s[O].op.axis
+    mo, mi = s[O].split(m, factor=sch.mr)
+    parallel_axis = s[O].fuse(b, mo)
+    _, ni = s[O].split(n, factor=sch.nr)
+    s[O].vectorize(ni)
+    s[O].parallel(parallel_axis)
+
+    s[C].compute_at(s[O], parallel_axis)
+    _, m, n = s[C].op.axis
+    k, = s[C].op.reduce_axis
+    no, ni = s[C].split(n, factor=sch.nr)
+    ko, ki = s[C].split(k, factor=sch.kc)
+    s[C].reorder(ko, no, ki, m, ni)
+    s[C].unroll(m)
+    s[C].vectorize(ni)
+
+    # packing is tiny next to the products, each pack is one parallel pass over all problems
+    for pack in (A_pack, B_pack):
+        if isinstance(pack.op, tvm.tensor.ComputeOp):
+            b, o, k, i = s[pack].op.axis
+            s[pack].parallel(s[pack].fuse(b, o))
+            s[pack].vectorize(i)
+
+    return s
@@ -0,0 +1,73 @@
+from __future__ import absolute_import as _abs
+import ctypes
+import os
+import tvm
+from topi.util import get_const_tuple
+
+# outputs at least this large are written with non-temporal stores, smaller ones are likely
+# still in cache when the next layer reads them
+NT_STORE_MIN_BYTES = 4 << 20
+
+_LIB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'c_intrin', 'libstream_store.so')
+_LIB = None
+
+
+def load_stream_store():
+    """tvm_stream_store_f32 has to be resolvable when the compiled module is loaded (make -C c_intrin)"""
+    global _LIB
+    if _LIB is None:
+        _LIB = ctypes.CDLL(_LIB_PATH, ctypes.RTLD_GLOBAL)
+    return _LIB
+
+
+def _stream_copy_intrin(block, shape, dtype='float32'):
+    """Copy of the (chunks, rows, width, oc_bn) output block of one task out of its compact cache buffer"""
+    chunks, rows, width = block
+    oc_bn = shape[4]
+    src = tvm.placeholder((chunks, rows, width, oc_bn), dtype=dtype, name='src')
+    dst = tvm.compute(src.shape, lambda c, h, w, b: src[c, h, w, b], name='dst')
+    src_buf = tvm.decl_buffer(src.shape, src.dtype, name='src_buf', offset_factor=1)
+    dst_buf = tvm.decl_buffer(dst.shape, dst.dtype, name='dst_buf', offset_factor=1,
+                              strides=[tvm.var('c_stride'), tvm.var('h_stride'), oc_bn, 1])
+
+    def intrin_func(ins, outs):
+        ib = tvm.ir_builder.create()
+        ib.emit(tvm.call_extern('int32', 'tvm_stream_store_f32', outs[0].access_ptr('w'), ins[0].access_ptr('r'),
+                                chunks, rows, width * oc_bn, outs[0].strides[0], outs[0].strides[1]))
+        return ib.get()
+
+    with tvm.build_config(offset_factor=1):
+        return tvm.decl_tensor_intrin(dst.op, intrin_func, binds={src: src_buf, dst: dst_buf})
+
+
+def use_stream_store(sch, output, block):
+    """Whether the NCHW[x]c output is written with streaming stores, each parallel task writing a
+    block = (oc chunks, rows, width) of it"""
+    if not getattr(sch, 'nt_store', False) or output.dtype != 'float32':
+        return False
+    shape = get_const_tuple(output.shape)
+    if len(shape) != 5 or shape[4] != sch.oc_bn:
+        return False
+    nbytes = 4
+    for x in shape:
+        nbytes *= x
+    chunks, rows, width = block
+    return nbytes >= NT_STORE_MIN_BYTES and shape[1] % chunks == 0 and shape[2] % rows == 0 and \
+        shape[3] % width == 0 and (width * shape[4]) % 16 == 0
+
+
+def cache_stream_output(s, sch, output, block):
+    """For an output with elementwise ops fused into it: the ops move to a cache_write stage, which is
+    returned, and output becomes the plain copy _schedule_stream_store stores. None if output is not
+    stream-stored. Call it before output is scheduled."""
+    if not use_stream_store(sch, output, block):
+        return None
+    return s.cache_write(output, 'global')
+
+
+def _schedule_stream_store(s, output, axis, block):
+    """The loop nest of the output from axis, the outermost loop inside a parallel task, down is the copy of
+    the task's block out of its cache_write buffer. It becomes one call storing the block with streaming
+    stores and fencing once."""
+    load_stream_store()
+    s[output].tensorize(axis, _stream_copy_intrin(block, get_const_tuple(output.shape), output.dtype))
@@ -0,0 +1,129 @@
+from __future__ import absolute_import as _abs
+import numpy as np
+import tvm
+
+# packed weights can be stored in half precision, accumulation stays in float32
+# A kernel packed offline is handed over in its storage dtype (see compress_weight_np). NNVM types a
+# graph kernel like the conv's data, so in the graph two storage-dtype weights share one float32 word
+# instead (_declaration_weight_pair, folded by precompute): 1x1 convs whose schedule sets weight_dtype
+# stream half the kernel bytes. Other graph kernels stay float32, round_params reproduces the accuracy.
+# 'bfloat16' has no TVM dtype, it is carried as the upper 16 bits of a float32 in a uint16
+_STORAGE_DTYPE = {
+    'float32': 'float32',
+    'float16': 'float16',
+    'bfloat16': 'uint16',
+}
+
+
+def storage_dtype(weight_dtype):
+    return _STORAGE_DTYPE[weight_dtype]
+
+
+def _weight_load(value, weight_dtype):
+    """Widen one stored weight element to float32, this lands in the conv/dense inner loop."""
+    if weight_dtype == 'float32' or value.dtype == 'float32':
+        # kernels coming from the NNVM graph are always float32
+        return value
+    if weight_dtype == 'float16':
+        # vcvtph2ps with F16C
+        return value.astype('float32')
+    assert weight_dtype == 'bfloat16', "unsupported weight dtype %s" % weight_dtype
+    return tvm.call_pure_intrin('float32', 'reinterpret', value.astype('uint32') << 16)
+
+
+def _weight_store(value, weight_dtype):
+    """Narrow one float32 weight element to its storage dtype, round to nearest even."""
+    if weight_dtype == 'float32':
+        return value
+    if weight_dtype == 'float16':
+        return value.astype('float16')
+    assert weight_dtype == 'bfloat16', "unsupported weight dtype %s" % weight_dtype
+    bits = tvm.call_pure_intrin('uint32', 'reinterpret', value)
+    lsb = (bits >> 16) & tvm.const(1, 'uint32')
+    return ((bits + tvm.const(0x7FFF, 'uint32') + lsb) >> 16).astype('uint16')
+
+
+def _storage_bits(value, weight_dtype):
+    """The 16 storage bits of one float32 weight, in a uint32."""
+    if weight_dtype == 'float16':
+        return tvm.call_pure_intrin('uint16', 'reinterpret', value.astype('float16')).astype('uint32')
+    return _weight_store(value, weight_dtype).astype('uint32')
+
+
+def _declaration_weight_pair(kernel, weight_dtype, ic_bn):
+    """OIHW float32 kernel -> same shape, each ic_bn block of input channels holding its weights pairwise
+    in the first half: word j has weight 2j in its low and 2j + 1 in its high 16 bits, the second half
+    is zero. Packed to ic_bn blocks afterwards, a conv reading the words streams half the bytes."""
+    half = ic_bn // 2
+
+    def _word(o, i, h, w):
+        base = i // ic_bn * ic_bn + tvm.min(i % ic_bn, half - 1) * 2
+        bits = _storage_bits(kernel[o, base, h, w], weight_dtype) | \
+            (_storage_bits(kernel[o, base + 1, h, w], weight_dtype) << 16)
+        return tvm.select(i % ic_bn < half, tvm.call_pure_intrin('float32', 'reinterpret', bits),
+                          tvm.const(0, 'float32'))
+    return tvm.compute(kernel.shape, _word, name='weight_pair', tag='elemwise')
+
+
+def _weight_pair_load(word, odd, weight_dtype):
+    """Weight 2j + odd of the float32 word j of a _declaration_weight_pair kernel, widened to float32."""
+    bits = tvm.call_pure_intrin('uint32', 'reinterpret', word)
+    if weight_dtype == 'bfloat16':
+        return tvm.call_pure_intrin('float32', 'reinterpret',
+                                    tvm.select(odd, bits & tvm.const(0xFFFF0000, 'uint32'), bits << 16))
+    assert weight_dtype == 'float16', "unsupported weight dtype %s" % weight_dtype
+    half = tvm.select(odd, bits >> 16, bits & tvm.const(0xFFFF, 'uint32')).astype('uint16')
+    return tvm.call_pure_intrin('float16', 'reinterpret', half).astype('float32')
+
+
+def _declaration_weight_compress(weight, weight_dtype):
+    """Offline conversion of an already packed float32 weight."""
+    return tvm.compute(weight.shape, lambda *i: _weight_store(weight(*i), weight_dtype),
+                       name='weight_compress', tag='weight_compress')
+
+
+def round_weight_np(weight, weight_dtype):
+    """float32 array holding exactly the values the reduced-precision kernel will see."""
+    weight = np.ascontiguousarray(weight, dtype='float32')
+    if weight_dtype == 'float32':
+        return weight
+    if weight_dtype == 'float16':
+        return weight.astype('float16').astype('float32')
+    assert weight_dtype == 'bfloat16', "unsupported weight dtype %s" % weight_dtype
+    bits = weight.view('uint32').astype('uint64')
+    bits = ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16) << 16
+    return bits.astype('uint32').view('float32')
+
+
+def compress_weight_np(weight, weight_dtype):
+    """Packed float32 weight in its storage dtype, what _declaration_weight_compress computes."""
+    weight = round_weight_np(weight, weight_dtype)
+    if weight_dtype == 'bfloat16':
+        return (weight.view('uint32') >> 16).astype('uint16')
+    return weight.astype(storage_dtype(weight_dtype))
+
+
+def pair_weight_np(weight, weight_dtype, ic_bn):
+    """OIHW float32 kernel as _declaration_weight_pair computes it."""
+    bits = compress_weight_np(weight, weight_dtype).view('uint16').astype('uint32')
+    oc, ic, kh, kw = weight.shape
+    bits = bits.reshape(oc, ic // ic_bn, ic_bn // 2, 2, kh, kw)
+    words = np.zeros((oc, ic // ic_bn, ic_bn, kh, kw), dtype='uint32')
+    words[:, :, :ic_bn // 2] = bits[:, :, :, 0] | (bits[:, :, :, 1] << 16)
+    return words.reshape(oc, ic, kh, kw).view('float32')
+
+
+def round_params(params, weight_dtype):
+    """Round conv/dense weights of a compiled graph's params to weight_dtype precision.
+    Running the MXNet comparison on top of this validates the accuracy impact end to end."""
+    rounded = {}
+    for name, value in params.items():
+        value_np = value.asnumpy()
+        # packed conv kernels are 6-d, dense weights 2-d, biases and bn params are left alone, so are
+        # 1x1 kernels already stored pairwise: (OC, IC, ic, oc, 1, 1) with the second half of ic zero
+        paired = value_np.ndim == 6 and value_np.shape[4:] == (1, 1) and \
+            not value_np[:, :, value_np.shape[2] // 2:].any()
+        if value_np.dtype == np.float32 and value_np.ndim in (2, 6) and not paired:
+            value_np = round_weight_np(value_np, weight_dtype)
+        rounded[name] = tvm.nd.array(value_np)
+    return rounded
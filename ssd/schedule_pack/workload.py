@@ -0,0 +1,53 @@
+from __future__ import absolute_import as _abs
+from collections import namedtuple
+from topi.util import get_const_tuple
+from topi.nn.conv2d import Workload as _Workload
+from topi.nn.conv2d import _get_workload as _get_workload_dense
+
+# topi's conv workload plus the number of groups (1 is a dense conv, in_filter is depthwise)
+# and the kernel dilation (1 is a plain conv)
+Workload = namedtuple('Workload', _Workload._fields + ('groups', 'hdilation', 'wdilation'))
+Workload.__new__.__defaults__ = (1, 1, 1)
+
+
+def _get_workload(data, kernel, stride, padding, out_dtype, groups=1, dilation=(1, 1)):
+    # topi takes in_filter from the data shape, so the kernel's ic / groups dimension does not matter here
+    wkl = _get_workload_dense(data, kernel, stride, padding, out_dtype)
+    return Workload(*wkl, groups=groups, hdilation=dilation[0], wdilation=dilation[1])
+
+
+def _infer_groups(in_channel, num_filter, kernel_size, kernel):
+    """groups of a conv from its (possibly packed) kernel, which holds num_filter * in_channel / groups * kh * kw elements"""
+    kh, kw = kernel_size
+    size = 1
+    for x in get_const_tuple(kernel.shape):
+        size *= x
+    in_per_group = size // (num_filter * kh * kw)
+    return in_channel // in_per_group
+
+
+def _kernel_ic_bn(wkl, ic_bn):
+    """ic block of the packed kernel, whose ic dimension is only in_filter / groups wide"""
+    in_per_group = wkl.in_filter // wkl.groups
+    if in_per_group % ic_bn == 0:
+        return ic_bn
+    assert ic_bn % in_per_group == 0, \
+        "ic_bn=%d has to be aligned to the group width %d" % (ic_bn, in_per_group)
+    return in_per_group
+
+
+def _group_in_channel(wkl, oc_bn, oc_chunk, oc_block, ic):
+    """Input channel read for output channel (oc_chunk, oc_block) at position ic of its group."""
+    if wkl.groups == 1:
+        return ic
+    in_per_group = wkl.in_filter // wkl.groups
+    out_per_group = wkl.out_filter // wkl.groups
+    if out_per_group % oc_bn == 0:
+        # the block lies inside one group, data is a broadcast scalar as in the dense conv
+        group = oc_chunk // (out_per_group // oc_bn)
+    else:
+        # the block spans several groups, the depthwise limit: every lane reads its own channel
+        assert oc_bn % out_per_group == 0, \
+            "oc_bn=%d has to be aligned to the group width %d" % (oc_bn, out_per_group)
+        group = oc_chunk * (oc_bn // out_per_group) + oc_block // out_per_group
+    return group * in_per_group + ic
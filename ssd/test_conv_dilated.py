@@ -0,0 +1,62 @@
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_conv, _SCH_TO_DECL_FUNC, _SCH_TO_SCH_FUNC
+from schedule_pack.workload import Workload
+from ref_conv import conv2d_nchw
+
+device = 'llvm -mcpu=skylake-avx512'
+num_pass = 1000
+
+
+def verify_conv2d_dilated(in_size, in_channel, num_filter, kernel, padding, dilation):
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, 1, 1, hdilation=dilation, wdilation=dilation)
+    sch = _get_schedule_conv(wkl)
+    print(wkl, sch)
+    ic_bn, oc_bn = sch.ic_bn, sch.oc_bn
+
+    ctx = tvm.context(device, 0)
+    a_np = np.random.uniform(size=(1, in_channel, in_size, in_size)).astype('float32')
+    w_np = np.random.uniform(size=(num_filter, in_channel, kernel, kernel)).astype('float32')
+    ref = conv2d_nchw(a_np, w_np, 1, padding, dilation)
+
+    # NCHW -> NCHW[ic_bn]c and OIHW -> OIHW[i]i[o]o, what the alter_op_layout pass inserts in a graph
+    a_vec_np = a_np.reshape(1, in_channel // ic_bn, ic_bn, in_size, in_size).transpose(0, 1, 3, 4, 2)
+    w_vec_np = w_np.reshape(num_filter // oc_bn, oc_bn, in_channel // ic_bn, ic_bn, kernel, kernel) \
+                   .transpose(0, 2, 4, 5, 3, 1)
+
+    A = tvm.placeholder(a_vec_np.shape, name='A')
+    W = tvm.placeholder(w_vec_np.shape, name='W')
+    with tvm.target.create(device):
+        Conv = _SCH_TO_DECL_FUNC[type(sch)](wkl, A, W)
+        s = tvm.create_schedule(Conv.op)
+        conv_out = Conv.op.input_tensors[0]
+        data_vec = conv_out.op.input_tensors[0]
+        data_pad = data_vec.op.input_tensors[0]
+        _SCH_TO_SCH_FUNC[type(sch)](s, wkl, A, data_pad, data_vec, W, conv_out, Conv, Conv)
+    print(tvm.lower(s, [A, W, Conv], simple_mode=True))
+
+    conv = tvm.nd.array(np.zeros(get_const_tuple(Conv.shape), dtype='float32'), ctx)
+    func = tvm.build(s, [A, W, Conv], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_vec_np, ctx), tvm.nd.array(w_vec_np, ctx), conv).mean
+    oh = ref.shape[2]
+    gflops = 2.0 * in_channel * num_filter * kernel * kernel * oh * oh / cost / 1e9
+    print('conv dilation=%d: %g ms/op, %.2f GFLOPS' % (dilation, cost * 1000.0, gflops))
+
+    out = conv.asnumpy()
+    n, C, h, w, c = out.shape
+    out = out.transpose(0, 1, 4, 2, 3).reshape(n, C * c, h, w)
+    np.testing.assert_allclose(out, ref, rtol=1e-4)
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_conv_dilated.py
+    # atrous VGG16 fc6
+    verify_conv2d_dilated(32, 512, 1024, 3, 6, 6)
+    verify_conv2d_dilated(19, 512, 1024, 3, 6, 6)
+    # DeepLab-style ResNet-50
+    verify_conv2d_dilated(32, 512, 512, 3, 2, 2)
+    verify_conv2d_dilated(64, 512, 512, 3, 4, 4)
@@ -0,0 +1,65 @@
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_conv, _SCH_TO_DECL_FUNC, _SCH_TO_SCH_FUNC
+from schedule_pack.workload import Workload, _kernel_ic_bn
+from ref_conv import conv2d_nchw
+
+device = 'llvm -mcpu=skylake-avx512'
+num_pass = 1000
+
+
+def verify_conv2d_group(in_size, in_channel, num_filter, kernel, stride, padding, groups):
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride, groups)
+    sch = _get_schedule_conv(wkl)
+    print(wkl, sch)
+    ic_bn, oc_bn = sch.ic_bn, sch.oc_bn
+    kernel_ic_bn = _kernel_ic_bn(wkl, ic_bn)
+    ipg = in_channel // groups
+
+    ctx = tvm.context(device, 0)
+    a_np = np.random.uniform(size=(1, in_channel, in_size, in_size)).astype('float32')
+    w_np = np.random.uniform(size=(num_filter, ipg, kernel, kernel)).astype('float32')
+    ref = conv2d_nchw(a_np, w_np, stride, padding, groups=groups)
+
+    # NCHW -> NCHW[ic_bn]c and OIHW -> OIHW[i]i[o]o, what the alter_op_layout pass inserts in a graph
+    a_vec_np = a_np.reshape(1, in_channel // ic_bn, ic_bn, in_size, in_size).transpose(0, 1, 3, 4, 2)
+    w_vec_np = w_np.reshape(num_filter // oc_bn, oc_bn, ipg // kernel_ic_bn, kernel_ic_bn, kernel, kernel) \
+                   .transpose(0, 2, 4, 5, 3, 1)
+
+    A = tvm.placeholder(a_vec_np.shape, name='A')
+    W = tvm.placeholder(w_vec_np.shape, name='W')
+    with tvm.target.create(device):
+        Conv = _SCH_TO_DECL_FUNC[type(sch)](wkl, A, W)
+        s = tvm.create_schedule(Conv.op)
+        data_pad = Conv.op.input_tensors[0]
+        data_pad = data_pad if isinstance(data_pad.op, tvm.tensor.ComputeOp) else None
+        _SCH_TO_SCH_FUNC[type(sch)](s, wkl, A, data_pad, data_pad, W, Conv, Conv, Conv)
+    print(tvm.lower(s, [A, W, Conv], simple_mode=True))
+
+    conv = tvm.nd.array(np.zeros(get_const_tuple(Conv.shape), dtype='float32'), ctx)
+    func = tvm.build(s, [A, W, Conv], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_vec_np, ctx), tvm.nd.array(w_vec_np, ctx), conv).mean
+    oh = (in_size + 2 * padding - kernel) // stride + 1
+    gflops = 2.0 * ipg * num_filter * kernel * kernel * oh * oh / cost / 1e9
+    print('conv group=%d: %g ms/op, %.2f GFLOPS' % (groups, cost * 1000.0, gflops))
+
+    out = conv.asnumpy()
+    n, C, h, w, c = out.shape
+    out = out.transpose(0, 1, 4, 2, 3).reshape(n, C * c, h, w)
+    np.testing.assert_allclose(out, ref, rtol=1e-4)
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_conv_group.py
+    # ResNeXt-50 32x4d, group width 4 / 8 share a block, 16 / 32 are split into blocks
+    verify_conv2d_group(56, 128, 128, 3, 1, 1, 32)
+    verify_conv2d_group(56, 256, 256, 3, 2, 1, 32)
+    verify_conv2d_group(14, 512, 512, 3, 1, 1, 32)
+    verify_conv2d_group(7, 1024, 1024, 3, 1, 1, 32)
+    # depthwise
+    verify_conv2d_group(56, 128, 128, 3, 1, 1, 128)
+    verify_conv2d_group(14, 512, 512, 3, 1, 1, 512)
@@ -0,0 +1,86 @@
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_conv
+from schedule_pack.workload import Workload
+from schedule_pack.avx2_conv_int8 import _declaration_kernel_pack, _declaration_conv, _schedule_conv, data_max
+from ref_conv import conv2d_nchw
+
+# int8 path only needs AVX2, it also runs on skylake-avx512
+device = 'llvm -mcpu=core-avx2'
+num_pass = 1000
+
+
+def verify_conv2d_int8(in_size, in_channel, num_filter, kernel, stride, padding, requantize=False):
+    wkl = Workload('uint8', 'int32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride)
+    sch = _get_schedule_conv(wkl)
+    print(wkl, sch)
+
+    ctx = tvm.context(device, 0)
+    a_np = np.random.randint(0, data_max + 1, size=(1, in_channel, in_size, in_size)).astype('uint8')
+    w_np = np.random.randint(-127, 128, size=(num_filter, in_channel, kernel, kernel)).astype('int8')
+    ref = conv2d_nchw(a_np, w_np, stride, padding)
+
+    # NCHW -> NCHW[ic_bn]c, done by the previous layer's epilogue in a real network
+    a_vec_np = a_np.reshape(1, in_channel // sch.ic_bn, sch.ic_bn, in_size, in_size).transpose(0, 1, 3, 4, 2)
+
+    W = tvm.placeholder(w_np.shape, dtype='int8', name='W')
+    W_pack = _declaration_kernel_pack(sch, W)
+    s = tvm.create_schedule(W_pack.op)
+    w_pack = tvm.nd.array(np.zeros(get_const_tuple(W_pack.shape), dtype='int8'), ctx)
+    tvm.build(s, [W, W_pack], device)(tvm.nd.array(w_np, ctx), w_pack)
+
+    A = tvm.placeholder(a_vec_np.shape, dtype='uint8', name='A')
+    W_pack = tvm.placeholder(get_const_tuple(W_pack.shape), dtype='int8', name='W_pack')
+    oc_chunk = num_filter // sch.oc_bn
+    Multiplier = tvm.placeholder((oc_chunk, sch.oc_bn), name='Multiplier')
+    Bias = tvm.placeholder((oc_chunk, sch.oc_bn), name='Bias')
+    with tvm.target.create(device):
+        Out = _declaration_conv(wkl, A, W_pack, (Multiplier, Bias) if requantize else None)
+        Conv = Out.op.input_tensors[0] if requantize else Out
+        s = tvm.create_schedule(Out.op)
+        data_pad = Conv.op.input_tensors[0]
+        data_pad = data_pad if isinstance(data_pad.op, tvm.tensor.ComputeOp) else None
+        _schedule_conv(s, wkl, A, data_pad, data_pad, W_pack, Conv, Out, Out)
+    args = [A, W_pack] + ([Multiplier, Bias] if requantize else []) + [Out]
+    print(tvm.lower(s, args, simple_mode=True))
+
+    # scales in the range calibrate.requantize_params gives, so the outputs spread over [0, data_max]
+    multiplier_np = (np.random.uniform(0.5, 1.5, size=(oc_chunk, sch.oc_bn)) * data_max / np.abs(ref).max())
+    multiplier_np = multiplier_np.astype('float32')
+    bias_np = np.random.uniform(-8, 8, size=(oc_chunk, sch.oc_bn)).astype('float32')
+    out = tvm.nd.array(np.zeros(get_const_tuple(Out.shape), dtype=Out.dtype), ctx)
+    inputs = [tvm.nd.array(a_vec_np, ctx), w_pack]
+    if requantize:
+        inputs += [tvm.nd.array(multiplier_np, ctx), tvm.nd.array(bias_np, ctx)]
+    func = tvm.build(s, args, device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(*(inputs + [out])).mean
+    oh = (in_size + 2 * padding - kernel) // stride + 1
+    gops = 2.0 * in_channel * num_filter * kernel * kernel * oh * oh / cost / 1e9
+    print('conv int8: %g ms/op, %.2f GOPS' % (cost * 1000.0, gops))
+
+    out = out.asnumpy()
+    n, C, h, w, c = out.shape
+    out = out.transpose(0, 1, 4, 2, 3).reshape(n, C * c, h, w)
+    if not requantize:
+        np.testing.assert_array_equal(out, ref)
+        return
+    multiplier_np = multiplier_np.reshape(1, -1, 1, 1)
+    bias_np = bias_np.reshape(1, -1, 1, 1)
+    ref = np.clip(np.floor(ref.astype('float32') * multiplier_np + bias_np + 0.5), 0, data_max)
+    # a fused multiply-add may round a .5 tie the other way
+    np.testing.assert_allclose(out.astype('float32'), ref, atol=1)
+    assert out.max() <= data_max
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_conv_int8.py
+    verify_conv2d_int8(128, 64, 64, 3, 1, 1)
+    verify_conv2d_int8(32, 256, 256, 3, 1, 1)
+    verify_conv2d_int8(32, 1024, 256, 1, 1, 0)
+    # fused requantize epilogue, uint8 out for the next layer
+    verify_conv2d_int8(128, 64, 64, 3, 1, 1, requantize=True)
+    verify_conv2d_int8(32, 1024, 256, 1, 1, 0, requantize=True)
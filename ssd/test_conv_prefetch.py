@@ -0,0 +1,88 @@
+import numpy as np
+import tvm
+import topi
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_conv, _SCH_TO_DECL_FUNC, _SCH_TO_SCH_FUNC
+from schedule_pack.avx512_conv_1x1 import AVX512Conv1x1Fwd
+from schedule_pack.workload import Workload
+from ref_conv import ref_data, nchw_to_nchwc, oihw_to_packed, oihw_to_packed_1x1
+
+device = 'llvm -mcpu=skylake-avx512'
+num_pass = 200
+
+
+def verify_conv2d_options(in_size, in_channel, num_filter, kernel, stride, padding, fuse_relu=False, **sch_fields):
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride)
+    sch = _get_schedule_conv(wkl)._replace(**sch_fields)
+    ic_bn, oc_bn = sch.ic_bn, sch.oc_bn
+
+    ctx = tvm.context(device, 0)
+    # every candidate of a search checks against the same cached reference
+    a_np, w_np, ref = ref_data((1, in_channel, in_size, in_size), (num_filter, in_channel, kernel, kernel),
+                               stride, padding)
+
+    a_vec_np = nchw_to_nchwc(a_np, ic_bn)
+    # the 1x1 schedules keep the kernel extent last
+    to_packed = oihw_to_packed_1x1 if isinstance(sch, AVX512Conv1x1Fwd) else oihw_to_packed
+    w_vec_np = to_packed(w_np, ic_bn, oc_bn)
+
+    A = tvm.placeholder(a_vec_np.shape, name='A')
+    W = tvm.placeholder(w_vec_np.shape, name='W')
+    with tvm.target.create(device):
+        Conv = _SCH_TO_DECL_FUNC[type(sch)](wkl, A, W)
+        # an elementwise op fused into the conv makes it the output stage
+        Out = topi.nn.relu(Conv) if fuse_relu else Conv
+        s = tvm.create_schedule(Out.op)
+        data_vec = Conv.op.input_tensors[0]
+        data_pad = data_vec.op.input_tensors[0] if data_vec.op.input_tensors else None
+        _SCH_TO_SCH_FUNC[type(sch)](s, wkl, A, data_pad, data_vec, W, Conv, Out, Out, sch=sch)
+
+    conv = tvm.nd.array(np.zeros(get_const_tuple(Out.shape), dtype='float32'), ctx)
+    func = tvm.build(s, [A, W, Out], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_vec_np, ctx), tvm.nd.array(w_vec_np, ctx), conv).mean
+    print('%s: %g ms/op' % (', '.join('%s=%s' % kv for kv in sorted(sch_fields.items())), cost * 1000.0))
+
+    out = conv.asnumpy()
+    n, C, h, w, c = out.shape
+    out = out.transpose(0, 1, 4, 2, 3).reshape(n, C * c, h, w)
+    np.testing.assert_allclose(out, np.maximum(ref, 0) if fuse_relu else ref, rtol=1e-4)
+    return cost
+
+
+def pick_prefetch(*args):
+    """prefetch value for the workload's _SCHEDULES entry, 0 when no distance beats the hardware prefetcher"""
+    distances = [0, 1, 2, 4]
+    costs = [verify_conv2d_options(*args, prefetch=d) for d in distances]
+    best = distances[costs.index(min(costs))]
+    print('conv %s: prefetch=%d' % (str(args), best))
+    return best
+
+
+def pick_nt_store(*args, **kwargs):
+    """nt_store value for the workload's _SCHEDULES entry, only outputs above NT_STORE_MIN_BYTES are affected"""
+    nt_store = verify_conv2d_options(*args, nt_store=True, **kwargs) < \
+        verify_conv2d_options(*args, nt_store=False, **kwargs)
+    print('conv %s: nt_store=%s' % (str(args), nt_store))
+    return nt_store
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_conv_prefetch.py
+    # SSD Resnet50 1x1 layers, low arithmetic intensity
+    pick_prefetch(128, 64, 64, 1, 1, 0)
+    pick_prefetch(128, 256, 64, 1, 1, 0)
+    pick_prefetch(64, 512, 128, 1, 1, 0)
+    pick_prefetch(32, 1024, 256, 1, 1, 0)
+    pick_prefetch(16, 2048, 512, 1, 1, 0)
+    # 3x3
+    pick_prefetch(64, 128, 128, 3, 1, 1)
+    # large write-once outputs (make -C ../c_intrin first)
+    pick_nt_store(128, 64, 256, 1, 1, 0)
+    pick_nt_store(128, 64, 64, 3, 1, 1)
+    pick_nt_store(64, 128, 512, 1, 1, 0)
+    # stored from the fused elementwise stage
+    pick_nt_store(128, 64, 256, 1, 1, 0, fuse_relu=True)
+    pick_nt_store(128, 64, 64, 3, 1, 1, fuse_relu=True)
@@ -0,0 +1,89 @@
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_conv, _pick_tile_pack
+from schedule_pack import avx512_conv_common
+from schedule_pack.avx512_conv_common import _l2_tile_candidates
+from schedule_pack.workload import Workload
+from ref_conv import ref_data
+
+device = 'llvm -mcpu=skylake-avx512'
+num_pass = 200
+
+
+def verify_conv2d_tile_pack(in_size, in_channel, num_filter, kernel, stride, padding, **sch_fields):
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride)
+    sch = _get_schedule_conv(wkl)._replace(**sch_fields)
+    ic_bn, oc_bn = sch.ic_bn, sch.oc_bn
+
+    ctx = tvm.context(device, 0)
+    # every candidate of a search checks against the same cached reference
+    a_np, w_np, ref = ref_data((1, in_channel, in_size, in_size), (num_filter, in_channel, kernel, kernel),
+                               stride, padding)
+
+    # NCHW input for the stem (ic_bn=3), NCHW[ic_bn]c otherwise
+    if sch.layout_in == 'NCHW':
+        a_vec_np = a_np
+    else:
+        a_vec_np = a_np.reshape(1, in_channel // ic_bn, ic_bn, in_size, in_size).transpose(0, 1, 3, 4, 2)
+    w_vec_np = w_np.reshape(num_filter // oc_bn, oc_bn, in_channel // ic_bn, ic_bn, kernel, kernel) \
+                   .transpose(0, 2, 4, 5, 3, 1)
+
+    A = tvm.placeholder(a_vec_np.shape, name='A')
+    W = tvm.placeholder(w_vec_np.shape, name='W')
+    with tvm.target.create(device):
+        Conv = avx512_conv_common._declaration_conv(wkl, A, W)
+        s = tvm.create_schedule(Conv.op)
+        data_vec = Conv.op.input_tensors[0]
+        data_pad = data_vec.op.input_tensors[0] if data_vec.op.input_tensors else None
+        avx512_conv_common._schedule_conv(s, wkl, A, data_pad, data_vec, W, Conv, Conv, Conv, sch=sch)
+
+    conv = tvm.nd.array(np.zeros(get_const_tuple(Conv.shape), dtype='float32'), ctx)
+    func = tvm.build(s, [A, W, Conv], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_vec_np, ctx), tvm.nd.array(w_vec_np, ctx), conv).mean
+    print('%s: %g ms/op' % (', '.join('%s=%s' % kv for kv in sorted(sch_fields.items())), cost * 1000.0))
+
+    out = conv.asnumpy()
+    n, C, h, w, c = out.shape
+    out = out.transpose(0, 1, 4, 2, 3).reshape(n, C * c, h, w)
+    np.testing.assert_allclose(out, ref, rtol=1e-4)
+    return cost
+
+
+def pick_pack_strategy(*args):
+    """tile_pack value for the workload's _SCHEDULES entry, by measurement. Entries that leave it unset get
+    the pick of _pick_tile_pack, printed next to the measured one."""
+    in_size, in_channel, num_filter, kernel, stride, padding = args
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride)
+    tile_pack = verify_conv2d_tile_pack(*args, tile_pack=True) < verify_conv2d_tile_pack(*args, tile_pack=False)
+    print('conv %s: tile_pack=%s (rule: %s)' % (str(args), tile_pack, _pick_tile_pack(wkl)))
+    return tile_pack
+
+
+def search_l2_tiles(*args, **kwargs):
+    """(oh_tile, ow_tile, ic_tile) of the workload's _SCHEDULES entry, the fastest of the tiles fitting L2"""
+    in_size, in_channel, num_filter, kernel, stride, padding = args
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride)
+    candidates = _l2_tile_candidates(wkl, _get_schedule_conv(wkl))[:kwargs.get('max_trials', 16)]
+    costs = [verify_conv2d_tile_pack(*args, oh_tile=oh_tile, ow_tile=ow_tile, ic_tile=ic_tile)
+             for oh_tile, ow_tile, ic_tile in candidates]
+    best = candidates[costs.index(min(costs))]
+    print('conv %s: oh_tile=%d, ow_tile=%d, ic_tile=%d' % ((str(args), ) + best))
+    return best
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_conv_tile_pack.py
+    # SSD-512 large-spatial layers
+    pick_pack_strategy(512, 3, 64, 7, 2, 3)
+    pick_pack_strategy(128, 64, 64, 3, 1, 1)
+    pick_pack_strategy(128, 128, 128, 3, 2, 1)
+    pick_pack_strategy(64, 128, 128, 3, 1, 1)
+    # SSD-512 256x256 (stem output) / 128x128 layers, L2 blocking
+    search_l2_tiles(512, 3, 64, 7, 2, 3)
+    search_l2_tiles(128, 64, 64, 3, 1, 1)
@@ -0,0 +1,70 @@
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_conv, _SCH_TO_DECL_FUNC, _SCH_TO_SCH_FUNC
+from schedule_pack.avx512_conv_1x1 import AVX512Conv1x1Fwd
+from schedule_pack.workload import Workload
+from schedule_pack.weight_precision import round_weight_np, compress_weight_np, pair_weight_np
+from ref_conv import ref_data, conv2d_nchw, nchw_to_nchwc, nchwc_to_nchw, oihw_to_packed, oihw_to_packed_1x1
+
+device = 'llvm -mcpu=skylake-avx512'
+num_pass = 200
+
+
+def verify_conv2d_weight_dtype(in_size, in_channel, num_filter, kernel, stride, padding, weight_dtype,
+                               graph=False):
+    """graph: the kernel as a graph build stores it, pairwise in float32 words (1x1 convs only)"""
+    wkl = Workload('float32', 'float32', in_size, in_size, in_channel, num_filter,
+                   kernel, kernel, padding, padding, stride, stride)
+    sch = _get_schedule_conv(wkl)._replace(weight_dtype=weight_dtype)
+    print(wkl, sch)
+
+    ctx = tvm.context(device, 0)
+    a_np, w_np, ref_fp32 = ref_data((1, in_channel, in_size, in_size), (num_filter, in_channel, kernel, kernel),
+                                    stride, padding)
+    # the values the reduced-precision kernel computes with
+    ref = conv2d_nchw(a_np, round_weight_np(w_np, weight_dtype), stride, padding)
+
+    pack = oihw_to_packed_1x1 if isinstance(sch, AVX512Conv1x1Fwd) else oihw_to_packed
+    if graph:
+        # paired, then packed, as precompute does
+        w_vec_np = pack(pair_weight_np(w_np, weight_dtype, sch.ic_bn), sch.ic_bn, sch.oc_bn)
+    else:
+        # offline: packed, then narrowed to the storage dtype
+        w_vec_np = compress_weight_np(pack(w_np, sch.ic_bn, sch.oc_bn), weight_dtype)
+    a_vec_np = nchw_to_nchwc(a_np, sch.ic_bn)
+
+    A = tvm.placeholder(a_vec_np.shape, name='A')
+    W = tvm.placeholder(w_vec_np.shape, dtype=w_vec_np.dtype.name, name='W')
+    with tvm.target.create(device):
+        Conv = _SCH_TO_DECL_FUNC[type(sch)](wkl, A, W, sch=sch)
+        s = tvm.create_schedule(Conv.op)
+        data_vec = Conv.op.input_tensors[0]
+        data_pad = data_vec.op.input_tensors[0] if data_vec.op.input_tensors else None
+        _SCH_TO_SCH_FUNC[type(sch)](s, wkl, A, data_pad, data_vec, W, Conv, Conv, Conv, sch=sch)
+
+    conv = tvm.nd.array(np.zeros(get_const_tuple(Conv.shape), dtype='float32'), ctx)
+    func = tvm.build(s, [A, W, Conv], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(np.ascontiguousarray(a_vec_np), ctx),
+                  tvm.nd.array(np.ascontiguousarray(w_vec_np), ctx), conv).mean
+    kernel_bytes = w_vec_np.nbytes // 2 if graph and weight_dtype != 'float32' else w_vec_np.nbytes
+    print('weight_dtype=%s%s: %g ms/op, kernel %d KB read' % (weight_dtype, ' (graph)' if graph else '',
+                                                             cost * 1000.0, kernel_bytes >> 10))
+
+    out = nchwc_to_nchw(conv.asnumpy())
+    np.testing.assert_allclose(out, ref, rtol=1e-4)
+    # accuracy impact of the reduced-precision kernel
+    np.testing.assert_allclose(out, ref_fp32, rtol=1e-2)
+    return cost
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_conv_weight_precision.py
+    # weight-heavy SSD Resnet50 layers, 3x3 and 1x1
+    for weight_dtype in ('float32', 'float16', 'bfloat16'):
+        verify_conv2d_weight_dtype(16, 512, 512, 3, 1, 1, weight_dtype)
+        verify_conv2d_weight_dtype(16, 2048, 512, 1, 1, 0, weight_dtype)
+    for weight_dtype in ('float16', 'bfloat16'):
+        verify_conv2d_weight_dtype(16, 2048, 512, 1, 1, 0, weight_dtype, graph=True)
@@ -0,0 +1,89 @@
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_dense
+from schedule_pack.avx512_dense import DenseWorkload
+from schedule_pack.avx512_dense import _declaration_dense_pack, _declaration_dense, _declaration_dense_softmax
+from schedule_pack.avx512_dense import _schedule_dense_pack, _schedule_dense, _schedule_dense_softmax
+from schedule_pack.weight_precision import storage_dtype, round_weight_np
+
+device = 'llvm -mcpu=skylake-avx512'
+dtype = 'float32'
+num_pass = 1000
+
+
+def verify_dense(batch, in_dim, out_dim, with_softmax=False, weight_dtype='float32', graph_packed=False):
+    ctx = tvm.context(device, 0)
+    A = tvm.placeholder((batch, in_dim), name='A')
+    W = tvm.placeholder((out_dim, in_dim), name='W')
+    B = tvm.placeholder((out_dim, ), name='B')
+
+    wkl = DenseWorkload(dtype, dtype, batch, in_dim, out_dim)
+    sch = _get_schedule_dense(wkl)._replace(weight_dtype=weight_dtype)
+    print(wkl, sch)
+
+    a_np = np.random.uniform(size=(batch, in_dim)).astype(dtype)
+    w_np = np.random.uniform(size=(out_dim, in_dim)).astype(dtype)
+    b_np = np.random.uniform(size=(out_dim, )).astype(dtype)
+
+    def reference(w):
+        out_np = np.dot(a_np, w.T) + b_np
+        if with_softmax:
+            e = np.exp(out_np - np.max(out_np, axis=1, keepdims=True))
+            out_np = e / np.sum(e, axis=1, keepdims=True)
+        return out_np
+    out_np = reference(round_weight_np(w_np, weight_dtype))
+    out_fp32_np = reference(w_np)
+
+    if graph_packed:
+        # packed as alter_dense_layout does it in the graph, an (out_dim, in_dim) view of the blocks
+        w_pack = w_np.reshape(out_dim // sch.oc_bn, sch.oc_bn, in_dim).transpose(0, 2, 1).reshape(out_dim, in_dim)
+        w_pack = tvm.nd.array(np.ascontiguousarray(w_pack), ctx)
+    else:
+        # offline: pack the weight once
+        W_pack = _declaration_dense_pack(sch, W)
+        s = tvm.create_schedule(W_pack.op)
+        _schedule_dense_pack(s, sch, W_pack)
+        w_pack = tvm.nd.array(np.zeros(get_const_tuple(W_pack.shape), dtype=W_pack.dtype), ctx)
+        func = tvm.build(s, [W, W_pack], device)
+        func(tvm.nd.array(w_np, ctx), w_pack)
+
+    # online: dense on the packed weight
+    W_pack = tvm.placeholder(w_pack.shape, dtype=storage_dtype(weight_dtype), name='W_pack')
+    if with_softmax:
+        Out = _declaration_dense_softmax(sch, A, W_pack, B, out_dim, dtype)
+        dense_bias = [t for t in Out.op.input_tensors if t.op.name == 'dense_bias'][0]
+        s = tvm.create_schedule(Out.op)
+        _schedule_dense_softmax(s, sch, A, W_pack, dense_bias.op.input_tensors[0], dense_bias, Out)
+    else:
+        Out = _declaration_dense(sch, A, W_pack, B, out_dim, dtype)
+        s = tvm.create_schedule(Out.op)
+        _schedule_dense(s, sch, A, W_pack, Out.op.input_tensors[0], Out, Out)
+    print(tvm.lower(s, [A, W_pack, B, Out], simple_mode=True))
+
+    out = tvm.nd.array(np.zeros(get_const_tuple(Out.shape), dtype=dtype), ctx)
+    func = tvm.build(s, [A, W_pack, B, Out], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_np, ctx), w_pack, tvm.nd.array(b_np, ctx), out).mean
+    gflops = 2.0 * batch * in_dim * out_dim / cost / 1e9
+    weight_bytes = np.dtype(storage_dtype(weight_dtype)).itemsize
+    gbps = (4.0 * (batch * in_dim + batch * out_dim) + weight_bytes * in_dim * out_dim) / cost / 1e9
+    print('dense: %g ms/op, %.2f GFLOPS, %.2f GB/s' % (cost * 1000.0, gflops, gbps))
+
+    np.testing.assert_allclose(out.asnumpy(), out_np, rtol=1e-4)
+    # accuracy impact of the reduced-precision weight, random inputs give large sums so check relatively
+    np.testing.assert_allclose(out.asnumpy(), out_fp32_np, rtol=1e-2)
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_dense.py
+    verify_dense(1, 2048, 1000)
+    verify_dense(16, 2048, 1000)
+    verify_dense(1, 2048, 1000, with_softmax=True)
+    verify_dense(1, 2048, 20, with_softmax=True, graph_packed=True)
+    verify_dense(1, 4096, 4096, graph_packed=True)
+    verify_dense(1, 25088, 4096)
+    verify_dense(1, 4096, 4096)
+    verify_dense(1, 4096, 4096, weight_dtype='float16')
+    verify_dense(1, 4096, 4096, weight_dtype='bfloat16')
@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import numpy as np
+import tvm
+from topi.util import get_const_tuple
+
+from schedule_pack.avx512_conv_fwd import _get_schedule_gemm
+from schedule_pack.gemm import GemmWorkload
+from schedule_pack.gemm import _declaration_gemm_pack_a, _declaration_gemm_pack_b, _declaration_gemm
+from schedule_pack.gemm import _declaration_conv_im2col, _schedule_gemm
+from schedule_pack.gemm import BatchGemmWorkload, _default_batch_gemm_schedule
+from schedule_pack.gemm import _declaration_batch_gemm, _schedule_batch_gemm
+from ref_conv import conv2d_nchw
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench.roofline import load_roofline, roofline_fraction
+
+device = 'llvm -mcpu=skylake-avx512'
+dtype = 'float32'
+num_pass = 100
+# slowest allowed GEMM as a fraction of numpy.dot GFLOPS, 0 only reports the ratio
+min_numpy_ratio = float(os.environ.get('TOPI_GEMM_MIN_RATIO', '0.85'))
+
+
+def numpy_cost(func, *args):
+    func(*args)
+    start = time.time()
+    for _ in range(num_pass):
+        func(*args)
+    return (time.time() - start) / num_pass
+
+
+def check_numpy_ratio(name, cost, cost_np):
+    assert cost_np / cost >= min_numpy_ratio, '%s at %.0f%% of numpy.dot, below the %.0f%% target' % \
+        (name, 100.0 * cost_np / cost, 100.0 * min_numpy_ratio)
+
+
+def pack_offline(declaration, x_np, ctx):
+    """Packed copy of a constant operand, packed once like precompute does for a graph's weights"""
+    X = tvm.placeholder(x_np.shape, name='X')
+    X_pack = declaration(X)
+    s = tvm.create_schedule(X_pack.op)
+    s[X_pack].parallel(s[X_pack].op.axis[0])
+    x_pack = tvm.nd.array(np.zeros(get_const_tuple(X_pack.shape), dtype=X_pack.dtype), ctx)
+    tvm.build(s, [X, X_pack], device)(tvm.nd.array(np.ascontiguousarray(x_np), ctx), x_pack)
+    return x_pack
+
+
+def verify_gemm(M, N, K, graph_packed=False):
+    ctx = tvm.context(device, 0)
+    wkl = GemmWorkload(dtype, dtype, M, N, K)
+    sch = _get_schedule_gemm(wkl)
+    print(wkl, sch)
+
+    a_np = np.random.uniform(size=(M, K)).astype(dtype)
+    b_np = np.random.uniform(size=(K, N)).astype(dtype)
+
+    if graph_packed:
+        # B as the dense weight (N, K) alter_dense_layout pre-packs, an (N, K) view of the (N / nr, K, nr) blocks
+        b_pack = b_np.T.reshape(N // sch.nr, sch.nr, K).transpose(0, 2, 1).reshape(N, K)
+        b_pack = tvm.nd.array(np.ascontiguousarray(b_pack), ctx)
+    else:
+        # B is the constant operand: packed once, A is packed inside the kernel
+        b_pack = pack_offline(lambda B: _declaration_gemm_pack_b(sch, B), b_np, ctx)
+
+    A = tvm.placeholder((M, K), name='A')
+    B_pack = tvm.placeholder(b_pack.shape, name='B_pack')
+    A_pack = _declaration_gemm_pack_a(sch, A)
+    C = _declaration_gemm(sch, A_pack, B_pack, M, N, dtype)
+    s = tvm.create_schedule(C.op)
+    _schedule_gemm(s, sch, A_pack, B_pack, C.op.input_tensors[0], C, C)
+    print(tvm.lower(s, [A, B_pack, C], simple_mode=True))
+
+    c = tvm.nd.array(np.zeros((M, N), dtype=dtype), ctx)
+    func = tvm.build(s, [A, B_pack, C], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_np, ctx), b_pack, c).mean
+    cost_np = numpy_cost(np.dot, a_np, b_np)
+    gflops = 2.0 * M * N * K / 1e9
+    print('gemm %dx%dx%d: %g ms/op, %.2f GFLOPS, numpy.dot %.2f GFLOPS (%.0f%%)' %
+          (M, N, K, cost * 1000.0, gflops / cost, gflops / cost_np, 100.0 * cost_np / cost))
+    roofline = load_roofline()
+    if roofline:
+        # A, the packed B and C each moved once
+        nbytes = 4 * (M * K + K * N + M * N)
+        print('    %.0f%% of the roofline bound (python -m bench.roofline measures it)' %
+              (100.0 * roofline_fraction(roofline, 2.0 * M * N * K, nbytes, cost)))
+
+    np.testing.assert_allclose(c.asnumpy(), np.dot(a_np, b_np), rtol=1e-4)
+    check_numpy_ratio('gemm %dx%dx%d' % (M, N, K), cost, cost_np)
+
+
+def verify_conv_im2col(in_size, in_channel, num_filter, kernel, stride, padding, dilation=1):
+    ctx = tvm.context(device, 0)
+    out_size = (in_size + 2 * padding - (kernel - 1) * dilation - 1) // stride + 1
+    wkl = GemmWorkload(dtype, dtype, num_filter, out_size * out_size, in_channel * kernel * kernel)
+    sch = _get_schedule_gemm(wkl)
+    print(wkl, sch)
+
+    a_np = np.random.uniform(size=(1, in_channel, in_size, in_size)).astype(dtype)
+    w_np = np.random.uniform(size=(num_filter, in_channel, kernel, kernel)).astype(dtype)
+    ref = conv2d_nchw(a_np, w_np, stride, padding, dilation)
+
+    # the kernel is the constant A operand
+    w_pack = pack_offline(lambda W: _declaration_gemm_pack_a(sch, W), w_np.reshape(num_filter, -1), ctx)
+
+    A = tvm.placeholder(a_np.shape, name='A')
+    W_pack = tvm.placeholder(w_pack.shape, name='W_pack')
+    Conv = _declaration_conv_im2col(sch, A, W_pack, num_filter, (kernel, kernel), (stride, stride),
+                                    (padding, padding), dtype, (dilation, dilation))
+    s = tvm.create_schedule(Conv.op)
+    C_pad = Conv.op.input_tensors[0]
+    _schedule_gemm(s, sch, W_pack, C_pad.op.input_tensors[1], C_pad, Conv, Conv)
+
+    conv = tvm.nd.array(np.zeros(get_const_tuple(Conv.shape), dtype=dtype), ctx)
+    func = tvm.build(s, [A, W_pack, Conv], device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(tvm.nd.array(a_np, ctx), w_pack, conv).mean
+    # numpy.dot of the same GEMM, on columns it does not have to build
+    cost_np = numpy_cost(np.dot, w_np.reshape(num_filter, -1),
+                         np.random.uniform(size=(wkl.K, wkl.N)).astype(dtype))
+    gflops = 2.0 * wkl.M * wkl.N * wkl.K / 1e9
+    print('conv im2col: %g ms/op, %.2f GFLOPS, numpy.dot %.2f GFLOPS (%.0f%%)' %
+          (cost * 1000.0, gflops / cost, gflops / cost_np, 100.0 * cost_np / cost))
+
+    np.testing.assert_allclose(conv.asnumpy(), ref, rtol=1e-4)
+    check_numpy_ratio('conv im2col', cost, cost_np)
+
+
+def verify_batch_gemm(shapes):
+    ctx = tvm.context(device, 0)
+    wkl = BatchGemmWorkload(dtype, dtype, tuple(shapes))
+    sch = _default_batch_gemm_schedule(wkl)
+    print(wkl, sch)
+
+    a_np = [np.random.uniform(size=(M, K)).astype(dtype) for M, N, K in shapes]
+    b_np = [np.random.uniform(size=(K, N)).astype(dtype) for M, N, K in shapes]
+
+    if len(set(shapes)) == 1:
+        # one shape: (batch, M, K) x (batch, K, N) tensors
+        M, N, K = shapes[0]
+        A = [tvm.placeholder((len(shapes), M, K), name='A')]
+        B = [tvm.placeholder((len(shapes), K, N), name='B')]
+        C = _declaration_batch_gemm(sch, A[0], B[0], dtype)
+        s = tvm.create_schedule(C.op)
+        C_pad = C.op.input_tensors[0]
+        A_pack, B_pack = C_pad.op.input_tensors
+        _schedule_batch_gemm(s, sch, A_pack, B_pack, C_pad, C, C)
+        C = [C]
+        a_np, b_np = [np.stack(a_np)], [np.stack(b_np)]
+    else:
+        A = [tvm.placeholder((M, K), name='A%d' % i) for i, (M, N, K) in enumerate(shapes)]
+        B = [tvm.placeholder((K, N), name='B%d' % i) for i, (M, N, K) in enumerate(shapes)]
+        # one extern op computes every problem
+        C = _declaration_batch_gemm(sch, A, B, dtype)
+        s = tvm.create_schedule(C[0].op)
+    print(tvm.lower(s, A + B + C, simple_mode=True))
+
+    args = [tvm.nd.array(x, ctx) for x in a_np + b_np]
+    c = [tvm.nd.array(np.zeros(get_const_tuple(t.shape), dtype=dtype), ctx) for t in C]
+    func = tvm.build(s, A + B + C, device)
+    time_f = func.time_evaluator(func.entry_name, ctx, number=num_pass)
+    cost = time_f(*(args + c)).mean
+    cost_np = numpy_cost(lambda: [np.matmul(a, b) for a, b in zip(a_np, b_np)])
+    print('batch gemm x%d: %g ms/op, numpy loop %g ms' % (len(shapes), cost * 1000.0, cost_np * 1000.0))
+
+    for out, a, b in zip(c, a_np, b_np):
+        np.testing.assert_allclose(out.asnumpy(), np.matmul(a, b), rtol=1e-4)
+
+
+if __name__ == "__main__":
+    # KMP_AFFINITY=granularity=fine,compact,1,0 TVM_NUM_THREADS=16 OMP_NUM_THREADS=16 python test_gemm.py
+    verify_gemm(1024, 1024, 1024)
+    verify_gemm(16, 1000, 2048)
+    # resnet50 head at batch 16 as built from the graph
+    verify_gemm(16, 1000, 2048, graph_packed=True)
+    # remainders in every dimension
+    verify_gemm(1000, 999, 517)
+    verify_gemm(37, 3136, 576)
+    verify_conv_im2col(56, 64, 64, 3, 1, 1)
+    verify_conv_im2col(28, 256, 512, 1, 1, 0)
+    # SSD-512 fc6, 3x3 with dilation 6
+    verify_conv_im2col(32, 512, 1024, 3, 1, 6, dilation=6)
+    # SSD-512 loc / cls heads on the 4x4, 2x2 and 1x1 maps: (H*W, anchors * 4 or 21, 256*3*3)
+    verify_batch_gemm([(16, 16, 2304), (16, 84, 2304), (4, 16, 2304), (4, 84, 2304), (1, 16, 2304), (1, 84, 2304)])
+    # Winograd F(4x4, 3x3) tile products of a 64 -> 64 conv on 28x28
+    verify_batch_gemm([(64, 49, 64)] * 36)
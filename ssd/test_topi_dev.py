@@ -1,6 +1,9 @@
 import mxnet as mx
 import numpy as np
+import os
+import sys
 import time
+import json
 from collections import namedtuple
 import nnvm.testing
 import tvm
@@ -8,10 +11,18 @@ from tvm.contrib import graph_runtime
 
 from symbol.symbol_factory import get_symbol
 from schedule_pack.avx512_conv_fwd import *
+from schedule_pack.weight_precision import round_params
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench.latency import latency_stats, format_stats, record, warmup, write_hgrm
+from bench.memory_plan import report_memory_plan
 
 Batch = namedtuple('Batch', ['data'])
 num_pass = 500
-def end2end_benchmark(body_network, target, batch_size):
+# HdrHistogram .hgrm of the latencies, written only when a path is given
+HGRM_PATH = os.environ.get('TOPI_HGRM')
+# graph.json goes here, numa_launch.py gives every instance its own
+OUT_DIR = os.environ.get('TOPI_OUT_DIR', '.')
+def end2end_benchmark(body_network, target, batch_size, weight_dtype='float32'):
     image_shape = (3, 512, 512)
     data_shape = (batch_size,) + image_shape
     data_array = np.random.uniform(0, 255, size=data_shape).astype("float32")
@@ -42,26 +53,26 @@ def end2end_benchmark(body_network, target, batch_size):
     opt_level = 3
     with nnvm.compiler.build_config(opt_level=opt_level):
         graph, lib, params = nnvm.compiler.build(net, target, shape={"data": data_shape}, params=params)
-    with open('graph.json', 'w') as fn:
+    with open(os.path.join(OUT_DIR, 'graph.json'), 'w') as fn:
         fn.writelines(graph.json())
+    report_memory_plan(json.loads(graph.json()))
 
     module = graph_runtime.create(graph, lib, ctx)
+    if weight_dtype != 'float32':
+        # accuracy of every kernel at weight_dtype, checked against MXNet below. Only the 1x1 convs whose
+        # schedule sets weight_dtype store theirs at half width (see schedule_pack/weight_precision.py)
+        params = round_params(params, weight_dtype)
     module.set_input(**params)
 
     input_data = tvm.nd.array(data_array, ctx=ctx)
     module.set_input('data', input_data)
 
-    # warm up
-    for i in range(100):
-        module.run()
-
-    times = []
-    s = time.time()
-    for i in range(num_pass):
-        module.run()
-    tvm_time = time.time() - s
-    # times.append(tvm_time)
-    print("TVM %s inference time for batch size of %d: %f" % (body_network, batch_size, tvm_time * 1000.0 / num_pass))
+    warmup(module.run)
+    stats = latency_stats(record(module.run, num_pass))
+    print("TVM %s inference time for batch size of %d: %f" % (body_network, batch_size, stats['mean']))
+    print("TVM %s latency: %s" % (body_network, format_stats(stats)))
+    if HGRM_PATH:
+        write_hgrm(stats['latency_ms'], HGRM_PATH)
 
     for i in range(len(mod.get_outputs())):
         print('Check %dth output ...' % i)
@@ -78,3 +89,4 @@ if __name__ == "__main__":
     # target = "llvm -mcpu=core-avx2"
     target = 'llvm -mcpu=skylake-avx512'
     end2end_benchmark('resnet50', target, batch_size)
+    # end2end_benchmark('resnet50', target, batch_size, weight_dtype='bfloat16')